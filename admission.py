@@ -0,0 +1,348 @@
+# admission.py - bounded upstream concurrency, a short wait queue and per-session token buckets
+import os
+import time
+import uuid
+import asyncio
+import threading
+from collections import OrderedDict, deque
+
+# --------------------------------------------------
+# Configuration
+# --------------------------------------------------
+
+# 'shared' (local_store file: one limit across every worker on the host),
+# 'memory' (per worker; only useful with threaded workers) or 'off'
+ADMISSION_BACKEND = os.getenv("ADMISSION_BACKEND", "shared")
+
+# Upstream calls allowed at once across the host: set it to what the Cohere
+# plan sustains. It is not derived from the web workers: a sync worker holds
+# at most one call per thread anyway, so a cap above the request slots only
+# means nothing is shed while upstream has room.
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "16"))
+# Sync workers hold a thread while queued, so the queue stays short enough to leave threads free
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", str(max(1, ADMISSION_MAX_CONCURRENT // 2))))
+# Longest a turn waits for a slot before it gets the fallback. A slot frees
+# every (upstream call time / ADMISSION_MAX_CONCURRENT) seconds on average,
+# so this covers about one multi-second call: a full queue of
+# ADMISSION_QUEUE_SIZE drains within it at the default sizes
+# The ASGI chat path (asgi.py) awaits upstream without holding a thread, so
+# its cap and queue are set separately from the sync workers' and usually
+# sit higher; neither is derived from WEB_CONCURRENCY
+ADMISSION_ASYNC_MAX_CONCURRENT = int(os.getenv("ADMISSION_ASYNC_MAX_CONCURRENT", "64"))
+ADMISSION_ASYNC_QUEUE_SIZE = int(os.getenv("ADMISSION_ASYNC_QUEUE_SIZE", str(ADMISSION_ASYNC_MAX_CONCURRENT)))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT_MS", "3000")) / 1000.0
+ADMISSION_POLL = float(os.getenv("ADMISSION_POLL_MS", "10")) / 1000.0
+# A crashed worker's slot frees itself after this long (longer than any chat turn or stream)
+ADMISSION_LEASE_TTL = float(os.getenv("ADMISSION_LEASE_TTL", "120"))
+
+# Per-session token bucket: sustained turns per second and burst size
+SESSION_RATE = float(os.getenv("ADMISSION_SESSION_RATE", "0.2"))
+SESSION_BURST = float(os.getenv("ADMISSION_SESSION_BURST", "5"))
+SESSION_BUCKETS_MAX = 10000
+
+_backend = None
+_backend_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"admitted": 0, "queued": 0, "shed_queue_full": 0, "shed_wait_budget": 0, "shed_timeout": 0,
+          "shed_rate": 0, "total_wait_ms": 0.0, "max_wait_ms": 0.0}
+# Observed slot hold time, used to predict queue waits; None until the first
+# release, and queued turns are not shed on a prediction before then
+_hold_ewma = None
+
+
+class MemoryBackend:
+    """Slots, waiters and buckets in this process"""
+
+    name = "memory"
+
+    def __init__(self):
+        self.holders = {}           # ticket -> lease expiry
+        self.waiters = deque()
+        self.buckets = OrderedDict()   # session_id -> (tokens, updated)
+        self.lock = threading.Lock()
+
+    def _expire(self, now):
+        for ticket in [ticket for ticket, expires in self.holders.items() if expires < now]:
+            del self.holders[ticket]
+
+    def enqueue(self, ticket, now, limit, queue_size):
+        """'admitted', ('queued', position) or 'full'"""
+        with self.lock:
+            self._expire(now)
+            if len(self.holders) < limit and not self.waiters:
+                self.holders[ticket] = now + ADMISSION_LEASE_TTL
+                return "admitted"
+            if len(self.waiters) >= queue_size:
+                return "full"
+            self.waiters.append(ticket)
+            return "queued", len(self.waiters) - 1
+
+    def poll(self, ticket, now, limit):
+        with self.lock:
+            self._expire(now)
+            free = limit - len(self.holders)
+            # First come, first served: only the head of the queue takes a free slot
+            if free > 0 and ticket in list(self.waiters)[:free]:
+                self.waiters.remove(ticket)
+                self.holders[ticket] = now + ADMISSION_LEASE_TTL
+                return True
+            return False
+
+    def cancel(self, ticket):
+        with self.lock:
+            if ticket in self.waiters:
+                self.waiters.remove(ticket)
+
+    def release(self, ticket):
+        with self.lock:
+            self.holders.pop(ticket, None)
+
+    def depth(self):
+        with self.lock:
+            self._expire(time.time())
+            return len(self.holders), len(self.waiters)
+
+    def take_token(self, session_id, now):
+        with self.lock:
+            tokens, updated = self.buckets.pop(session_id, (SESSION_BURST, now))
+            tokens = min(SESSION_BURST, tokens + (now - updated) * SESSION_RATE)
+            allowed = tokens >= 1
+            self.buckets[session_id] = (tokens - 1 if allowed else tokens, now)
+            while len(self.buckets) > SESSION_BUCKETS_MAX:
+                self.buckets.popitem(last=False)
+            return allowed
+
+
+class SharedBackend:
+    """Leases, waiters and buckets in local_store tables, so the limit spans every worker"""
+
+    name = "shared"
+
+    def __init__(self):
+        from local_store import get_store
+
+        self.store = get_store()
+        self._last_purge = 0.0
+        with self.store.transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS admission_leases ("
+                         " ticket TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS admission_waiters ("
+                         " ticket TEXT PRIMARY KEY, enqueued_at REAL NOT NULL, expires_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS admission_buckets ("
+                         " session_id TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)")
+
+    @staticmethod
+    def _expire(conn, now):
+        conn.execute("DELETE FROM admission_leases WHERE expires_at < ?", (now,))
+        # Waiters whose worker died stop blocking the queue after the wait budget
+        conn.execute("DELETE FROM admission_waiters WHERE expires_at < ?", (now,))
+
+    def enqueue(self, ticket, now, limit, queue_size):
+        with self.store.transaction() as conn:
+            self._expire(conn, now)
+            holders = conn.execute("SELECT COUNT(*) FROM admission_leases").fetchone()[0]
+            waiting = conn.execute("SELECT COUNT(*) FROM admission_waiters").fetchone()[0]
+            if holders < limit and not waiting:
+                conn.execute("INSERT INTO admission_leases (ticket, expires_at) VALUES (?, ?)",
+                             (ticket, now + ADMISSION_LEASE_TTL))
+                return "admitted"
+            if waiting >= queue_size:
+                return "full"
+            conn.execute("INSERT INTO admission_waiters (ticket, enqueued_at, expires_at) VALUES (?, ?, ?)",
+                         (ticket, now, now + ADMISSION_MAX_WAIT + 1.0))
+            return "queued", waiting
+
+    def poll(self, ticket, now, limit):
+        with self.store.transaction() as conn:
+            self._expire(conn, now)
+            free = limit - conn.execute("SELECT COUNT(*) FROM admission_leases").fetchone()[0]
+            if free <= 0:
+                return False
+            head = [row[0] for row in conn.execute(
+                "SELECT ticket FROM admission_waiters ORDER BY enqueued_at, ticket LIMIT ?", (free,))]
+            if ticket not in head:
+                return False
+            conn.execute("DELETE FROM admission_waiters WHERE ticket = ?", (ticket,))
+            conn.execute("INSERT INTO admission_leases (ticket, expires_at) VALUES (?, ?)",
+                         (ticket, now + ADMISSION_LEASE_TTL))
+            return True
+
+    def cancel(self, ticket):
+        self.store.connection().execute("DELETE FROM admission_waiters WHERE ticket = ?", (ticket,))
+
+    def release(self, ticket):
+        self.store.connection().execute("DELETE FROM admission_leases WHERE ticket = ?", (ticket,))
+
+    def depth(self):
+        now = time.time()
+        conn = self.store.connection()
+        holders = conn.execute("SELECT COUNT(*) FROM admission_leases WHERE expires_at >= ?", (now,)).fetchone()[0]
+        waiting = conn.execute("SELECT COUNT(*) FROM admission_waiters WHERE expires_at >= ?", (now,)).fetchone()[0]
+        return holders, waiting
+
+    def take_token(self, session_id, now):
+        with self.store.transaction() as conn:
+            row = conn.execute("SELECT tokens, updated_at FROM admission_buckets WHERE session_id = ?",
+                               (session_id,)).fetchone()
+            tokens, updated = row if row is not None else (SESSION_BURST, now)
+            tokens = min(SESSION_BURST, tokens + (now - updated) * SESSION_RATE)
+            allowed = tokens >= 1
+            conn.execute("INSERT OR REPLACE INTO admission_buckets (session_id, tokens, updated_at) VALUES (?, ?, ?)",
+                         (session_id, tokens - 1 if allowed else tokens, now))
+            if now - self._last_purge > 60:
+                # A bucket idle long enough to refill completely carries no state
+                self._last_purge = now
+                conn.execute("DELETE FROM admission_buckets WHERE updated_at < ?",
+                             (now - SESSION_BURST / max(SESSION_RATE, 1e-6),))
+        return allowed
+
+
+def get_backend():
+    """Return the configured backend, or None when admission control is off"""
+    global _backend
+    if ADMISSION_BACKEND == "off":
+        return None
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = SharedBackend() if ADMISSION_BACKEND == "shared" else MemoryBackend()
+    return _backend
+
+
+# --------------------------------------------------
+# Slots
+# --------------------------------------------------
+
+class Slot:
+    """
+    Outcome of one admission request. ``admitted`` is False when the turn was
+    shed (``reason``: rate, queue_full, wait_budget or timeout); use it as a
+    context manager so an admitted slot is always released.
+    """
+
+    __slots__ = ("ticket", "admitted", "reason", "acquired_at")
+
+    def __init__(self, ticket, admitted, reason=None):
+        self.ticket = ticket
+        self.admitted = admitted
+        self.reason = reason
+        self.acquired_at = time.monotonic() if admitted else None
+
+    def release(self):
+        global _hold_ewma
+        if not self.admitted or self.acquired_at is None:
+            return
+        held = time.monotonic() - self.acquired_at
+        self.acquired_at = None
+        backend = get_backend()
+        if backend is not None:
+            backend.release(self.ticket)
+        with _stats_lock:
+            _hold_ewma = held if _hold_ewma is None else 0.8 * _hold_ewma + 0.2 * held
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+def _count(key, waited=None):
+    with _stats_lock:
+        _stats[key] += 1
+        if waited is not None:
+            waited_ms = waited * 1000
+            _stats["total_wait_ms"] += waited_ms
+            _stats["max_wait_ms"] = max(_stats["max_wait_ms"], waited_ms)
+
+
+def _begin(session_id, limit, queue_size):
+    """First step shared by acquire/acquire_async: (slot or None, backend, ticket, started)"""
+    backend = get_backend()
+    ticket = uuid.uuid4().hex
+    if backend is None:
+        return Slot(ticket, True), None, ticket, None
+    now = time.time()
+    if session_id and SESSION_RATE > 0 and not backend.take_token(session_id, now):
+        _count("shed_rate")
+        return Slot(ticket, False, "rate"), None, ticket, None
+
+    outcome = backend.enqueue(ticket, now, limit, queue_size)
+    if outcome == "admitted":
+        _count("admitted", 0.0)
+        return Slot(ticket, True), None, ticket, None
+    if outcome == "full":
+        _count("shed_queue_full")
+        return Slot(ticket, False, "queue_full"), None, ticket, None
+
+    # Queued: shed now if the predicted wait is already over budget
+    position = outcome[1]
+    hold = _hold_ewma
+    if hold is not None and (position + 1) * hold / limit > ADMISSION_MAX_WAIT:
+        backend.cancel(ticket)
+        _count("shed_wait_budget")
+        return Slot(ticket, False, "wait_budget"), None, ticket, None
+    _count("queued")
+    return None, backend, ticket, time.monotonic()
+
+
+def _poll(backend, ticket, started, limit):
+    """Slot once admitted or out of time, else None"""
+    if backend.poll(ticket, time.time(), limit):
+        _count("admitted", time.monotonic() - started)
+        return Slot(ticket, True)
+    if time.monotonic() - started >= ADMISSION_MAX_WAIT:
+        backend.cancel(ticket)
+        _count("shed_timeout")
+        return Slot(ticket, False, "timeout")
+    return None
+
+
+def acquire(session_id=None):
+    """Wait (at most ADMISSION_MAX_WAIT) for an upstream slot; never raises"""
+    slot, backend, ticket, started = _begin(session_id, ADMISSION_MAX_CONCURRENT, ADMISSION_QUEUE_SIZE)
+    while slot is None:
+        time.sleep(ADMISSION_POLL)
+        slot = _poll(backend, ticket, started, ADMISSION_MAX_CONCURRENT)
+    return slot
+
+
+async def acquire_async(session_id=None):
+    """
+    acquire() for the ASGI path: waits without holding a thread, against
+    ADMISSION_ASYNC_MAX_CONCURRENT and ADMISSION_ASYNC_QUEUE_SIZE. Each
+    backend step is a short SQLite transaction that can block on the lock,
+    so it runs on a worker thread and never stalls the event loop.
+    """
+    import anyio
+
+    slot, backend, ticket, started = await anyio.to_thread.run_sync(
+        _begin, session_id, ADMISSION_ASYNC_MAX_CONCURRENT, ADMISSION_ASYNC_QUEUE_SIZE
+    )
+    while slot is None:
+        await asyncio.sleep(ADMISSION_POLL)
+        slot = await anyio.to_thread.run_sync(_poll, backend, ticket, started, ADMISSION_ASYNC_MAX_CONCURRENT)
+    return slot
+
+
+def stats():
+    backend = get_backend()
+    with _stats_lock:
+        stats = dict(_stats)
+        hold = _hold_ewma
+    waited = stats["admitted"] or 1
+    stats.update({
+        "backend": ADMISSION_BACKEND,
+        "max_concurrent": ADMISSION_MAX_CONCURRENT,
+        "queue_size": ADMISSION_QUEUE_SIZE,
+        "async_max_concurrent": ADMISSION_ASYNC_MAX_CONCURRENT,
+        "async_queue_size": ADMISSION_ASYNC_QUEUE_SIZE,
+        "max_wait_ms": round(stats["max_wait_ms"], 1),
+        "avg_wait_ms": round(stats.pop("total_wait_ms") / waited, 1),
+        "hold_ewma_ms": round(hold * 1000, 1) if hold is not None else None,
+        "shed": sum(stats[key] for key in ("shed_queue_full", "shed_wait_budget", "shed_timeout", "shed_rate")),
+    })
+    if backend is not None:
+        stats["in_flight"], stats["queue_depth"] = backend.depth()
+    return stats
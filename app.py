@@ -2,174 +2,233 @@
 
 import os
 import json
-from flask import Flask, render_template, jsonify, request, send_from_directory
+from datetime import datetime
+import click
+from flask import Flask, jsonify, request
 from flask_cors import CORS
 from dotenv import load_dotenv
 
 from extensions import db
-from routes_py import api
 
-# Load environment variables
-load_dotenv()
 
-# Create Flask app
-app = Flask(
-    __name__,
-    static_folder="static",
-    template_folder="templates"
-)
-
-CORS(app)
-
-# --------------------------------------------------
-# Configuration
-# --------------------------------------------------
-
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///elmed_wellmind.db")
-
-# Fix for Render Postgres URLs (if you add Postgres later)
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-
-app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["SECRET_KEY"] = os.getenv(
-    "FLASK_SECRET_KEY",
-    "dev-secret-key-change-me"
-)
-
-# --------------------------------------------------
-# Initialize extensions
-# --------------------------------------------------
-
-db.init_app(app)
-
-# Create tables safely (NO DROP in production)
-with app.app_context():
-    try:
+def create_app(config=None):
+    """
+    Build the Flask app. Importing this module does no I/O beyond this call;
+    schema creation is the one-shot `flask bootstrap-db` command (or
+    AUTO_CREATE_SCHEMA=1 for local development).
+    """
+    # Load environment variables before any module reads its settings
+    load_dotenv()
+
+    import assets
+    import concern_rank
+    import engine_profiles
+    import export
+    import metrics
+    import images
+    import mail_queue
+    import page_cache
+    import retention
+    import search
+    from models import ensure_indexes
+    from routes_py import api
+
+    # Create Flask app (/static is served by assets.send_static below)
+    app = Flask(
+        __name__,
+        static_folder=None,
+        template_folder="templates"
+    )
+
+    CORS(app)
+
+    # --------------------------------------------------
+    # Configuration
+    # --------------------------------------------------
+
+    DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///elmed_wellmind.db")
+
+    # Fix for Render Postgres URLs (if you add Postgres later)
+    if DATABASE_URL.startswith("postgres://"):
+        DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+
+    app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SECRET_KEY"] = os.getenv(
+        "FLASK_SECRET_KEY",
+        "dev-secret-key-change-me"
+    )
+    app.config["AUTO_CREATE_SCHEMA"] = os.getenv("AUTO_CREATE_SCHEMA", "0") in ("1", "true", "True")
+    if config:
+        app.config.update(config)
+    # WAL/pragmas for SQLite, a sized and pre-pinged pool for Postgres
+    app.config.setdefault(
+        "SQLALCHEMY_ENGINE_OPTIONS",
+        engine_profiles.engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
+    )
+
+    # --------------------------------------------------
+    # Initialize extensions
+    # --------------------------------------------------
+
+    db.init_app(app)
+    with app.app_context():
+        engine_profiles.install(db.engine)
+        # Stage/DB timing, /metrics and the optional Server-Timing header
+        metrics.init_app(app, db.engine)
+
+    def bootstrap_schema():
+        """Create missing tables and indexes (NO DROP); safe to run on every deploy"""
         db.create_all()
-        print("✅ Database tables ensured")
-    except Exception as e:
-        print(f"⚠️ Database init warning: {e}")
-
-# --------------------------------------------------
-# Register blueprints
-# --------------------------------------------------
-
-app.register_blueprint(api)
-
-# --------------------------------------------------
-# Routes
-# --------------------------------------------------
-
-@app.route("/")
-def home():
-    return render_template("index.html")
-
-
-@app.route("/chat")
-def chat_interface():
-    return render_template("chat.html")
-
-
-@app.route("/health")
-def health_check():
-    return jsonify({
-        "status": "healthy",
-        "service": "Elmed Wellmind Mental Health AI",
-        "ai_status": "active" if os.getenv("COHERE_API_KEY") else "inactive",
-        "database": "connected"
-    })
-
-# --------------------------------------------------
-# ADD MISSING ROUTES FROM LOGS
-# --------------------------------------------------
-
-# 1. Community posts endpoint (404 in logs)
-@app.route("/api/community/posts")
-def community_posts():
-    try:
-        # Return empty array for now - implement database logic later
-        return jsonify([])
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-# 2. Email endpoint replacement for PHP
-@app.route("/send_email.php", methods=["POST"])
-@app.route("/api/send_email", methods=["POST"])
-def send_email():
-    try:
-        # Get form data
-        name = request.form.get("name", "")
-        email = request.form.get("email", "")
-        subject = request.form.get("subject", "")
-        message = request.form.get("message", "")
-        
-        # Log the email attempt (in production, connect to email service)
-        print(f"📧 Email attempted: {name} <{email}> - {subject}")
-        
-        # For now, just acknowledge receipt
+        ensure_indexes()
+        # FTS5 table + sync triggers (or Postgres GIN indexes); backfilled on first creation
+        search.ensure_schema()
+        # Concerns board ranking for rows that predate the concern_rank table
+        concern_rank.ensure_populated()
+
+    @app.cli.command("bootstrap-db")
+    def bootstrap_db_command():
+        """Create database tables and indexes."""
+        bootstrap_schema()
+        click.echo("✅ Database tables ensured")
+
+    if app.config["AUTO_CREATE_SCHEMA"]:
+        with app.app_context():
+            try:
+                bootstrap_schema()
+                print("✅ Database tables ensured")
+            except Exception as e:
+                print(f"⚠️ Database init warning: {e}")
+
+    # --------------------------------------------------
+    # Register blueprints
+    # --------------------------------------------------
+
+    app.register_blueprint(api)
+    assets.init_app(app)
+    images.init_app(app)
+    # `flask archive-chats` / `flask compact-db` and the optional background run
+    retention.init_app(app)
+    # `flask export-data`
+    export.init_app(app)
+    # Contact-form mail sender and `flask send-queued-mail`
+    mail_queue.init_app(app)
+    # `flask rebuild-search`
+    search.init_app(app)
+    # `flask rebuild-concern-rank`
+    concern_rank.init_app(app)
+
+    # --------------------------------------------------
+    # Routes
+    # --------------------------------------------------
+
+    @app.route("/")
+    def home():
+        return page_cache.render_cached("index.html")
+
+
+    @app.route("/chat")
+    def chat_interface():
+        return page_cache.render_cached("chat.html")
+
+
+    @app.route("/health")
+    def health_check():
         return jsonify({
-            "status": "success",
-            "message": "Message received. We'll get back to you soon!",
-            "data": {
-                "name": name,
-                "email": email,
-                "subject": subject[:50]  # Truncate for safety
-            }
+            "status": "healthy",
+            "service": "Elmed Wellmind Mental Health AI",
+            "ai_status": "active" if os.getenv("COHERE_API_KEY") else "inactive",
+            "database": "connected"
         })
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-# 3. Static file serving - ensure images work
-@app.route('/static/<path:filename>')
-def serve_static(filename):
-    return send_from_directory('static', filename)
 
-# 4. Chat history endpoint (already works but ensure it's here)
-@app.route("/api/chat/history/<session_id>")
-def chat_history(session_id):
-    # This might be handled in your api blueprint
-    # If not, implement basic version
-    return jsonify({"messages": [], "session_id": session_id})
-
-# --------------------------------------------------
-# FALLBACK ROUTES FOR MISSING IMAGES
-# --------------------------------------------------
+    # --------------------------------------------------
+    # ADD MISSING ROUTES FROM LOGS
+    # --------------------------------------------------
 
-@app.route("/static/images/<image_name>")
-def serve_image(image_name):
-    """Serve images with fallback for missing files"""
-    try:
-        return send_from_directory('static/images', image_name)
-    except:
-        # Return a placeholder or default image if file doesn't exist
-        # This prevents 404 errors breaking the page
+    # 1. Community posts now live in the api blueprint (routes_py.community_posts)
+    # 2. Email endpoint replacement for PHP
+    @app.route("/send_email.php", methods=["POST"])
+    @app.route("/api/send_email", methods=["POST"])
+    def send_email():
         try:
-            return send_from_directory('static/images', 'wellmed.jpg')
-        except:
-            # Ultimate fallback
-            return jsonify({"error": "Image not found"}), 404
+            # Get form data
+            name = request.form.get("name", "")
+            email = request.form.get("email", "")
+            subject = request.form.get("subject", "")
+            message = request.form.get("message", "")
+            phone = request.form.get("phone", "") or "Not provided"
+            service = request.form.get("service", "") or "General Inquiry"
+
+            # Persisted and acknowledged now; the mail_queue sender delivers it
+            body = (f"Name: {name}\nEmail: {email}\nPhone: {phone}\nService: {service}\n\n"
+                    f"Message:\n{message}\n\n---\nSent from Elmed Wellmind Website\n"
+                    f"Time: {datetime.utcnow():%Y-%m-%d %H:%M:%S} UTC")
+            _, duplicate = mail_queue.mail_queue.enqueue(
+                app,
+                to_address=mail_queue.MAIL_TO,
+                subject=f"New Contact Form: {name} - {subject or service}"[:300],
+                body=body,
+                reply_to=email or None,
+                key=mail_queue.dedupe_key(name, email, phone, service, subject, message),
+            )
+            app.logger.info(f"📧 Email {'already queued' if duplicate else 'queued'}: {name} <{email}> - {subject}")
+
+            return jsonify({
+                "status": "success",
+                "message": "Message received. We'll get back to you soon!",
+                "data": {
+                    "name": name,
+                    "email": email,
+                    "subject": subject[:50]  # Truncate for safety
+                }
+            })
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    # 3. Static file serving - hashed files from `flask build-assets` are immutable
+    @app.route('/static/<path:filename>', endpoint='static')
+    def serve_static(filename):
+        return assets.send_static(filename)
+
+    # --------------------------------------------------
+    # FALLBACK ROUTES FOR MISSING IMAGES
+    # --------------------------------------------------
+
+    @app.route("/static/images/<image_name>")
+    def serve_image(image_name):
+        """Serve images, answering missing files with the fallback image from the asset manifest"""
+        # ?w=480&fmt=webp asks for a resized / re-encoded derivative
+        if images.wants_derivative():
+            return images.send_derivative(image_name)
+        return assets.send_image(image_name)
+
+    # --------------------------------------------------
+    # ERROR HANDLERS
+    # --------------------------------------------------
+
+    @app.errorhandler(404)
+    def not_found(e):
+        """Handle 404 errors gracefully"""
+        if request.path.startswith('/api/'):
+            return jsonify({"error": "Endpoint not found", "path": request.path}), 404
+        elif request.path.startswith('/static/'):
+            # For missing static files, don't return JSON - let browser handle it
+            return "File not found", 404
+        # For HTML pages show the home page, from the page cache so crawlers
+        # probing random URLs never reach Jinja, with an honest 404 status
+        return page_cache.render_cached("index.html", 404)
+
+    return app
 
-# --------------------------------------------------
-# ERROR HANDLERS
-# --------------------------------------------------
 
-@app.errorhandler(404)
-def not_found(e):
-    """Handle 404 errors gracefully"""
-    if request.path.startswith('/api/'):
-        return jsonify({"error": "Endpoint not found", "path": request.path}), 404
-    elif request.path.startswith('/static/'):
-        # For missing static files, don't return JSON - let browser handle it
-        return "File not found", 404
-    # For HTML pages, redirect to home or show error page
-    return render_template("index.html"), 200
+# gunicorn app:app
+app = create_app()
 
 # --------------------------------------------------
 # IMPORTANT
 # --------------------------------------------------
 # ❌ NO app.run()
 # ❌ NO debug=True
-# Render runs this app using:
+# Render runs this app using (see render.yaml / Procfile):
+# flask --app app bootstrap-db   (pre-deploy, creates missing tables)
 # gunicorn app:app
@@ -0,0 +1,156 @@
+# asgi.py - ASGI entry point: async /api/chat in front of the Flask app
+#
+# Async mode (one process holds hundreds of in-flight chat turns):
+#   uvicorn asgi:app --host 0.0.0.0 --port $PORT
+# Sync mode keeps working unchanged:
+#   gunicorn app:app
+# Upstream calls here do not hold a thread, so admission uses its own
+# ADMISSION_ASYNC_MAX_CONCURRENT / ADMISSION_ASYNC_QUEUE_SIZE; set them to
+# what the Cohere plan allows.
+
+import os
+import uuid
+import random
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import anyio
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+import admission
+import metrics
+import response_cache
+from app import app as flask_app
+from routes_py import (
+    FALLBACK_RESPONSES, build_chat_payload, emergency_suffix, get_chat_context,
+    get_intelligent_fallback, live_models, lookup_cached_reply, save_chat_message, upstream
+)
+
+logger = logging.getLogger(__name__)
+
+# SQLAlchemy work runs on worker threads; this bounds how many at once
+DB_THREADS = anyio.CapacityLimiter(int(os.getenv("ASGI_DB_THREADS", "10")))
+# Threads serving the mounted Flask app (streams, history, static); 40 matches
+# the anyio default the Starlette WSGI adapter ran on
+WSGI_WORKERS = int(os.getenv("ASGI_WSGI_WORKERS", "40"))
+
+
+async def run_db(fn, *args):
+    """Run a blocking database helper on a worker thread inside the Flask app context"""
+    def call():
+        with flask_app.app_context():
+            return fn(*args)
+    return await anyio.to_thread.run_sync(call, limiter=DB_THREADS)
+
+
+def record_user_turn(session_id, message, with_history):
+    """
+    Save the user message, build the token-budgeted context and look up the
+    response cache in one thread hop; returns (context, cache_key, cached_reply).
+    """
+    with metrics.span('save_user'):
+        save_chat_message(session_id, 'user', message)
+    if not with_history:
+        return None, None, None
+    with metrics.span('context'):
+        context = get_chat_context(session_id, message)
+    return (context,) + lookup_cached_reply(message, context.chat_history)
+
+
+async def chat(request):
+    """Async twin of routes_py.chat with the same request and response shape"""
+    session_id = None
+    try:
+        data = await request.json()
+        message = (data.get('message') or '').strip()
+        session_id = data.get('session_id', str(uuid.uuid4()))
+
+        if not message:
+            return JSONResponse({'error': 'Message cannot be empty'}, status_code=400)
+
+        cohere_key = os.environ.get('COHERE_API_KEY')
+        context, cache_key, bot_response = await run_db(
+            record_user_turn, session_id, message, bool(cohere_key)
+        )
+
+        reply_source = 'cache' if bot_response else 'fallback'
+        if bot_response:
+            bot_response += emergency_suffix(message, bot_response)
+        slot = None
+        if cohere_key and not bot_response:
+            with metrics.span('admission'):
+                slot = await admission.acquire_async(session_id)
+            if not slot.admitted:
+                reply_source = 'shed'
+                metrics.record_shed(slot.reason)
+                logger.info(f"🚦 Upstream saturated ({slot.reason}), shedding to fallback")
+        if slot is not None and slot.admitted:
+            try:
+                try:
+                    # The model registry and the slot lease live in SQLite
+                    models = await anyio.to_thread.run_sync(live_models, cohere_key)
+                    with metrics.span('upstream'):
+                        result = await upstream().achat(
+                            cohere_key, build_chat_payload(message, context.chat_history, context.preamble), models
+                        )
+                finally:
+                    await anyio.to_thread.run_sync(slot.release)
+                if result:
+                    logger.info(f"✅ Successfully used Cohere model: {result.model} ({result.elapsed:.2f}s)")
+                    metrics.record_model_win(result.model)
+                    reply_source = 'cohere'
+                    bot_response = result.text + emergency_suffix(message, result.text)
+                    if cache_key:
+                        await anyio.to_thread.run_sync(response_cache.put, cache_key, result.text)
+            except Exception as e:
+                logger.error(f"Cohere API attempt failed: {e}")
+
+        if not bot_response:
+            bot_response = get_intelligent_fallback(message)
+            logger.info("⚠️ Using intelligent fallback response")
+
+        with metrics.span('save_assistant'):
+            await run_db(save_chat_message, session_id, 'assistant', bot_response)
+        metrics.record_reply(reply_source)
+
+        return JSONResponse({
+            'response': bot_response,
+            'session_id': session_id,
+            'timestamp': datetime.utcnow().isoformat(),
+            'source': reply_source
+        })
+
+    except Exception as e:
+        logger.error(f"Unexpected error in async chat endpoint: {e}")
+        metrics.record_reply('error_fallback')
+        return JSONResponse({
+            'response': random.choice(FALLBACK_RESPONSES),
+            'session_id': session_id or str(uuid.uuid4()),
+            'timestamp': datetime.utcnow().isoformat(),
+            'source': 'error_fallback'
+        })
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    if upstream()._async_client is not None:
+        await upstream()._async_client.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/chat', chat, methods=['POST', 'OPTIONS'], middleware=[
+            Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+        ]),
+        # Everything else, including /api/chat/stream, is served by the WSGI app
+        Mount('/', app=WSGIMiddleware(flask_app, workers=WSGI_WORKERS)),
+    ],
+    lifespan=lifespan
+)
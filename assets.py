@@ -0,0 +1,290 @@
+# assets.py - fingerprinted, precompressed static assets and the manifest that maps them
+import os
+import json
+import gzip
+import time
+import hashlib
+import mimetypes
+
+import click
+from flask import current_app, request, send_file, url_for
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # optional: gzip variants are still written and served
+    brotli = None
+
+# --------------------------------------------------
+# Configuration
+# --------------------------------------------------
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(ROOT, "static")
+TEMPLATE_DIR = os.path.join(ROOT, "templates")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+
+FALLBACK_IMAGE = "images/wellmed.jpg"
+
+# Non-HTML files kept next to the templates (icons, style.css, site.webmanifest)
+TEMPLATE_ASSET_EXTENSIONS = {".css", ".js", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".ico", ".webp",
+                             ".webmanifest"}
+# Already-compressed formats gain nothing from gzip/brotli
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg", ".ico", ".json", ".webmanifest", ".html", ".txt", ".xml"}
+MIN_COMPRESS_BYTES = 512
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+UNHASHED_MAX_AGE = 3600
+
+mimetypes.add_type("application/manifest+json", ".webmanifest")
+
+_manifest = None
+_manifest_mtime = None
+_manifest_checked = 0.0
+
+
+# --------------------------------------------------
+# Build
+# --------------------------------------------------
+
+def source_files():
+    """(logical name, absolute path) for every file the build fingerprints"""
+    for directory, _, files in os.walk(STATIC_DIR):
+        if os.path.commonpath([directory, DIST_DIR]) == DIST_DIR:
+            continue
+        for filename in sorted(files):
+            path = os.path.join(directory, filename)
+            yield os.path.relpath(path, STATIC_DIR).replace(os.sep, "/"), path
+    for filename in sorted(os.listdir(TEMPLATE_DIR)):
+        path = os.path.join(TEMPLATE_DIR, filename)
+        if os.path.isfile(path) and os.path.splitext(filename)[1].lower() in TEMPLATE_ASSET_EXTENSIONS:
+            yield filename, path
+
+
+def hashed_name(name, content):
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+
+
+def write_variants(path, content):
+    """Write .gz (and .br when brotli is installed) next to ``path`` if they are smaller"""
+    encodings = []
+    if len(content) < MIN_COMPRESS_BYTES or os.path.splitext(path)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+        return encodings
+    if brotli is not None:
+        compressed = brotli.compress(content, quality=11)
+        if len(compressed) < len(content):
+            with open(path + ".br", "wb") as f:
+                f.write(compressed)
+            encodings.append("br")
+    # mtime=0 keeps the .gz bytes identical between builds of the same file
+    compressed = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(compressed) < len(content):
+        with open(path + ".gz", "wb") as f:
+            f.write(compressed)
+        encodings.append("gzip")
+    return encodings
+
+
+def rewrite_webmanifest(content, assets):
+    """Point icon entries of a web app manifest at their hashed URLs"""
+    data = json.loads(content)
+    for icon in data.get("icons", []):
+        entry = assets.get(icon.get("src", "").lstrip("/"))
+        if entry:
+            icon["src"] = f"/static/dist/{entry['path']}"
+    return json.dumps(data, indent=2).encode()
+
+
+def build():
+    """Fingerprint every source file into static/dist and write manifest.json"""
+    os.makedirs(DIST_DIR, exist_ok=True)
+    assets, deferred = {}, []
+    for name, path in source_files():
+        if name.endswith(".webmanifest"):
+            # Built last so the icons it lists already have hashed names
+            deferred.append((name, path))
+            continue
+        with open(path, "rb") as f:
+            assets[name] = write_asset(name, f.read())
+    for name, path in deferred:
+        with open(path, "rb") as f:
+            assets[name] = write_asset(name, rewrite_webmanifest(f.read(), assets))
+
+    manifest = {"assets": assets, "fallback_image": FALLBACK_IMAGE}
+    with open(MANIFEST_PATH + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(MANIFEST_PATH + ".tmp", MANIFEST_PATH)
+    return manifest
+
+
+def write_asset(name, content):
+    target_name = hashed_name(name, content)
+    target = os.path.join(DIST_DIR, target_name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, "wb") as f:
+        f.write(content)
+    return {"path": target_name, "size": len(content), "encodings": write_variants(target, content)}
+
+
+# --------------------------------------------------
+# Lookup
+# --------------------------------------------------
+
+def get_manifest():
+    """Parsed manifest.json ({} before the first build); re-read when the file changes"""
+    global _manifest, _manifest_mtime, _manifest_checked
+    now = time.monotonic()
+    if _manifest is not None and now - _manifest_checked < 2.0:
+        return _manifest
+    _manifest_checked = now
+    mtime = os.path.getmtime(MANIFEST_PATH) if os.path.exists(MANIFEST_PATH) else None
+    if mtime != _manifest_mtime or _manifest is None:
+        if mtime is None:
+            _manifest = {}
+        else:
+            with open(MANIFEST_PATH) as f:
+                _manifest = json.load(f)
+        _manifest_mtime = mtime
+    return _manifest
+
+
+def resolve(name):
+    """Manifest entry for a logical asset name, or None"""
+    return get_manifest().get("assets", {}).get(name)
+
+
+def fallback_entry():
+    manifest = get_manifest()
+    return manifest.get("assets", {}).get(manifest.get("fallback_image", FALLBACK_IMAGE))
+
+
+def asset_url(name):
+    """
+    Hashed URL for ``name`` (e.g. 'images/mental.png' or 'favicon.svg').
+
+    Images missing from the build resolve to the fallback image; anything
+    else without a manifest entry keeps its plain /static URL.
+    """
+    entry = resolve(name)
+    if entry is None and name.startswith("images/"):
+        entry = fallback_entry()
+    if entry is None:
+        return url_for("static", filename=name)
+    return url_for("static", filename=f"dist/{entry['path']}")
+
+
+# --------------------------------------------------
+# Serving
+# --------------------------------------------------
+
+def accepted_encodings():
+    header = request.headers.get("Accept-Encoding", "")
+    accepted = set()
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(token.strip().lower())
+    return accepted
+
+
+def send_dist(filename, encodings=None):
+    """
+    Send a hashed file from static/dist, preferring a precompressed variant.
+
+    ``encodings`` comes from the manifest when known; otherwise the variant
+    files are looked up on disk.
+    """
+    path = safe_join(DIST_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        raise NotFound()
+
+    accepted = accepted_encodings()
+    chosen, send_path = None, path
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        available = (encoding in encodings) if encodings is not None else os.path.isfile(path + suffix)
+        if encoding in accepted and available:
+            chosen, send_path = encoding, path + suffix
+            break
+
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    response = send_file(send_path, mimetype=mimetype, conditional=True, max_age=31536000)
+    if chosen:
+        response.headers["Content-Encoding"] = chosen
+    response.headers["Cache-Control"] = IMMUTABLE
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def template_asset(filename):
+    """Path of an icon/CSS/manifest file kept in templates/ (build() publishes these), or None"""
+    if "/" in filename or os.path.splitext(filename)[1].lower() not in TEMPLATE_ASSET_EXTENSIONS:
+        return None
+    path = safe_join(TEMPLATE_DIR, filename)
+    return path if path is not None and os.path.isfile(path) else None
+
+
+def send_static(filename):
+    """/static/<filename>: immutable hashed files from dist/, short-lived caching for the rest"""
+    if filename.startswith("dist/"):
+        return send_dist(filename[len("dist/"):])
+    path = safe_join(STATIC_DIR, filename)
+    if path is not None and os.path.isfile(path):
+        return send_file(path, conditional=True, max_age=UNHASHED_MAX_AGE)
+
+    # Before `flask build-assets` has run, asset_url() links the template-dir
+    # files under their plain /static name
+    path = template_asset(filename)
+    if path is None:
+        raise NotFound()
+    if filename.endswith(".webmanifest"):
+        with open(path, "rb") as f:
+            data = json.loads(f.read())
+        for icon in data.get("icons", []):
+            name = icon.get("src", "").lstrip("/")
+            if template_asset(name):
+                icon["src"] = url_for("static", filename=name)
+        response = current_app.response_class(json.dumps(data, indent=2), mimetype="application/manifest+json")
+        response.headers["Cache-Control"] = f"public, max-age={UNHASHED_MAX_AGE}"
+        return response
+    return send_file(path, conditional=True, max_age=UNHASHED_MAX_AGE)
+
+
+def send_image(image_name):
+    """/static/images/<image_name>, answering unknown names with the fallback image"""
+    name = f"images/{image_name}"
+    path = safe_join(STATIC_DIR, name)
+    if path is not None and os.path.isfile(path):
+        return send_static(name)
+
+    entry = fallback_entry()
+    if entry is not None:
+        response = send_dist(entry["path"], entry["encodings"])
+    elif os.path.isfile(os.path.join(STATIC_DIR, FALLBACK_IMAGE)):
+        response = send_static(FALLBACK_IMAGE)
+    else:
+        raise NotFound()
+    # The requested name may appear later; do not pin the placeholder
+    response.headers["Cache-Control"] = f"public, max-age={UNHASHED_MAX_AGE}"
+    return response
+
+
+# --------------------------------------------------
+# Flask wiring
+# --------------------------------------------------
+
+def init_app(app):
+    app.jinja_env.globals["asset_url"] = asset_url
+
+    @app.cli.command("build-assets")
+    def build_assets_command():
+        """Fingerprint and precompress static assets into static/dist."""
+        manifest = build()
+        variants = sum(len(entry["encodings"]) for entry in manifest["assets"].values())
+        click.echo(f"✅ Built {len(manifest['assets'])} assets ({variants} compressed variants) "
+                   f"into {os.path.relpath(DIST_DIR, ROOT)}")
+        if brotli is None:
+            click.echo("⚠️ brotli is not installed; only gzip variants were written")
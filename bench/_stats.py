@@ -0,0 +1,41 @@
+# bench/_stats.py - latency summary helpers shared by the benchmark scripts
+import math
+import os
+import sys
+
+# Benchmarks live one level below the app modules
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples):
+    """Return count/mean/p50/p95/p99/max for latencies in seconds, reported in ms"""
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 2),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2),
+    }
+
+
+def print_summary(label, samples):
+    s = summarize(samples)
+    if not s["count"]:
+        print(f"{label:<28} no samples")
+        return
+    print(f"{label:<28} n={s['count']:<6} p50={s['p50_ms']:>9.1f}ms  "
+          f"p95={s['p95_ms']:>9.1f}ms  p99={s['p99_ms']:>9.1f}ms  max={s['max_ms']:>9.1f}ms")
@@ -0,0 +1,144 @@
+# bench/bench_admission.py - non-chat latency while chat saturates a slow upstream, admission off vs on
+"""
+    python bench/bench_admission.py --chat-rate 8 --latency-ms 3000 --duration 15
+
+Runs gunicorn (``--workers`` x ``--threads``) against the Cohere stub and,
+for each admission mode, starts ``--chat-rate`` /api/chat turns per second
+(more than upstream can finish) while a probe client measures /health, /
+and the community feed. Without admission every thread ends up parked on upstream and the
+probes queue behind them; with it, surplus turns are shed to the fallback
+and the probes keep their latency. ``--cap`` stands in for an upstream plan
+that sustains fewer calls than there are threads (by default half of them);
+ADMISSION_MAX_CONCURRENT is the Cohere allowance, not derived from workers.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from _stats import ROOT, print_summary
+from bench_concurrency import free_port, wait_ready
+from cohere_stub import add_stub_arguments, config_from_args, start_stub
+
+MODES = {
+    "admission off": {"ADMISSION_BACKEND": "off"},
+    "admission shared": {"ADMISSION_BACKEND": "shared"},
+}
+PROBES = ["/health", "/", "/api/community/posts"]
+
+
+async def load(base, args):
+    import httpx
+
+    stop = time.perf_counter() + args.duration
+    sources = {}
+    chat_latency = []
+    probes = {path: [] for path in PROBES}
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=None), timeout=args.timeout) as client:
+        async def one_turn(i):
+            started = time.perf_counter()
+            try:
+                # A message per turn, so the response cache never answers
+                response = await client.post(f"{base}/api/chat", json={
+                    "message": f"I feel stressed about exams {i}", "session_id": f"adm-{i % 50}"})
+                source = response.json().get("source", "error")
+            except httpx.HTTPError:
+                source = "error"
+            chat_latency.append(time.perf_counter() - started)
+            sources[source] = sources.get(source, 0) + 1
+
+        async def arrivals():
+            # Open loop: users keep arriving at --chat-rate whether or not replies are fast
+            turns = []
+            i = 0
+            while time.perf_counter() < stop:
+                turns.append(asyncio.create_task(one_turn(i)))
+                i += 1
+                await asyncio.sleep(1.0 / args.chat_rate)
+            await asyncio.gather(*turns)
+
+        async def prober():
+            await asyncio.sleep(2.0)   # let chat saturate upstream first
+            i = 0
+            while time.perf_counter() < stop:
+                path = PROBES[i % len(PROBES)]
+                i += 1
+                started = time.perf_counter()
+                try:
+                    await client.get(f"{base}{path}")
+                except httpx.HTTPError:
+                    pass
+                probes[path].append(time.perf_counter() - started)
+                await asyncio.sleep(0.05)
+
+        await asyncio.gather(prober(), arrivals())
+        try:
+            admin = (await client.get(f"{base}/api/admin/admission", headers={"X-Admin-Token": "bench"})).json()
+        except (httpx.HTTPError, ValueError):
+            admin = None
+    return chat_latency, sources, probes, admin
+
+
+def run_mode(label, env, stub, args):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    command = [sys.executable, "-m", "gunicorn", "app:app", "-w", str(args.workers), "--threads", str(args.threads),
+               "-b", f"127.0.0.1:{port}", "--timeout", str(int(args.timeout))]
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(base)
+        stub.peak_in_flight = 0
+        stub.requests.clear()
+        chat_latency, sources, probes, admin = asyncio.run(load(base, args))
+    finally:
+        process.terminate()
+        process.wait()
+
+    print(f"--- {label}")
+    for path, samples in probes.items():
+        print_summary(f"  GET {path}", samples)
+    print_summary("  POST /api/chat", chat_latency)
+    upstream_calls = sum(stub.requests.values())
+    print(f"{'':<28} turns={len(chat_latency)}  upstream calls={upstream_calls}  "
+          f"peak upstream in flight={stub.peak_in_flight}  errors={sources.get('error', 0)}")
+    if admin and "shed" in admin:
+        print(f"{'':<28} shed={admin['shed']} queued={admin['queued']} avg_wait={admin['avg_wait_ms']}ms "
+              f"(last worker's counters)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--cap", type=int, default=None,
+                        help="ADMISSION_MAX_CONCURRENT (default: half of workers x threads)")
+    parser.add_argument("--chat-rate", type=float, default=8.0, help="chat turns started per second")
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    add_stub_arguments(parser)
+    parser.set_defaults(latency_ms=3000.0, sigma=0.1)
+    args = parser.parse_args()
+
+    stub = start_stub(config_from_args(args))
+    for label, overrides in MODES.items():
+        workdir = tempfile.mkdtemp()
+        env = dict(os.environ,
+                   DATABASE_URL=f"sqlite:///{workdir}/bench.db",
+                   LOCAL_STORE_PATH=os.path.join(workdir, "local_store.db"),
+                   COHERE_API_KEY="stub-key",
+                   COHERE_API_URL=stub.url,
+                   COHERE_DISPATCH="sequential",
+                   ADMIN_TOKEN="bench",
+                   WEB_CONCURRENCY=str(args.workers),
+                   GUNICORN_THREADS=str(args.threads),
+                   # Every client is its own session; the per-session bucket is not under test here
+                   ADMISSION_SESSION_RATE="0",
+                   ADMISSION_MAX_CONCURRENT=str(args.cap or max(1, args.workers * args.threads // 2)),
+                   **overrides)
+        subprocess.run([sys.executable, "-m", "flask", "--app", "app", "bootstrap-db"], env=env, cwd=ROOT,
+                       check=True, stdout=subprocess.DEVNULL)
+        run_mode(label, env, stub, args)
+    stub.shutdown()
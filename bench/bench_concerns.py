@@ -0,0 +1,146 @@
+# bench/bench_concerns.py - concerns board: ranked keyset pages vs sorting concerns on every request
+"""
+    python bench/bench_concerns.py --concerns 500000 --users 20000
+
+Seeds a fresh SQLite file, ranks it with `concern_rank.rebuild()`, then
+times /api/concerns (hot, new, unanswered, per category and deep keyset
+pages) against the query it replaces: ORDER BY the hot formula computed
+over the concerns table, with each author lazy-loaded while serializing.
+Also counts SQL statements per page and times upvotes, which re-rank one
+row in the same transaction.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from _stats import print_summary
+
+CATEGORIES = ["anxiety", "depression", "stress", "relationships", "sleep", "work", "family", "general"]
+STATUSES = ["open"] * 6 + ["responded"] * 3 + ["closed"]
+
+
+def seed(path, concerns, users, seed_value=5):
+    rng = random.Random(seed_value)
+    start = datetime(2024, 1, 1)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executemany("INSERT INTO users (username, created_at, updated_at) VALUES (?, ?, ?)",
+                     ((f"user{i}", start, start) for i in range(users)))
+    step = 50_000
+
+    def concern_rows(lo, hi):
+        for i in range(lo, hi):
+            created = start + timedelta(seconds=i * 60 + rng.randint(0, 59))
+            status = rng.choice(STATUSES)
+            yield (f"Concern {i}", f"Something has been on my mind ({i})", rng.choice(CATEGORIES),
+                   rng.randint(1, users), "Thanks for sharing" if status != "open" else None, status,
+                   int(rng.paretovariate(1.3)) - 1, rng.random() < 0.3, created.isoformat(" "))
+
+    for lo in range(0, concerns, step):
+        conn.executemany(
+            "INSERT INTO concerns (title, content, category, author_id, response, status, upvotes,"
+            " is_anonymous, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            concern_rows(lo, min(concerns, lo + step)))
+        conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def timed_get(client, url, repeats):
+    samples, response = [], None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        response = client.get(url)
+        samples.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.data
+    return samples, response
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concerns", type=int, default=500_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--depth", type=int, default=100, help="pages to walk for the deep-page timing")
+    parser.add_argument("--repeats", type=int, default=30)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["AUTO_CREATE_SCHEMA"] = "1"
+    os.environ["LOCAL_STORE_PATH"] = os.path.join(workdir, "local_store.db")
+
+    from app import app
+    import concern_rank
+    from models import Concern, db
+    from sqlalchemy import event
+
+    started = time.perf_counter()
+    seed(db_path, args.concerns, args.users)
+    print(f"seeded {args.concerns} concerns / {args.users} users in {time.perf_counter() - started:.1f}s")
+    with app.app_context():
+        rows, seconds = concern_rank.rebuild()
+        print(f"rebuild-concern-rank: {rows} rows in {seconds:.1f}s")
+        db.session.execute(db.text("ANALYZE"))
+        db.session.commit()
+        statements = []
+        event.listen(db.engine, "before_cursor_execute", lambda *a: statements.append(1))
+
+    # Baseline: the same order computed per request, authors loaded per row
+    decay_days = concern_rank.CONCERN_HOT_DECAY_HOURS / 24
+    on_the_fly = db.text(
+        "CASE status WHEN 'closed' THEN 0 WHEN 'responded' THEN 1 ELSE 2 END DESC,"
+        " log10(coalesce(upvotes, 0) + 1)"
+        f" + (julianday(created_at) - julianday('2024-01-01')) / {decay_days} DESC, id DESC")
+    with app.app_context():
+        samples = []
+        for _ in range(max(1, args.repeats // 5)):
+            statements.clear()
+            started = time.perf_counter()
+            page = [concern_rank.serialize_concern(c)
+                    for c in Concern.query.order_by(on_the_fly).limit(concern_rank.CONCERN_PAGE_SIZE).all()]
+            samples.append(time.perf_counter() - started)
+        print_summary("hot, sorted per request", samples)
+        print(f"{'':<28} {len(statements)} statements for {len(page)} concerns")
+
+    client = app.test_client()
+    for label, url in (("hot", "/api/concerns"), ("new", "/api/concerns?sort=new"),
+                       ("unanswered", "/api/concerns?sort=unanswered"),
+                       ("hot, category", "/api/concerns?category=sleep"),
+                       ("unanswered, category", "/api/concerns?sort=unanswered&category=sleep")):
+        statements.clear()
+        client.get(url)
+        count = len(statements)
+        print_summary(f"{label} (ranked)", timed_get(client, url, args.repeats)[0])
+        print(f"{'':<28} {count} statement(s) per page")
+
+    cursor, walk = None, []
+    for _ in range(args.depth):
+        samples, response = timed_get(client, "/api/concerns" + (f"?after={cursor}" if cursor else ""), 1)
+        walk += samples
+        cursor = response.headers.get("X-Next-Cursor")
+    print_summary(f"keyset walk ({args.depth} pages)", walk)
+    print_summary(f"keyset page {args.depth}", timed_get(client, f"/api/concerns?after={cursor}", args.repeats)[0])
+
+    rng = random.Random(9)
+    samples = []
+    for _ in range(args.repeats * 5):
+        started = time.perf_counter()
+        response = client.post(f"/api/concerns/{rng.randint(1, args.concerns)}/upvote")
+        samples.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.data
+    print_summary("upvote + re-rank", samples)
+
+    with app.app_context():
+        for label, sql in (("hot", "SELECT concern_id FROM concern_rank"
+                                   " ORDER BY state DESC, hot_score DESC, concern_id DESC LIMIT 21"),
+                           ("unanswered, category", "SELECT concern_id FROM concern_rank"
+                                                    " WHERE category = 'sleep' AND state = 2"
+                                                    " ORDER BY hot_score DESC, concern_id DESC LIMIT 21")):
+            plan = db.session.execute(db.text(f"EXPLAIN QUERY PLAN {sql}")).all()
+            print(f"{label} plan:", "; ".join(row[-1] for row in plan))
@@ -0,0 +1,109 @@
+# bench/bench_concurrency.py - concurrent chat capacity: gunicorn sync workers vs uvicorn ASGI
+"""
+    python bench/bench_concurrency.py --connections 200 --latency-ms 1000 --sync-workers 2
+
+Fires ``--connections`` simultaneous /api/chat turns at each serving mode
+while the Cohere stub holds every upstream call for ``--latency-ms``. The
+stub's peak in-flight count shows how many chat turns a mode really keeps
+open at once.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from _stats import ROOT, print_summary
+from cohere_stub import add_stub_arguments, config_from_args, start_stub
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(base, timeout=30):
+    import httpx
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base}/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server at {base} did not start")
+
+
+async def fire(base, connections, timeout):
+    import httpx
+
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        async def one(i):
+            started = time.perf_counter()
+            try:
+                response = await client.post(f"{base}/api/chat",
+                                             json={"message": "I feel stressed", "session_id": f"cc-{i}"})
+                ok = response.status_code == 200 and response.json().get("source") == "cohere"
+            except httpx.HTTPError:
+                ok = False
+            return time.perf_counter() - started, ok
+
+        return await asyncio.gather(*(one(i) for i in range(connections)))
+
+
+def run_mode(label, command, env, stub, args):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen([arg.format(port=port) for arg in command], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(base)
+        stub.peak_in_flight = 0
+        started = time.perf_counter()
+        results = asyncio.run(fire(base, args.connections, args.timeout))
+        wall = time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait()
+
+    latencies = [elapsed for elapsed, ok in results if ok]
+    print_summary(label, latencies)
+    print(f"{'':<28} ok={len(latencies)}/{args.connections}  wall={wall:.1f}s  "
+          f"throughput={len(latencies) / wall:.1f}/s  peak upstream in flight={stub.peak_in_flight}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--sync-workers", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    add_stub_arguments(parser)
+    parser.set_defaults(latency_ms=1000.0, sigma=0.1)
+    args = parser.parse_args()
+
+    stub = start_stub(config_from_args(args))
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{workdir}/bench.db",
+               LOCAL_STORE_PATH=os.path.join(workdir, "local_store.db"),
+               COHERE_API_KEY="stub-key",
+               COHERE_API_URL=stub.url,
+               # Measure raw capacity: one model, no hedges
+               COHERE_DISPATCH="sequential")
+
+    python = sys.executable
+    # One-shot schema bootstrap, as a deploy would run before starting workers
+    subprocess.run([python, "-m", "flask", "--app", "app", "bootstrap-db"], env=env, cwd=ROOT, check=True)
+    run_mode(f"gunicorn sync x{args.sync_workers}",
+             [python, "-m", "gunicorn", "app:app", "-w", str(args.sync_workers), "-b", "127.0.0.1:{port}",
+              "--timeout", str(int(args.timeout))], env, stub, args)
+    run_mode("uvicorn asgi x1",
+             [python, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", "{port}",
+              "--log-level", "warning"], env, stub, args)
+    stub.shutdown()
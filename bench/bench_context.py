@@ -0,0 +1,72 @@
+# bench/bench_context.py - prompt tokens per turn: last-6-messages baseline versus the packed context
+"""
+    python bench/bench_context.py --sessions 20 --turns 30 --budget 1000
+
+Plays ``--turns`` chat turns per session (user messages of mixed length,
+replies of assistant length) through save_chat_message and
+get_chat_context, as chat() does, and reports the tokens each turn would
+send next to what the unpacked last-6-messages payload would have sent,
+plus the time spent building the context.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from _stats import print_summary
+
+USER_LINES = [
+    "I can't sleep before my exams.",
+    "My family keeps asking about my results and I feel like I'm letting everyone down.",
+    "Work has been overwhelming lately, I stay late every day and still feel behind.",
+    "Sometimes I feel anxious for no reason, my chest gets tight and my thoughts race.",
+    "I argued with my partner again and now we are not talking.",
+    "Thanks, that helps a bit.",
+]
+REPLY = ("I hear you, and it makes sense that this feels heavy. Try writing down the three tasks that matter most "
+         "tomorrow and give each one a fixed time. A short walk or slow breathing (in for 4, hold for 4, out for 6) "
+         "before starting can settle the body. Talking to someone you trust also helps. If these feelings persist, "
+         "please reach out to Elmed Wellmind Solutions at +254759226354 for professional support. ")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--budget", type=int, default=1000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/bench.db"
+    os.environ["AUTO_CREATE_SCHEMA"] = "1"
+    os.environ["LOCAL_STORE_PATH"] = os.path.join(workdir, "local_store.db")
+    os.environ["CONTEXT_TOKEN_BUDGET"] = str(args.budget)
+
+    from app import app
+    from routes_py import get_chat_context, save_chat_message
+    import context_builder
+
+    rng = random.Random(7)
+    build_times, sent, baseline = [], [], []
+    with app.test_request_context():
+        for session in range(args.sessions):
+            session_id = f"bench-context-{session}"
+            for turn in range(args.turns):
+                message = " ".join(rng.choice(USER_LINES) for _ in range(rng.randint(1, 4)))
+                save_chat_message(session_id, "user", message)
+                before = context_builder.stats()["tokens_baseline"]
+                started = time.perf_counter()
+                context = get_chat_context(session_id, message)
+                build_times.append(time.perf_counter() - started)
+                sent.append(context.tokens["total"])
+                baseline.append(context_builder.stats()["tokens_baseline"] - before)
+                save_chat_message(session_id, "assistant", REPLY * rng.randint(1, 2))
+
+    stats = context_builder.stats()
+    print_summary("context build", build_times)
+    print(f"tokenizer={stats['tokenizer']} ({stats['tokenizer_state']})  budget={args.budget}")
+    print(f"tokens/turn   baseline avg={sum(baseline) / len(baseline):.0f} max={max(baseline)}   "
+          f"packed avg={sum(sent) / len(sent):.0f} max={max(sent)}   "
+          f"reduction={100 * (1 - sum(sent) / sum(baseline)):.1f}%")
+    print(f"summaries refreshed={stats['summaries_refreshed']}  errors={stats['summary_errors']}")
@@ -0,0 +1,79 @@
+# bench/bench_counters.py - per-impression UPDATEs versus buffered counter flushes
+"""
+    python bench/bench_counters.py --threads 16 --impressions 500 --posts 200
+
+Each thread records ``--impressions`` feed impressions (20 post views each)
+against a fresh SQLite file through every counter backend, then checks the
+table totals once the buffer has been flushed.
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from _stats import print_summary
+
+
+def run(app, backend_name, args):
+    import counters
+    from models import CommunityPost, db
+
+    buffer = counters.CounterBuffer(backend_name, interval=args.interval)
+    with app.app_context():
+        db.session.query(CommunityPost).update({CommunityPost.views: 0})
+        db.session.commit()
+
+    latencies = [[] for _ in range(args.threads)]
+
+    def worker(index):
+        rng = random.Random(index)
+        for _ in range(args.impressions):
+            page = rng.sample(range(1, args.posts + 1), 20)
+            started = time.perf_counter()
+            buffer.incr(app, [(post_id, "views", 1) for post_id in page])
+            latencies[index].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    wall = time.perf_counter() - started
+    buffer.flush()
+
+    with app.app_context():
+        total = db.session.query(db.func.sum(CommunityPost.views)).scalar()
+    expected = args.threads * args.impressions * 20
+    samples = [sample for per_thread in latencies for sample in per_thread]
+    print_summary(backend_name, samples)
+    stats = buffer.stats()
+    print(f"{'':<28} impressions/s={len(samples) / wall:.0f}  flushes={stats['flushes']}  "
+          f"views in table={total}/{expected}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--impressions", type=int, default=500)
+    parser.add_argument("--posts", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/bench.db"
+    os.environ["AUTO_CREATE_SCHEMA"] = "1"
+    os.environ["LOCAL_STORE_PATH"] = os.path.join(workdir, "local_store.db")
+
+    from app import app
+    from models import CommunityPost, db
+
+    with app.app_context():
+        db.session.add_all(CommunityPost(content=f"post {i}", views=0, likes=0, comments_count=0)
+                           for i in range(args.posts))
+        db.session.commit()
+
+    for name in ("off", "memory", "shared"):
+        run(app, name, args)
@@ -0,0 +1,140 @@
+# bench/bench_db_profiles.py - history reads under concurrent chat writes, default vs tuned SQLite engine
+"""
+    python bench/bench_db_profiles.py --readers 8 --writers 4 --seconds 5
+
+Reader processes run the chat-history query for random sessions while
+writer processes commit chat turns (and, every ``--batch-every`` turns, a
+write-behind sized batch). Each profile gets a fresh SQLite file:
+``default`` is SQLAlchemy's stock engine (rollback journal), ``tuned`` is
+engine_profiles (WAL, synchronous=NORMAL, busy_timeout, mmap, cache).
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from _stats import print_summary
+
+
+def seed(engine, sessions, per_session):
+    from models import ChatMessage, db
+
+    db.metadata.create_all(engine)
+    base = datetime(2024, 1, 1)
+    rows = [{"session_id": f"s{s}", "role": "user" if i % 2 == 0 else "assistant",
+             "content": f"message {i} " * 20, "created_at": base + timedelta(seconds=s * per_session + i)}
+            for s in range(sessions) for i in range(per_session)]
+    with engine.begin() as conn:
+        conn.execute(ChatMessage.__table__.insert(), rows)
+
+
+def make_engine(profile, url):
+    from sqlalchemy import create_engine
+    import engine_profiles
+
+    if profile == "tuned":
+        engine = create_engine(url, **engine_profiles.engine_options(url))
+        engine_profiles.install(engine)
+        return engine
+    return create_engine(url)
+
+
+def reader(profile, url, index, args, deadline, results):
+    from sqlalchemy import select
+    from models import ChatMessage
+
+    engine = make_engine(profile, url)
+    table = ChatMessage.__table__
+    rng = random.Random(index)
+    samples, errors = [], 0
+    while time.time() < deadline:
+        session_id = f"s{rng.randrange(args.sessions)}"
+        started = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                conn.execute(
+                    select(table.c.role, table.c.content)
+                    .where(table.c.session_id == session_id)
+                    .order_by(table.c.created_at, table.c.id)
+                    .limit(100)
+                ).fetchall()
+        except Exception:
+            errors += 1
+            continue
+        samples.append(time.perf_counter() - started)
+    results.put(("read", samples, errors))
+
+
+def writer(profile, url, index, args, deadline, results):
+    from models import ChatMessage
+
+    engine = make_engine(profile, url)
+    table = ChatMessage.__table__
+    rng = random.Random(1000 + index)
+    turns, errors = 0, 0
+    while time.time() < deadline:
+        session_id = f"s{rng.randrange(args.sessions)}"
+        now = datetime.utcnow()
+        count = args.batch_size if (turns + 1) % args.batch_every == 0 else 2
+        rows = [{"session_id": session_id, "role": "user" if i % 2 == 0 else "assistant",
+                 "content": "hello " * 40, "created_at": now} for i in range(count)]
+        try:
+            with engine.begin() as conn:
+                conn.execute(table.insert(), rows)
+            turns += 1
+        except Exception:
+            errors += 1
+    results.put(("write", turns, errors))
+
+
+def run(profile, args):
+    url = f"sqlite:///{os.path.join(tempfile.mkdtemp(dir=args.dir), f'{profile}.db')}"
+    engine = make_engine(profile, url)
+    seed(engine, args.sessions, args.per_session)
+    engine.dispose()
+
+    # Separate processes, like gunicorn workers sharing the one database file
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    deadline = time.time() + 1 + args.seconds
+    processes = [context.Process(target=reader, args=(profile, url, i, args, deadline, results))
+                 for i in range(args.readers)]
+    processes += [context.Process(target=writer, args=(profile, url, i, args, deadline, results))
+                  for i in range(args.writers)]
+    for process in processes:
+        process.start()
+
+    samples, turns, errors = [], 0, {"read": 0, "write": 0}
+    for _ in processes:
+        kind, value, failed = results.get()
+        errors[kind] += failed
+        if kind == "read":
+            samples.extend(value)
+        else:
+            turns += value
+    for process in processes:
+        process.join()
+
+    wall = args.seconds + 1
+    print_summary(f"{profile} history read", samples)
+    print(f"{'':<28} reads/s={len(samples) / wall:.0f}  write txns/s={turns / wall:.0f}  "
+          f"read errors={errors['read']}  write errors={errors['write']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--per-session", type=int, default=50)
+    parser.add_argument("--batch-every", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--dir", help="Directory for the database files (use a real disk: fsync cost matters)")
+    args = parser.parse_args()
+
+    for name in ("default", "tuned"):
+        run(name, args)
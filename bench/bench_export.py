@@ -0,0 +1,82 @@
+# bench/bench_export.py - peak memory and throughput of streamed exports vs loading the table
+"""
+    python bench/bench_export.py --sizes 10000 1000000
+
+Seeds chat_messages with each size in turn and, in a fresh interpreter per
+measurement, exports the table to /dev/null as gzipped NDJSON with
+export.stream and with a naive ``.all()`` + json dump. Peak RSS is reported
+next to the interpreter's baseline after importing the app; the streamed
+peak should not move with the row count.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from _stats import ROOT
+
+WORKER = """
+import json, resource, sys, time
+from app import app
+import export
+
+mode = sys.argv[1]
+with app.app_context():
+    from models import ChatMessage
+    ChatMessage.query.limit(1).all()
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    written = 0
+    with open("/dev/null", "wb") as sink:
+        if mode == "stream":
+            for chunk in export.stream(export.ExportOptions("chat_messages"), compress=True):
+                written += len(chunk)
+                sink.write(chunk)
+        else:
+            rows = [{c.name: getattr(m, c.name) for c in ChatMessage.__table__.columns}
+                    for m in ChatMessage.query.order_by(ChatMessage.id).all()]
+            body = "".join(json.dumps(row, default=str) + "\\n" for row in rows).encode()
+            written = len(body)
+            sink.write(body)
+    elapsed = time.perf_counter() - started
+print(json.dumps({"baseline_mb": baseline / 1024, "peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "elapsed": elapsed, "bytes": written}))
+"""
+
+
+def seed(env, rows):
+    code = f"""
+from datetime import datetime, timedelta
+from app import app
+from models import ChatMessage, db
+start = datetime.utcnow() - timedelta(days=30)
+with app.app_context():
+    for offset in range(0, {rows}, 10000):
+        db.session.execute(ChatMessage.__table__.insert(), [
+            dict(session_id=f"s{{i // 40}}", role="user" if i % 2 == 0 else "assistant",
+                 content=f"turn {{i}}: I have been feeling anxious about work lately", is_mental_health_related=True,
+                 created_at=start + timedelta(seconds=i)) for i in range(offset, min(offset + 10000, {rows}))])
+        db.session.commit()
+"""
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True, capture_output=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 1000000])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp()
+        # Memory-mapped database pages count towards RSS and would hide the export's own footprint
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{workdir}/bench.db", AUTO_CREATE_SCHEMA="1",
+                   LOCAL_STORE_PATH=os.path.join(workdir, "local_store.db"), SQLITE_MMAP_SIZE="0")
+        seed(env, size)
+        for mode in ("stream", "all()"):
+            result = subprocess.run([sys.executable, "-c", WORKER, mode], cwd=ROOT, env=env,
+                                    capture_output=True, text=True, check=True)
+            data = json.loads(result.stdout.strip().splitlines()[-1])
+            print(f"{size:>9} rows  {mode:<7} peak={data['peak_mb']:7.1f}MB (baseline {data['baseline_mb']:.1f}MB)  "
+                  f"{size / data['elapsed']:>9.0f} rows/s  output={data['bytes'] / 1e6:.1f}MB")
@@ -0,0 +1,138 @@
+# bench/bench_feed.py - community feed latency on a large seeded dataset
+"""
+    python bench/bench_feed.py --posts 1000000 --comments 2000000
+
+Seeds a fresh SQLite file, then times /api/community/posts through the Flask
+test client: the first page cold and cached, keyset pages deep into the feed
+against the OFFSET query they replace, and category-filtered pages.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from _stats import print_summary
+
+CATEGORIES = ["anxiety", "depression", "stress", "relationships", "sleep", None]
+
+
+def seed(path, posts, comments, seed_value=11):
+    rng = random.Random(seed_value)
+    start = datetime(2023, 1, 1)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    step = 50_000
+
+    def post_rows(lo, hi):
+        for i in range(lo, hi):
+            created = (start + timedelta(seconds=i * 60 + rng.randint(0, 59))).isoformat(" ")
+            yield (f"user{i % 5000}", f"Post {i} about how things are going", rng.choice(CATEGORIES),
+                   rng.randint(0, 200), 0, rng.randint(0, 5000), created, created,
+                   rng.random() > 0.03, rng.random() < 0.001)
+
+    for lo in range(0, posts, step):
+        conn.executemany(
+            "INSERT INTO community_posts (author_name, content, category, likes, comments_count, views,"
+            " created_at, updated_at, is_approved, is_featured) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            post_rows(lo, min(posts, lo + step)))
+        conn.commit()
+
+    # Newer posts collect most of the comments
+    def comment_rows(lo, hi):
+        for i in range(lo, hi):
+            post_id = posts - int(rng.paretovariate(1.2)) % posts
+            created = (start + timedelta(seconds=post_id * 60 + rng.randint(60, 86400))).isoformat(" ")
+            yield post_id, f"user{i % 3000}", f"Comment {i}", created
+
+    for lo in range(0, comments, step):
+        conn.executemany("INSERT INTO post_comments (post_id, author_name, content, created_at) VALUES (?, ?, ?, ?)",
+                         comment_rows(lo, min(comments, lo + step)))
+        conn.commit()
+    conn.execute("UPDATE community_posts SET comments_count ="
+                 " (SELECT COUNT(*) FROM post_comments WHERE post_id = community_posts.id)"
+                 " WHERE id IN (SELECT DISTINCT post_id FROM post_comments)")
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def timed_get(client, url, repeats):
+    samples, response = [], None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        response = client.get(url)
+        samples.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.data
+    return samples, response
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--posts", type=int, default=1_000_000)
+    parser.add_argument("--comments", type=int, default=2_000_000)
+    parser.add_argument("--depth", type=int, default=200, help="pages to walk for the deep-page comparison")
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["AUTO_CREATE_SCHEMA"] = "1"
+    os.environ["LOCAL_STORE_PATH"] = os.path.join(workdir, "local_store.db")
+
+    from app import app
+    import community_feed
+    from models import CommunityPost, db
+
+    started = time.perf_counter()
+    seed(db_path, args.posts, args.comments)
+    print(f"seeded {args.posts} posts / {args.comments} comments in {time.perf_counter() - started:.1f}s")
+
+    client = app.test_client()
+    community_feed.FEED_CACHE_TTL = 0
+    print_summary("first page (uncached)", timed_get(client, "/api/community/posts", args.repeats)[0])
+    print_summary("category page (uncached)",
+                  timed_get(client, "/api/community/posts?category=sleep", args.repeats)[0])
+
+    # Walk the feed, then time the last page reached by cursor and by OFFSET
+    cursor, walk = None, []
+    for _ in range(args.depth):
+        samples, response = timed_get(client, "/api/community/posts" + (f"?after={cursor}" if cursor else ""), 1)
+        walk += samples
+        cursor = response.headers.get("X-Next-Cursor")
+    print_summary(f"keyset walk ({args.depth} pages)", walk)
+    print_summary(f"keyset page {args.depth}",
+                  timed_get(client, f"/api/community/posts?after={cursor}", args.repeats)[0])
+
+    offset_sql = db.text(
+        "SELECT * FROM community_posts WHERE is_approved = 1"
+        " ORDER BY is_featured DESC, created_at DESC, id DESC LIMIT :limit OFFSET :offset")
+    with app.app_context():
+        for offset in (args.depth * community_feed.FEED_PAGE_SIZE, args.posts // 2):
+            samples = []
+            for _ in range(max(1, args.repeats // 5)):
+                started = time.perf_counter()
+                rows = db.session.execute(offset_sql, {"limit": community_feed.FEED_PAGE_SIZE,
+                                                       "offset": offset}).all()
+                samples.append(time.perf_counter() - started)
+            print_summary(f"OFFSET {offset} (query only)", samples)
+            if rows:
+                # The same position reached by cursor instead
+                anchor = db.session.get(CommunityPost, rows[0].id)
+                cursor = community_feed.encode_cursor(anchor)
+                print_summary(f"keyset at {offset}",
+                              timed_get(client, f"/api/community/posts?after={cursor}", args.repeats)[0])
+        plan = db.session.execute(db.text(
+            "EXPLAIN QUERY PLAN SELECT id FROM community_posts WHERE is_approved = 1"
+            " AND (is_featured, created_at, id) < (0, '2024-01-01', 1)"
+            " ORDER BY is_featured DESC, created_at DESC, id DESC LIMIT 21")).all()
+        print("keyset plan:", "; ".join(row[-1] for row in plan))
+
+    community_feed.FEED_CACHE_TTL = 10
+    client.get("/api/community/posts")
+    print_summary("first page (cached)", timed_get(client, "/api/community/posts", args.repeats)[0])
+    print("cache:", community_feed.stats())
@@ -0,0 +1,127 @@
+# bench/bench_intents.py - keyword-chain classification versus the compiled intents pattern
+"""
+    python bench/bench_intents.py --messages 20000
+
+Times the per-request work chat() used to do (serious-keyword scan plus the
+get_intelligent_fallback elif chain) against intents.classify, and the
+batch API over a synthetic set of stored messages.
+"""
+import argparse
+import random
+import time
+
+import _stats  # noqa: F401  (puts the app modules on sys.path)
+import intents
+
+LEGACY_CHAIN = (
+    ("crisis", ['suicide', 'kill myself', 'end my life', 'want to die', 'harm myself']),
+    ("anxiety", ['anxious', 'anxiety', 'panic', 'worried', 'nervous', 'overthinking']),
+    ("depression", ['depressed', 'sad', 'hopeless', 'unmotivated', 'empty', 'worthless']),
+    ("stress", ['stress', 'overwhelmed', 'pressure', 'burnout', 'stressed']),
+    ("sleep", ['sleep', 'insomnia', 'tired', 'exhausted', 'can\'t sleep']),
+    ("relationships", ['relationship', 'partner', 'breakup', 'divorce', 'family', 'friend']),
+    ("work", ['work', 'job', 'school', 'exam', 'study', 'deadline']),
+)
+LEGACY_SERIOUS = ['suicide', 'kill myself', 'end my life', 'want to die', 'harm myself', 'emergency', 'urgent']
+
+SAMPLES = [
+    "hello", "I feel anxious all the time", "I can't sleep at night and I'm exhausted",
+    "My partner and I keep fighting about money", "exams are next week and I am so stressed",
+    "I feel empty and hopeless", "thank you so much for listening", "what services do you offer in Nairobi?",
+    "sometimes I want to die", "it's urgent, please call me", "my boss puts a lot of pressure on me at work",
+    "I have been overthinking everything since the breakup with my girlfriend",
+    "I urgently need help", "we had two emergencies this week", "my workload keeps growing",
+    "homework is piling up", "I have had suicidal thoughts",
+    "feeling worthlessness", "constant nervousness lately", "so much tiredness", "my partners keep fighting",
+    "my family's expectations", "overwhelmed by hopelessness", "I can’t sleep", "the pressures of school",
+]
+
+
+def legacy(message):
+    message_lower = message.lower()
+    serious = any(keyword in message_lower for keyword in LEGACY_SERIOUS)
+    for name, words in LEGACY_CHAIN:
+        if any(word in message_lower for word in words):
+            return name, serious
+    return None, serious
+
+
+def legacy_all(message):
+    """What returning every matched category costs with the old list scans"""
+    message_lower = message.lower()
+    found = [name for name, words in LEGACY_CHAIN if any(word in message_lower for word in words)]
+    serious = any(keyword in message_lower for keyword in LEGACY_SERIOUS)
+    return (found[0] if found else None), serious
+
+
+def legacy_categories(message):
+    message_lower = message.lower()
+    return {name for name, words in LEGACY_CHAIN if any(word in message_lower for word in words)}
+
+
+def regressions(samples):
+    """
+    (text, intent) pairs the substring scan found that the classifier misses:
+    every old keyword on its own, then every sample. Substring hits inside an
+    unrelated word ("exam" in "example") are the only intended losses, and
+    none of the samples contain one.
+    """
+    missed = [(word, name) for name, words in LEGACY_CHAIN for word in words
+              if name not in {match.name for match in intents.classify(word)}]
+    for sample in samples:
+        found = {match.name for match in intents.classify(sample)}
+        missed += [(sample, name) for name in sorted(legacy_categories(sample) - found)]
+    return missed
+
+
+def compiled(message):
+    matches = intents.classify(message)
+    return (matches[0].name if matches else None), any(match.serious for match in matches)
+
+
+def timed(fn, messages, repeats=1):
+    started = time.perf_counter()
+    for message in messages:
+        for _ in range(repeats):
+            fn(message)
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--padding", type=int, default=20, help="filler words added to each message")
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="classifications per message, as in one chat turn")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    filler = "today I was thinking about how things have been going lately".split()
+    messages = [" ".join(rng.choices(filler, k=args.padding) + [rng.choice(SAMPLES)])
+                for _ in range(args.messages)]
+
+    legacy_s = timed(legacy, messages)
+    legacy_all_s = timed(legacy_all, messages)
+    compiled_s = timed(compiled, messages)
+    started = time.perf_counter()
+    intents.classify_batch(messages)
+    batch_s = time.perf_counter() - started
+
+    per = lambda seconds: seconds / len(messages) * 1e6
+    print(f"legacy first match     {legacy_s * 1000:8.1f}ms  ({per(legacy_s):.2f}µs/msg)")
+    print(f"legacy all categories  {legacy_all_s * 1000:8.1f}ms  ({per(legacy_all_s):.2f}µs/msg)")
+    print(f"intents.classify       {compiled_s * 1000:8.1f}ms  ({per(compiled_s):.2f}µs/msg)")
+    print(f"intents.classify_batch {batch_s * 1000:8.1f}ms  ({per(batch_s):.2f}µs/msg)")
+    print(f"\nper chat turn ({args.repeats} lookups of the same message):")
+    turn_legacy = timed(legacy, messages, args.repeats)
+    turn_compiled = timed(compiled, messages, args.repeats)
+    print(f"legacy                 {turn_legacy * 1000:8.1f}ms  ({per(turn_legacy):.2f}µs/turn)")
+    print(f"intents (memoized)     {turn_compiled * 1000:8.1f}ms  ({per(turn_compiled):.2f}µs/turn)")
+    print("\nsample classifications:")
+    for sample in SAMPLES:
+        print(f"  {sample[:60]:<62} legacy={legacy(sample)}  compiled={compiled(sample)}")
+    # Whole-word matching must never drop a message the substring scan treated as serious
+    missed = [sample for sample in SAMPLES if legacy(sample)[1] and not compiled(sample)[1]]
+    print(f"\nserious under legacy but not compiled: {len(missed)} {missed if missed else ''}")
+    missed = regressions(SAMPLES)
+    print(f"intents found by legacy but not compiled: {len(missed)} {missed if missed else ''}")
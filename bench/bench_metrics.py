@@ -0,0 +1,71 @@
+# bench/bench_metrics.py - cost of stage spans, DB statement timing and Server-Timing per request
+"""
+    python bench/bench_metrics.py --requests 3000
+
+Runs the same test-client requests (chat history page, community feed page,
+health check) in a fresh interpreter per mode: metrics off, metrics on, and
+metrics plus Server-Timing. Also reports the cost of one bare span.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from _stats import ROOT, print_summary
+
+MODES = {
+    "off": {"METRICS": "0", "SERVER_TIMING": "0"},
+    "metrics": {"METRICS": "1", "SERVER_TIMING": "0"},
+    "metrics+server-timing": {"METRICS": "1", "SERVER_TIMING": "1"},
+}
+
+WORKER = """
+import json, sys, time
+from app import app
+from models import ChatMessage, CommunityPost, db
+import metrics
+
+requests = int(sys.argv[1])
+with app.app_context():
+    db.session.add_all(ChatMessage(session_id="bench", role="user", content=f"message {i}") for i in range(100))
+    db.session.add_all(CommunityPost(content=f"post {i}", likes=0, views=0, comments_count=0) for i in range(100))
+    db.session.commit()
+
+client = app.test_client()
+paths = ["/api/chat/history/bench?limit=50", "/api/community/posts", "/health"]
+for path in paths:
+    client.get(path)
+samples = []
+for i in range(requests):
+    started = time.perf_counter()
+    client.get(paths[i % len(paths)])
+    samples.append(time.perf_counter() - started)
+
+with app.test_request_context():
+    started = time.perf_counter()
+    for _ in range(100000):
+        with metrics.span("bench"):
+            pass
+    span_us = (time.perf_counter() - started) / 100000 * 1e6
+print(json.dumps({"samples": samples, "span_us": span_us}))
+"""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=3000)
+    args = parser.parse_args()
+
+    for mode, overrides in MODES.items():
+        workdir = tempfile.mkdtemp()
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{workdir}/bench.db", AUTO_CREATE_SCHEMA="1",
+                   LOCAL_STORE_PATH=os.path.join(workdir, "local_store.db"), COUNTER_BACKEND="memory",
+                   **overrides)
+        result = subprocess.run([sys.executable, "-c", WORKER, str(args.requests)], cwd=ROOT, env=env,
+                                capture_output=True, text=True, check=True)
+        data = json.loads(result.stdout.strip().splitlines()[-1])
+        print_summary(mode, data["samples"])
+        print(f"{'':<28} mean={sum(data['samples']) / len(data['samples']) * 1e6:.0f}µs/request  "
+              f"span={data['span_us']:.2f}µs")
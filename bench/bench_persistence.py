@@ -0,0 +1,68 @@
+# bench/bench_persistence.py - commit-per-message versus the write-behind queue
+"""
+    python bench/bench_persistence.py --threads 16 --turns 200
+
+Each thread plays ``--turns`` chat turns against a fresh SQLite file, saving
+the user message and the reply the way chat() does. Reports the latency a
+request spends persisting each message and the overall rows/s.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from _stats import print_summary
+
+
+def run(app, label, threads, turns):
+    from routes_py import save_chat_message
+    import write_behind
+
+    latencies = [[] for _ in range(threads)]
+
+    def worker(index):
+        with app.test_request_context():
+            for turn in range(turns):
+                for role in ("user", "assistant"):
+                    started = time.perf_counter()
+                    save_chat_message(f"bench-{label}-{index}", role, f"{role} message {turn}")
+                    latencies[index].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    if write_behind.ENABLED:
+        write_behind.chat_queue.flush()
+    wall = time.perf_counter() - started
+
+    samples = [sample for per_thread in latencies for sample in per_thread]
+    print_summary(label, samples)
+    print(f"{'':<28} rows={len(samples)}  wall={wall:.2f}s  throughput={len(samples) / wall:.0f} rows/s")
+    if write_behind.ENABLED:
+        stats = write_behind.chat_queue.stats()
+        print(f"{'':<28} flushes={stats['flushes']}  avg batch={stats['avg_batch_size']}  "
+              f"avg flush={stats['avg_flush_ms']}ms  max flush={stats['max_flush_ms']}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--turns", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/bench.db"
+    os.environ["AUTO_CREATE_SCHEMA"] = "1"
+    os.environ["LOCAL_STORE_PATH"] = os.path.join(workdir, "local_store.db")
+
+    from app import app
+    import write_behind
+
+    write_behind.ENABLED = False
+    run(app, "commit per message", args.threads, args.turns)
+    write_behind.ENABLED = True
+    run(app, "write-behind", args.threads, args.turns)
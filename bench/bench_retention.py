@@ -0,0 +1,108 @@
+# bench/bench_retention.py - archive run cost, write latency during deletes, file size and cold vs hot reads
+"""
+    python bench/bench_retention.py --sessions 5000 --turns 40 --expired 0.8
+
+Seeds chat_messages (``--expired`` of the sessions older than the retention
+window), then runs one archive + incremental vacuum while a second thread
+keeps inserting chat turns, so the insert latency shows whether deletes hold
+the write lock for long. Reports the database size before and after, the
+archive size and history read latency for hot vs archived sessions.
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from _stats import print_summary
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def db_size(path):
+    return sum(os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--expired", type=float, default=0.8, help="share of sessions past retention")
+    parser.add_argument("--reads", type=int, default=300)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "bench.db")
+    os.environ.update(DATABASE_URL=f"sqlite:///{db_path}", AUTO_CREATE_SCHEMA="1", CHAT_WRITE_BEHIND="0",
+                      LOCAL_STORE_PATH=os.path.join(workdir, "local_store.db"),
+                      CHAT_ARCHIVE_DIR=os.path.join(workdir, "archive"))
+
+    from datetime import datetime, timedelta
+    from app import app
+    from models import ChatMessage, db
+    import retention
+
+    now = datetime.utcnow()
+    expired = int(args.sessions * args.expired)
+    with app.app_context():
+        for start in range(0, args.sessions, 500):
+            rows = []
+            for s in range(start, min(start + 500, args.sessions)):
+                began = now - timedelta(days=random.randint(retention.RETENTION_DAYS + 1, 400)) if s < expired \
+                    else now - timedelta(hours=random.randint(1, 24 * 30))
+                rows.extend(dict(session_id=f"bench-{s}", role="user" if i % 2 == 0 else "assistant",
+                                 content=f"turn {i} of session {s}: how are you feeling today? " * 4,
+                                 is_mental_health_related=True, created_at=began + timedelta(seconds=30 * i))
+                            for i in range(args.turns))
+            db.session.execute(ChatMessage.__table__.insert(), rows)
+            db.session.commit()
+        db.session.execute(db.text("PRAGMA wal_checkpoint(TRUNCATE)"))
+    size_before = db_size(db_path)
+
+    client = app.test_client()
+
+    def read_latency(session_ids):
+        samples = []
+        for _ in range(args.reads):
+            started = time.perf_counter()
+            client.get(f"/api/chat/history/{random.choice(session_ids)}?before=latest&limit=50")
+            samples.append(time.perf_counter() - started)
+        return samples
+
+    hot_sessions = [f"bench-{s}" for s in range(expired, args.sessions)]
+    old_sessions = [f"bench-{s}" for s in range(expired)]
+    print_summary("history, hot (before)", read_latency(hot_sessions))
+
+    # A writer keeps inserting turns the way live chat does while the job deletes
+    stop = threading.Event()
+    write_samples = []
+
+    def writer():
+        with app.app_context():
+            i = 0
+            while not stop.is_set():
+                started = time.perf_counter()
+                db.session.add(ChatMessage(session_id=f"live-{i % 50}", role="user", content="still here"))
+                db.session.commit()
+                write_samples.append(time.perf_counter() - started)
+                i += 1
+                time.sleep(0.005)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    with app.app_context():
+        result = retention.archive()
+        compacted = retention.compact()
+    stop.set()
+    thread.join()
+
+    print(f"archive: {result['sessions']} sessions, {result['messages_archived']} messages, "
+          f"{result['files']} files in {result['elapsed_ms']:.0f}ms; compact: {compacted}")
+    print_summary("insert during archive", write_samples)
+    print(f"database: {size_before / 1e6:.1f}MB -> {db_size(db_path) / 1e6:.1f}MB   "
+          f"archive: {dir_size(os.environ['CHAT_ARCHIVE_DIR']) / 1e6:.1f}MB")
+    print_summary("history, hot (after)", read_latency(hot_sessions))
+    print_summary("history, archived", read_latency(old_sessions))
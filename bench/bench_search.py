@@ -0,0 +1,122 @@
+# bench/bench_search.py - /api/search at 1M documents: index build, query latency, write overhead, LIKE baseline
+"""
+    python bench/bench_search.py --docs 1000000
+
+Seeds posts, comments and concerns (a 60/30/10 split) from a small
+mental-health vocabulary with a Zipf-like word distribution, builds the
+index with `search.rebuild()`, then times /api/search for common, rare,
+multi-word and prefix queries, a deep page, a LIKE '%term%' scan for the
+same words, and single-row inserts with and without the sync triggers.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from _stats import print_summary
+
+VOCABULARY = (
+    "anxiety stress sleep exams work family therapy breathing panic lonely sad tired hope support friends "
+    "meditation journal counselling grief anger motivation burnout relationship school money worry calm "
+    "exercise walk routine doctor medication appointment weekend morning night talk listen help better "
+    "struggling overwhelmed grateful progress healing recovery mindfulness boundaries self care trust"
+).split()
+FILLER = "i have been feeling really about the and it my with for this that so much lately today".split()
+QUERIES = {
+    "common word": "anxiety",
+    "rare word": "boundaries",
+    "two words": "sleep exams",
+    "three words": "panic morning therapy",
+    "prefix": "medit",
+    "no match": "zebra",
+}
+
+
+def sentence(rng, words):
+    weights = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+    picked = rng.choices(VOCABULARY, weights=weights, k=words // 2) + rng.choices(FILLER, k=words - words // 2)
+    rng.shuffle(picked)
+    return " ".join(picked)
+
+
+def seed(db, models, total, rng):
+    from datetime import datetime, timedelta
+
+    now = datetime.utcnow()
+    posts, comments, concerns = int(total * 0.6), int(total * 0.3), total - int(total * 0.6) - int(total * 0.3)
+    for start in range(0, posts, 20000):
+        db.session.execute(models.CommunityPost.__table__.insert(), [
+            dict(content=sentence(rng, 30), category=rng.choice(VOCABULARY[:10]), likes=0, views=0,
+                 comments_count=0, is_approved=True, is_featured=False,
+                 created_at=now - timedelta(minutes=i)) for i in range(start, min(start + 20000, posts))])
+        db.session.commit()
+    for start in range(0, comments, 20000):
+        db.session.execute(models.PostComment.__table__.insert(), [
+            dict(post_id=rng.randint(1, posts), content=sentence(rng, 15), created_at=now - timedelta(minutes=i))
+            for i in range(start, min(start + 20000, comments))])
+        db.session.commit()
+    for start in range(0, concerns, 20000):
+        db.session.execute(models.Concern.__table__.insert(), [
+            dict(title=sentence(rng, 5), content=sentence(rng, 40), category="general", status="open",
+                 upvotes=0, is_anonymous=False, created_at=now - timedelta(minutes=i))
+            for i in range(start, min(start + 20000, concerns))])
+        db.session.commit()
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=1000000)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--like-runs", type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ.update(DATABASE_URL=f"sqlite:///{workdir}/bench.db", LOCAL_STORE_PATH=os.path.join(workdir, "ls.db"))
+    from app import app
+    import models
+    import search
+    from models import db
+
+    rng = random.Random(7)
+    with app.app_context():
+        # Tables only: the bulk seed should not pay the triggers, rebuild() indexes it in one pass
+        db.create_all()
+        started = time.perf_counter()
+        seed(db, models, args.docs, rng)
+        print(f"seeded {args.docs} documents in {time.perf_counter() - started:.1f}s")
+        documents, seconds = search.rebuild()
+        print(f"rebuild-search: {documents} documents in {seconds:.1f}s")
+
+    client = app.test_client()
+    for label, query in QUERIES.items():
+        client.get("/api/search", query_string={"q": query})
+        print_summary(f"search: {label}", timed(lambda: client.get("/api/search", query_string={"q": query}),
+                                                args.runs))
+    print_summary("search: page 20", timed(
+        lambda: client.get("/api/search", query_string={"q": "sleep", "page": 20}), args.runs))
+
+    with app.app_context():
+        like = db.text("SELECT id FROM community_posts WHERE content LIKE :pattern LIMIT 20 OFFSET 0")
+        for label in ("rare word", "no match"):
+            pattern = f"%{QUERIES[label]}%"
+            print_summary(f"LIKE scan: {label}", timed(
+                lambda: db.session.execute(like, {"pattern": pattern}).all(), args.like_runs))
+
+        def insert_post():
+            db.session.add(models.CommunityPost(content=sentence(rng, 30), category="stress"))
+            db.session.commit()
+
+        print_summary("insert post (triggers)", timed(insert_post, args.runs))
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql("DROP TRIGGER search_posts_ai")
+        print_summary("insert post (no triggers)", timed(insert_post, args.runs))
@@ -0,0 +1,82 @@
+# bench/bench_session_context.py - chat context per turn: ring buffer backends vs the chat_messages query
+"""
+    python bench/bench_session_context.py --sessions 20000 --turns 40 --samples 2000
+
+Seeds chat_messages, then times what one chat turn spends on context for a
+random known session: the indexed "last SESSION_CONTEXT_TURNS messages"
+query it replaces (backend off), and for the memory and shared backends
+the read plus the two appends (user message, reply) every turn also pays.
+Buffers are warmed first, so the shared and memory numbers are hits.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from _stats import print_summary
+
+TEXT = "I have been feeling overwhelmed at work and it keeps me up at night. "
+
+
+def seed(path, sessions, turns):
+    start = datetime(2026, 1, 1)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous=OFF")
+
+    def rows():
+        for s in range(sessions):
+            for t in range(turns):
+                created = (start + timedelta(seconds=s * 3600 + t * 30)).isoformat(" ")
+                yield f"session-{s}", "user" if t % 2 == 0 else "assistant", TEXT * (1 + t % 4), 1, created
+
+    conn.executemany("INSERT INTO chat_messages (session_id, role, content, is_mental_health_related, created_at)"
+                     " VALUES (?, ?, ?, ?, ?)", rows())
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=20000)
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--active", type=int, default=500, help="sessions in the sampled working set")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "bench.db")
+    os.environ.update(DATABASE_URL=f"sqlite:///{db_path}", AUTO_CREATE_SCHEMA="1", CHAT_WRITE_BEHIND="0",
+                      LOCAL_STORE_PATH=os.path.join(workdir, "local_store.db"))
+    from app import app
+    import session_context
+    from routes_py import get_history_for_api
+
+    started = time.perf_counter()
+    seed(db_path, args.sessions, args.turns)
+    print(f"seeded {args.sessions * args.turns} messages in {time.perf_counter() - started:.1f}s")
+
+    rng = random.Random(3)
+    active = [f"session-{i}" for i in rng.sample(range(args.sessions), args.active)]
+    with app.test_request_context():
+        for backend in ("off", "memory", "shared"):
+            session_context.CONTEXT_BACKEND = backend
+            session_context._backend = None
+            for session_id in active:
+                get_history_for_api(session_id)
+            reads, turns = [], []
+            for _ in range(args.samples):
+                session_id = rng.choice(active)
+                started = time.perf_counter()
+                history = get_history_for_api(session_id)
+                reads.append(time.perf_counter() - started)
+                session_context.append(session_id, "user", TEXT)
+                session_context.append(session_id, "assistant", TEXT)
+                turns.append(time.perf_counter() - started)
+                assert history
+            print_summary(f"{backend}: read", reads)
+            print_summary(f"{backend}: read + 2 appends", turns)
+        print("shared:", session_context.stats())
@@ -0,0 +1,74 @@
+# bench/bench_startup.py - worker cold-start cost measured with python -X importtime
+"""
+    python bench/bench_startup.py --runs 5 --top 15
+
+Each run imports ``app`` (what a gunicorn worker does before serving) in a
+fresh interpreter under ``-X importtime`` against an empty SQLite file.
+Reported: wall time of the import, the cumulative import time of ``app``
+and the slowest modules. The ``auto-create-schema`` mode adds the
+create_all/ensure_indexes work that used to run on every import.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+from _stats import ROOT, print_summary
+
+LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+MODES = {
+    "factory": {"AUTO_CREATE_SCHEMA": "0"},
+    "auto-create-schema": {"AUTO_CREATE_SCHEMA": "1"},
+}
+
+
+def run_once(env):
+    """(wall seconds, {module: cumulative µs}, app cumulative µs) for one cold import"""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - started
+
+    modules, app_us = {}, 0
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if not match:
+            continue
+        _, cumulative, indent, name = match.groups()
+        # Only direct imports of top-level modules: deeper entries are already
+        # inside their parent's total
+        if len(indent) == 3:
+            modules[name] = int(cumulative)
+        if name == "app":
+            app_us = int(cumulative)
+    return wall, modules, app_us
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    for mode, overrides in MODES.items():
+        walls, app_times, totals = [], [], {}
+        for _ in range(args.runs):
+            workdir = tempfile.mkdtemp()
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{workdir}/bench.db",
+                       LOCAL_STORE_PATH=os.path.join(workdir, "local_store.db"), **overrides)
+            wall, modules, app_us = run_once(env)
+            walls.append(wall)
+            app_times.append(app_us / 1e6)
+            for name, cumulative in modules.items():
+                totals.setdefault(name, []).append(cumulative)
+
+        print_summary(f"{mode} wall", walls)
+        print_summary(f"{mode} import app", app_times)
+        slowest = sorted(totals.items(), key=lambda item: -sorted(item[1])[len(item[1]) // 2])[:args.top]
+        for name, samples in slowest:
+            print(f"{'':<4}{sorted(samples)[len(samples) // 2] / 1000:>8.1f}ms  {name}")
+        print()
@@ -0,0 +1,80 @@
+# bench/bench_stream.py - time-to-first-byte of /api/chat versus /api/chat/stream
+"""
+    python bench/bench_stream.py --turns 30 --latency-ms 400 --token-ms 25
+
+Starts the Flask app on a local threaded server against the Cohere stub and
+measures, per chat turn, when the first reply text reaches the client and
+when the turn completes.
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from _stats import print_summary
+from cohere_stub import add_stub_arguments, config_from_args, start_stub
+
+
+def start_app():
+    from werkzeug.serving import make_server
+    from app import app
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def blocking_turn(session, base, message, sid):
+    started = time.perf_counter()
+    response = session.post(f"{base}/api/chat", json={"message": message, "session_id": sid})
+    response.json()
+    elapsed = time.perf_counter() - started
+    return elapsed, elapsed
+
+
+def streaming_turn(session, base, message, sid):
+    started = time.perf_counter()
+    first = None
+    with session.post(f"{base}/api/chat/stream", json={"message": message, "session_id": sid},
+                      stream=True) as response:
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: ") and event in ("token", "fallback") and first is None:
+                json.loads(line[6:])
+                first = time.perf_counter() - started
+    return first or 0.0, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=30)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    stub = start_stub(config_from_args(args))
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+    os.environ.setdefault("AUTO_CREATE_SCHEMA", "1")
+    os.environ.setdefault("LOCAL_STORE_PATH", os.path.join(tempfile.mkdtemp(), "local_store.db"))
+    os.environ["COHERE_API_KEY"] = "stub-key"
+    os.environ["COHERE_API_URL"] = stub.url
+
+    import requests
+
+    server, base = start_app()
+    session = requests.Session()
+    for label, turn in (("/api/chat", blocking_turn), ("/api/chat/stream", streaming_turn)):
+        first_bytes, totals = [], []
+        for i in range(args.turns):
+            first, total = turn(session, base, "I have been feeling stressed at work", f"bench-{label}-{i}")
+            first_bytes.append(first)
+            totals.append(total)
+        print_summary(f"{label} first text", first_bytes)
+        print_summary(f"{label} full turn", totals)
+    server.shutdown()
+    stub.shutdown()
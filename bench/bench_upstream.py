@@ -0,0 +1,80 @@
+# bench/bench_upstream.py - p50/p99 of the upstream call: legacy loop vs pooled sequential vs hedged
+"""
+    python bench/bench_upstream.py --requests 200 --concurrency 8 --slow-rate 0.05 --missing command-r-08-2024
+
+Each mode sends the same chat payload through a local Cohere stub and
+reports end-to-end latency of one chat turn's upstream call.
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from _stats import print_summary
+from cohere_stub import add_stub_arguments, config_from_args, start_stub
+
+import cohere_client
+from routes_py import COHERE_MODELS
+
+PAYLOAD = {
+    'message': 'I feel anxious and I cannot sleep',
+    'chat_history': [],
+    'temperature': 0.7,
+    'max_tokens': 800,
+    'prompt_truncation': 'AUTO'
+}
+
+
+def legacy_call(url):
+    """The pre-pooling loop: fresh connection per model, 15s timeout each, no deadline"""
+    for model in COHERE_MODELS:
+        try:
+            response = requests.post(url, json=dict(PAYLOAD, model=model), timeout=15)
+            if response.status_code == 200 and response.json().get('text', '').strip():
+                return True
+        except requests.exceptions.RequestException:
+            continue
+    return False
+
+
+def run(label, fn, total, concurrency):
+    latencies = []
+    failures = 0
+
+    def one(_):
+        started = time.perf_counter()
+        ok = fn()
+        return time.perf_counter() - started, ok
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for elapsed, ok in pool.map(one, range(total)):
+            latencies.append(elapsed)
+            failures += 0 if ok else 1
+    print_summary(label, latencies)
+    if failures:
+        print(f"{'':<28} {failures} turns fell back")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--hedge-delay", type=float, default=cohere_client.HEDGE_DELAY)
+    parser.add_argument("--deadline", type=float, default=cohere_client.CHAT_DEADLINE)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_stub(config_from_args(args))
+    cohere_client.COHERE_API_URL = server.url
+    cohere_client.HEDGE_DELAY = args.hedge_delay
+    print(f"🧪 stub at {server.url}, {args.requests} turns @ concurrency {args.concurrency}\n")
+
+    run("legacy (fresh conn, serial)", lambda: legacy_call(server.url), args.requests, args.concurrency)
+    run("pooled sequential", lambda: cohere_client.chat(
+        "stub-key", PAYLOAD, COHERE_MODELS, mode="sequential", deadline=args.deadline) is not None,
+        args.requests, args.concurrency)
+    run("pooled hedged", lambda: cohere_client.chat(
+        "stub-key", PAYLOAD, COHERE_MODELS, mode="hedged", deadline=args.deadline) is not None,
+        args.requests, args.concurrency)
+    server.shutdown()
@@ -0,0 +1,206 @@
+# bench/cohere_stub.py - local stand-in for the Cohere chat API with injected latency and errors
+"""
+Run standalone:
+
+    python bench/cohere_stub.py --port 8089 --latency-ms 400 --slow-rate 0.05 --slow-ms 8000
+
+then point the app at it with COHERE_API_URL=http://127.0.0.1:8089/v1/chat.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubConfig:
+    """Latency/error profile applied to every request"""
+
+    def __init__(self, latency_ms=300.0, sigma=0.35, slow_rate=0.0, slow_ms=8000.0,
+                 error_rate=0.0, missing_models=(), model_latency_ms=None, seed=None,
+                 token_ms=20.0, stream_break_rate=0.0):
+        self.latency_ms = latency_ms            # median of the lognormal latency
+        self.sigma = sigma                      # lognormal spread
+        self.slow_rate = slow_rate              # fraction of requests that stall
+        self.slow_ms = slow_ms
+        self.error_rate = error_rate            # fraction answered with HTTP 500
+        self.missing_models = set(missing_models)
+        self.model_latency_ms = dict(model_latency_ms or {})
+        self.token_ms = token_ms                # gap between streamed tokens
+        self.stream_break_rate = stream_break_rate  # fraction of streams cut mid-reply
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+
+    def draw(self, model):
+        """Return (status, delay_seconds) for one request"""
+        with self.rng_lock:
+            if model in self.missing_models:
+                return 404, 0.01
+            median = self.model_latency_ms.get(model, self.latency_ms)
+            delay = median * self.rng.lognormvariate(0, self.sigma) / 1000.0
+            if self.rng.random() < self.slow_rate:
+                delay = self.slow_ms / 1000.0
+            status = 500 if self.rng.random() < self.error_rate else 200
+        return status, delay
+
+    def breaks(self):
+        with self.rng_lock:
+            return self.rng.random() < self.stream_break_rate
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, like the real API
+    disable_nagle_algorithm = True
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            payload = {}
+        model = payload.get("model", "")
+        status, delay = self.server.config.draw(model)
+        self.server.count(model, status)
+        self.server.enter()
+        try:
+            self._reply(payload, model, status, delay)
+        finally:
+            self.server.leave()
+
+    def _reply(self, payload, model, status, delay):
+        time.sleep(delay)
+
+        if status == 404:
+            return self._send_json(404, {"message": f"model '{model}' not found"})
+        if status != 200:
+            return self._send_json(status, {"message": "internal server error"})
+        text = f"I hear you. ({model}) Thank you for sharing: {payload.get('message', '')[:60]}"
+        if payload.get("stream"):
+            return self._send_stream(text)
+        # A blocking reply only arrives once every token has been generated
+        time.sleep(len(text.split(" ")) * self.server.config.token_ms / 1000.0)
+        return self._send_json(200, {
+            "text": text,
+            "generation_id": f"stub-{time.time_ns()}",
+            "finish_reason": "COMPLETE"
+        })
+
+    def _write_chunk(self, event):
+        data = (json.dumps(event) + "\n").encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+    def _send_stream(self, text):
+        """Cohere-style newline-delimited JSON events over chunked encoding"""
+        config = self.server.config
+        self.send_response(200)
+        self.send_header("Content-Type", "application/stream+json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._write_chunk({"is_finished": False, "event_type": "stream-start"})
+        words = text.split(" ")
+        cut_at = len(words) // 2 if config.breaks() else None
+        for index, word in enumerate(words):
+            if index == cut_at:
+                self.close_connection = True
+                return
+            self._write_chunk({"is_finished": False, "event_type": "text-generation",
+                               "text": word if index == 0 else " " + word})
+            time.sleep(config.token_ms / 1000.0)
+        self._write_chunk({"is_finished": True, "event_type": "stream-end", "finish_reason": "COMPLETE",
+                           "response": {"text": text}})
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config):
+        super().__init__(address, StubHandler)
+        self.config = config
+        self.requests = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._count_lock = threading.Lock()
+
+    def count(self, model, status):
+        with self._count_lock:
+            key = f"{model}:{status}"
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def enter(self):
+        with self._count_lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def leave(self):
+        with self._count_lock:
+            self.in_flight -= 1
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/chat"
+
+
+def start_stub(config=None, port=0):
+    """Start the stub on a background thread and return the server"""
+    server = StubServer(("127.0.0.1", port), config or StubConfig())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _model_latency(values):
+    result = {}
+    for item in values or []:
+        model, _, ms = item.partition("=")
+        result[model] = float(ms)
+    return result
+
+
+def add_stub_arguments(parser):
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="median upstream latency")
+    parser.add_argument("--sigma", type=float, default=0.35, help="lognormal latency spread")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of stalled requests")
+    parser.add_argument("--slow-ms", type=float, default=8000.0, help="latency of a stalled request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of HTTP 500 replies")
+    parser.add_argument("--missing", nargs="*", default=[], help="models that answer 404")
+    parser.add_argument("--model-latency", nargs="*", default=[], metavar="MODEL=MS",
+                        help="per-model median latency override")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="gap between streamed tokens")
+    parser.add_argument("--stream-break-rate", type=float, default=0.0,
+                        help="fraction of streams cut off mid-reply")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args):
+    return StubConfig(
+        latency_ms=args.latency_ms, sigma=args.sigma, slow_rate=args.slow_rate,
+        slow_ms=args.slow_ms, error_rate=args.error_rate, missing_models=args.missing,
+        model_latency_ms=_model_latency(args.model_latency), seed=args.seed,
+        token_ms=args.token_ms, stream_break_rate=args.stream_break_rate
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Cohere chat API")
+    parser.add_argument("--port", type=int, default=8089)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    server = StubServer(("127.0.0.1", args.port), config_from_args(args))
+    print(f"🧪 Cohere stub listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
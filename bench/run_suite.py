@@ -0,0 +1,306 @@
+# bench/run_suite.py - end-to-end load suite against the app and the Cohere stub, saved as JSON
+"""
+    python bench/run_suite.py --concurrency 1 8 32 --duration 10 --output results.json
+    python bench/run_suite.py --compare bench/results/<baseline>.json --max-regression 0.15
+
+Starts the Cohere stub in-process and the app under gunicorn (or uvicorn
+with ``--server asgi``) against a fresh, seeded SQLite file. Each
+scenario (chat, history, community, static) then runs at each
+concurrency level for ``--duration`` seconds after ``--warmup`` seconds.
+Throughput, error rate and p50/p95/p99 latency are printed and written to
+``--output`` (default bench/results/<commit>-<time>.json).
+
+With ``--compare`` every scenario/concurrency pair present in both runs is
+checked against the baseline. The exit status is 1 when throughput drops,
+or p95 rises, by more than ``--max-regression``, or when the error rate
+rises by more than a percentage point.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from _stats import ROOT, summarize
+from cohere_stub import add_stub_arguments, config_from_args, start_stub
+from bench_concurrency import free_port, wait_ready
+
+SEEDED_SESSIONS = 50
+SEEDED_POSTS = 2000
+
+CHAT_PROMPTS = [
+    "I feel anxious before my exams and cannot sleep",
+    "Work stress is getting to me lately",
+    "How can I support a friend who seems depressed?",
+    "I argued with my family and feel low",
+    "Any tips for calming down quickly?",
+]
+
+STATIC_PATHS = [
+    "/",
+    "/chat",
+    "/static/images/wellmed.jpg",
+    "/static/images/mental.png?w=320&fmt=webp",
+]
+
+
+# --------------------------------------------------
+# Scenarios: (method, path, json body) for worker ``worker``, iteration ``i``
+# --------------------------------------------------
+
+def chat_request(worker, i, rng):
+    # A few turns per session so history and the context builder are exercised; the
+    # numbered message keeps the response cache from answering instead of upstream
+    message = f"{rng.choice(CHAT_PROMPTS)} (turn {worker}.{i})"
+    return "POST", "/api/chat", {"message": message, "session_id": f"suite-{worker}-{i // 5}"}
+
+
+def history_request(worker, i, rng):
+    return "GET", f"/api/chat/history/seed-{rng.randrange(SEEDED_SESSIONS)}?limit=50", None
+
+
+def community_request(worker, i, rng):
+    category = rng.choice([None, None, "anxiety", "stress"])
+    return "GET", "/api/community/posts" + (f"?category={category}" if category else ""), None
+
+
+def static_request(worker, i, rng):
+    return "GET", STATIC_PATHS[i % len(STATIC_PATHS)], None
+
+
+SCENARIOS = {
+    "chat": chat_request,
+    "history": history_request,
+    "community": community_request,
+    "static": static_request,
+}
+
+
+# --------------------------------------------------
+# Setup
+# --------------------------------------------------
+
+def seed_database(env):
+    """Create the schema and seed chat sessions and community posts"""
+    subprocess.run([sys.executable, "-m", "flask", "--app", "app", "bootstrap-db"], env=env, cwd=ROOT,
+                   check=True, stdout=subprocess.DEVNULL)
+    code = f"""
+from datetime import datetime, timedelta
+from app import app
+from models import ChatMessage, CommunityPost, db
+base = datetime(2024, 1, 1)
+with app.app_context():
+    with db.engine.begin() as conn:
+        conn.execute(ChatMessage.__table__.insert(), [
+            {{"session_id": f"seed-{{s}}", "role": "user" if i % 2 == 0 else "assistant",
+              "content": f"seeded message {{i}} " * 10, "is_mental_health_related": True,
+              "created_at": base + timedelta(seconds=s * 1000 + i)}}
+            for s in range({SEEDED_SESSIONS}) for i in range(200)])
+        conn.execute(CommunityPost.__table__.insert(), [
+            {{"author_name": "Anonymous", "content": f"seeded post {{i}}", "category": ["anxiety", "stress", None][i % 3],
+              "likes": 0, "comments_count": 0, "views": 0, "is_approved": True, "is_featured": i % 97 == 0,
+              "created_at": base + timedelta(minutes=i)}}
+            for i in range({SEEDED_POSTS})])
+"""
+    subprocess.run([sys.executable, "-c", code], env=env, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+
+
+def server_command(args, port):
+    if args.server == "asgi":
+        return [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+                "--workers", str(args.workers), "--log-level", "warning"]
+    return [sys.executable, "-m", "gunicorn", "app:app", "-w", str(args.workers), "--threads", str(args.threads),
+            "-b", f"127.0.0.1:{port}", "--timeout", "120", "--log-level", "warning"]
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+
+
+# --------------------------------------------------
+# Load
+# --------------------------------------------------
+
+async def drive(base, scenario, concurrency, warmup, duration, timeout, seed):
+    """Closed-loop load: ``concurrency`` workers each send their next request as soon as one completes"""
+    import httpx
+
+    make_request = SCENARIOS[scenario]
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    started = time.perf_counter()
+    measure_from, stop_at = started + warmup, started + warmup + duration
+    latencies, errors, fallbacks = [], 0, 0
+
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=timeout) as client:
+        async def worker(index):
+            nonlocal errors, fallbacks
+            rng = random.Random(seed * 1000 + index)
+            i = 0
+            while time.perf_counter() < stop_at:
+                method, path, body = make_request(index, i, rng)
+                i += 1
+                sent = time.perf_counter()
+                try:
+                    response = await client.request(method, path, json=body)
+                    ok = response.status_code < 400
+                    fell_back = scenario == "chat" and ok and response.json().get("source") != "cohere"
+                except (httpx.HTTPError, ValueError):
+                    ok, fell_back = False, False
+                done = time.perf_counter()
+                if sent < measure_from or done > stop_at:
+                    continue
+                if ok:
+                    latencies.append(done - sent)
+                    fallbacks += fell_back
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+
+    result = summarize(latencies)
+    total = len(latencies) + errors
+    result.update({
+        "throughput_rps": round(len(latencies) / duration, 2),
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+    })
+    if scenario == "chat":
+        result["fallback_rate"] = round(fallbacks / len(latencies), 4) if latencies else 0.0
+    return result
+
+
+def print_result(scenario, concurrency, result):
+    if not result.get("count"):
+        print(f"{scenario:<10} c={concurrency:<4} no successful requests ({result['errors']} errors)")
+        return
+    extra = f"  fallback={result['fallback_rate']:.1%}" if "fallback_rate" in result else ""
+    print(f"{scenario:<10} c={concurrency:<4} rps={result['throughput_rps']:>8.1f}  "
+          f"p50={result['p50_ms']:>8.1f}ms  p95={result['p95_ms']:>8.1f}ms  p99={result['p99_ms']:>8.1f}ms  "
+          f"errors={result['error_rate']:.1%}{extra}")
+
+
+# --------------------------------------------------
+# Regression gate
+# --------------------------------------------------
+
+def compare(baseline, current, max_regression, min_delta_ms):
+    """Print a comparison table; return the list of regressions"""
+    regressions = []
+    print(f"\n{'scenario':<10} {'conc':>4}  {'rps base':>9} {'rps now':>9}  {'p95 base':>9} {'p95 now':>9}")
+    for scenario, levels in current["results"].items():
+        for concurrency, now in levels.items():
+            base = baseline.get("results", {}).get(scenario, {}).get(concurrency)
+            if not base or not base.get("count") or not now.get("count"):
+                continue
+            problems = []
+            if now["throughput_rps"] < base["throughput_rps"] * (1 - max_regression):
+                problems.append("throughput")
+            if now["p95_ms"] > base["p95_ms"] * (1 + max_regression) and now["p95_ms"] - base["p95_ms"] > min_delta_ms:
+                problems.append("p95")
+            if now["error_rate"] > base["error_rate"] + 0.01:
+                problems.append("errors")
+            flag = f"  REGRESSION: {', '.join(problems)}" if problems else ""
+            print(f"{scenario:<10} {concurrency:>4}  {base['throughput_rps']:>9.1f} {now['throughput_rps']:>9.1f}  "
+                  f"{base['p95_ms']:>8.1f}ms {now['p95_ms']:>8.1f}ms{flag}")
+            if problems:
+                regressions.append((scenario, concurrency, problems))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="*", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="*", type=int, default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds per level")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--server", choices=["gunicorn", "asgi"], default="gunicorn")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument("--output", help="JSON results path")
+    parser.add_argument("--compare", metavar="BASELINE", help="earlier results JSON to gate against")
+    parser.add_argument("--max-regression", type=float, default=0.15)
+    parser.add_argument("--min-delta-ms", type=float, default=2.0,
+                        help="p95 increases smaller than this never count as regressions")
+    add_stub_arguments(parser)
+    parser.set_defaults(latency_ms=300.0, token_ms=2.0, seed=1)
+    args = parser.parse_args()
+
+    stub = start_stub(config_from_args(args))
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{workdir}/bench.db",
+               LOCAL_STORE_PATH=os.path.join(workdir, "local_store.db"),
+               IMAGE_CACHE_DIR=os.path.join(workdir, "image_cache"),
+               COHERE_API_KEY="stub-key",
+               COHERE_API_URL=stub.url,
+               # Estimated token counts: no tokenizer download during a run
+               CONTEXT_TOKENIZER="",
+               WEB_CONCURRENCY=str(args.workers))
+    seed_database(env)
+
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(server_command(args, port), cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    results = {}
+    try:
+        wait_ready(base)
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                result = asyncio.run(drive(base, scenario, concurrency, args.warmup, args.duration,
+                                           args.timeout, args.seed or 0))
+                results.setdefault(scenario, {})[str(concurrency)] = result
+                print_result(scenario, concurrency, result)
+    finally:
+        process.terminate()
+        process.wait()
+        stub.shutdown()
+
+    commit, dirty = git_revision()
+    report = {
+        "meta": {
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "server": args.server,
+            "workers": args.workers,
+            "threads": args.threads,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "stub": {name: getattr(args, name) for name in
+                     ("latency_ms", "sigma", "slow_rate", "slow_ms", "error_rate", "missing", "token_ms", "seed")},
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        ROOT, "bench", "results", f"{commit}{'-dirty' if dirty else ''}-{datetime.utcnow():%Y%m%dT%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {os.path.relpath(output)}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.max_regression, args.min_delta_ms)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) against {args.compare}")
+            sys.exit(1)
+        print(f"\n✅ No regressions against {args.compare}")
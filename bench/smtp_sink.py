@@ -0,0 +1,116 @@
+# bench/smtp_sink.py - local SMTP server that accepts and counts mail, with tunable latency and failures
+"""
+    python bench/smtp_sink.py --port 2525 --greeting-ms 300 --fail-rate 0.1
+
+Point the app at it with SMTP_HOST=127.0.0.1 SMTP_PORT=2525 SMTP_STARTTLS=0.
+``--greeting-ms`` stands in for the TCP + TLS + AUTH handshake a real relay
+costs per connection; ``--fail-rate`` answers that share of messages with a
+temporary 451 so retries can be exercised.
+"""
+import argparse
+import random
+import socketserver
+import threading
+import time
+from email import message_from_bytes
+
+
+class SinkConfig:
+    def __init__(self, greeting_ms=300.0, message_ms=5.0, fail_rate=0.0, seed=None):
+        self.greeting_ms = greeting_ms
+        self.message_ms = message_ms
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        config = server.config
+        with server.lock:
+            server.connections += 1
+        time.sleep(config.greeting_ms / 1000)
+        self.reply("220 smtp-sink ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line.decode("ascii", "replace").strip().split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self.wfile.write(b"250-smtp-sink\r\n250-8BITMIME\r\n250 SIZE 10485760\r\n")
+            elif verb in ("HELO", "MAIL", "RCPT", "RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk == b".\r\n":
+                        break
+                    data.append(chunk[1:] if chunk.startswith(b"..") else chunk)
+                time.sleep(config.message_ms / 1000)
+                with server.lock:
+                    failed = config.random.random() < config.fail_rate
+                    if failed:
+                        server.temp_failures += 1
+                    else:
+                        server.messages.append(message_from_bytes(b"".join(data)))
+                self.reply("451 Try again later" if failed else "250 Queued")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, config):
+        super().__init__(address, SinkHandler)
+        self.config = config
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.temp_failures = 0
+        self.messages = []
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+def start_sink(config=None, port=0):
+    """Start the sink on a background thread and return the server"""
+    server = SinkServer(("127.0.0.1", port), config or SinkConfig())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_sink_arguments(parser):
+    parser.add_argument("--greeting-ms", type=float, default=300.0, help="per-connection handshake cost")
+    parser.add_argument("--message-ms", type=float, default=5.0, help="per-message accept time")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of messages answered 451")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args):
+    return SinkConfig(args.greeting_ms, args.message_ms, args.fail_rate, args.seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=2525)
+    add_sink_arguments(parser)
+    args = parser.parse_args()
+    sink = start_sink(config_from_args(args), args.port)
+    print(f"📮 SMTP sink on 127.0.0.1:{sink.port}")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"messages={len(sink.messages)} connections={sink.connections} 451s={sink.temp_failures}")
+    except KeyboardInterrupt:
+        sink.shutdown()
@@ -0,0 +1,401 @@
+# cohere_client.py - pooled, hedged upstream client for the Cohere chat API
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# Configuration
+# --------------------------------------------------
+
+COHERE_API_URL = os.getenv("COHERE_API_URL", "https://api.cohere.com/v1/chat")
+
+# 'hedged' races backup models after a head start, 'sequential' tries one at a time
+DISPATCH_MODE = os.getenv("COHERE_DISPATCH", "hedged")
+HEDGE_DELAY = float(os.getenv("COHERE_HEDGE_DELAY", "1.5"))      # primary model head start (s)
+MAX_PARALLEL = int(os.getenv("COHERE_MAX_PARALLEL", "3"))        # models in flight at once
+ATTEMPT_TIMEOUT = float(os.getenv("COHERE_ATTEMPT_TIMEOUT", "15"))
+CHAT_DEADLINE = float(os.getenv("COHERE_CHAT_DEADLINE", "20"))   # whole chat turn budget (s)
+STREAM_READ_TIMEOUT = float(os.getenv("COHERE_STREAM_READ_TIMEOUT", "10"))  # max gap between events
+POOL_SIZE = int(os.getenv("COHERE_POOL_SIZE", "32"))              # keep-alive connections kept
+# Abandoned hedges keep a thread until their timeout, so size this above POOL_SIZE
+MAX_WORKERS = int(os.getenv("COHERE_MAX_WORKERS", "64"))
+# Losing attempts still waiting on upstream, per process, before new hedges
+# are held back: a slow upstream would otherwise see every turn twice
+MAX_ABANDONED = int(os.getenv("COHERE_MAX_ABANDONED", "8"))
+# The async client needs no thread per request, so it can hold far more connections
+ASYNC_MAX_CONNECTIONS = int(os.getenv("COHERE_ASYNC_MAX_CONNECTIONS", "500"))
+
+_session = None
+_async_client = None
+_executor = None
+_lock = threading.Lock()
+_attempt_hooks = []
+_abandoned = 0
+
+
+class AttemptResult:
+    """Outcome of a single model attempt"""
+
+    __slots__ = ("model", "text", "status", "error", "elapsed")
+
+    def __init__(self, model, text=None, status=None, error=None, elapsed=0.0):
+        self.model = model
+        self.text = text
+        self.status = status
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return bool(self.text)
+
+
+def get_session():
+    """Return the process-wide keep-alive session, creating it on first use"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                # requests is imported here, on the first upstream call, not at worker boot
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="cohere")
+    return _executor
+
+
+def add_attempt_hook(fn):
+    """Register ``fn(AttemptResult)`` to be called after every model attempt"""
+    if fn not in _attempt_hooks:
+        _attempt_hooks.append(fn)
+
+
+def _notify(result):
+    for hook in _attempt_hooks:
+        try:
+            hook(result)
+        except Exception as e:
+            logger.warning("Attempt hook %r failed: %s", hook, e)
+    return result
+
+
+def _headers(api_key):
+    return {
+        'Authorization': f'Bearer {api_key}',
+        'Content-Type': 'application/json',
+        'Accept': 'application/json'
+    }
+
+
+def attempt(api_key, model, payload, timeout):
+    """POST one chat request for a single model over the pooled session"""
+    started = time.perf_counter()
+    try:
+        response = get_session().post(
+            COHERE_API_URL,
+            headers=_headers(api_key),
+            json=dict(payload, model=model),
+            timeout=timeout
+        )
+        elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            return _notify(AttemptResult(model, status=response.status_code, elapsed=elapsed))
+        text = response.json().get('text', '').strip()
+        return _notify(AttemptResult(model, text=text, status=200, elapsed=elapsed))
+    except Exception as e:
+        return _notify(AttemptResult(model, error=e, elapsed=time.perf_counter() - started))
+
+
+def _remaining(deadline_at):
+    return deadline_at - time.monotonic()
+
+
+def _abandon(future):
+    """Count a running loser until upstream answers it; returns False if it never started"""
+    global _abandoned
+    if future.cancel():
+        return False
+    with _lock:
+        _abandoned += 1
+
+    def release(_):
+        global _abandoned
+        with _lock:
+            _abandoned -= 1
+
+    future.add_done_callback(release)
+    return True
+
+
+def abandoned():
+    """Losing attempts of this process still waiting on upstream"""
+    return _abandoned
+
+
+def chat_sequential(api_key, payload, models, deadline=None):
+    """Try models one at a time until one answers or the deadline passes"""
+    deadline_at = time.monotonic() + (CHAT_DEADLINE if deadline is None else deadline)
+    for model in models:
+        remaining = _remaining(deadline_at)
+        if remaining <= 0:
+            logger.debug("Chat deadline reached before trying %s", model)
+            break
+        result = attempt(api_key, model, payload, min(ATTEMPT_TIMEOUT, remaining))
+        if result.ok:
+            return result
+        logger.debug("Model %s failed: %s", model, result.error or result.status)
+    return None
+
+
+def chat_hedged(api_key, payload, models, deadline=None, hedge_delay=None):
+    """
+    Race models against each other.
+
+    The first model gets a head start of ``hedge_delay`` seconds; if it has not
+    answered by then the next model is raised alongside it, up to MAX_PARALLEL
+    in flight. A failed attempt immediately frees its slot for the next model.
+    The first non-empty reply wins. Losers that have not started are
+    cancelled; running ones cannot be interrupted and are abandoned, keeping
+    their thread and connection until upstream answers. While MAX_ABANDONED
+    of those are outstanding no new hedges are raised (failed attempts are
+    still replaced).
+    """
+    deadline_at = time.monotonic() + (CHAT_DEADLINE if deadline is None else deadline)
+    hedge_delay = HEDGE_DELAY if hedge_delay is None else hedge_delay
+    executor = _get_executor()
+    queue = list(models)
+    in_flight = set()
+
+    def launch():
+        remaining = _remaining(deadline_at)
+        if not queue or remaining <= 0:
+            return False
+        model = queue.pop(0)
+        in_flight.add(executor.submit(attempt, api_key, model, payload, min(ATTEMPT_TIMEOUT, remaining)))
+        return True
+
+    launch()
+    try:
+        while in_flight:
+            remaining = _remaining(deadline_at)
+            if remaining <= 0:
+                logger.debug("Chat deadline reached with %d attempts in flight", len(in_flight))
+                return None
+
+            can_hedge = queue and len(in_flight) < MAX_PARALLEL and _abandoned < MAX_ABANDONED
+            timeout = min(hedge_delay, remaining) if can_hedge else remaining
+            done, in_flight = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                result = future.result()
+                if result.ok:
+                    return result
+                logger.debug("Model %s failed: %s", result.model, result.error or result.status)
+
+            if done:
+                # Each failed attempt is replaced straight away
+                for _ in done:
+                    launch()
+            elif can_hedge:
+                launch()
+        return None
+    finally:
+        # Queued losers never start; running ones are bounded by their
+        # attempt timeout and their result is discarded
+        for future in in_flight:
+            _abandon(future)
+
+
+def chat(api_key, payload, models, mode=None, deadline=None):
+    """Dispatch a chat payload across ``models``; returns the winning AttemptResult or None"""
+    mode = mode or DISPATCH_MODE
+    if mode == "sequential":
+        return chat_sequential(api_key, payload, models, deadline=deadline)
+    return chat_hedged(api_key, payload, models, deadline=deadline)
+
+
+class StreamError(Exception):
+    """Upstream stream broke after tokens were already delivered"""
+
+
+def _open_stream(api_key, model, payload, timeout):
+    """Start a streaming request; returns the open response or an AttemptResult on failure"""
+    started = time.perf_counter()
+    try:
+        response = get_session().post(
+            COHERE_API_URL,
+            headers=_headers(api_key),
+            json=dict(payload, model=model, stream=True),
+            timeout=(min(timeout, 5.0), min(timeout, STREAM_READ_TIMEOUT)),
+            stream=True
+        )
+    except Exception as e:
+        return _notify(AttemptResult(model, error=e, elapsed=time.perf_counter() - started))
+    if response.status_code != 200:
+        response.close()
+        return _notify(AttemptResult(model, status=response.status_code,
+                                     elapsed=time.perf_counter() - started))
+    return response
+
+
+def stream_chat(api_key, payload, models, deadline=None):
+    """
+    Yield reply text chunks as the upstream generates them.
+
+    Models are tried in order until one accepts the stream. Once a chunk has
+    been yielded the model is committed: a later failure raises StreamError so
+    the caller can switch to its fallback. Returns without yielding when no
+    model could be opened before the deadline.
+    """
+    deadline_at = time.monotonic() + (CHAT_DEADLINE if deadline is None else deadline)
+    for model in models:
+        remaining = _remaining(deadline_at)
+        if remaining <= 0:
+            logger.debug("Chat deadline reached before streaming from %s", model)
+            return
+        started = time.perf_counter()
+        response = _open_stream(api_key, model, payload, min(ATTEMPT_TIMEOUT, remaining))
+        if isinstance(response, AttemptResult):
+            logger.debug("Model %s refused stream: %s", model, response.error or response.status)
+            continue
+
+        parts = []
+        try:
+            with response:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    event_type = event.get('event_type')
+                    if event_type == 'text-generation':
+                        text = event.get('text', '')
+                        if text:
+                            parts.append(text)
+                            yield text
+                    elif event_type == 'stream-end':
+                        if event.get('finish_reason') not in (None, 'COMPLETE', 'MAX_TOKENS'):
+                            raise StreamError(f"stream ended with {event.get('finish_reason')}")
+                        break
+        except Exception as e:
+            _notify(AttemptResult(model, error=e, elapsed=time.perf_counter() - started))
+            if parts:
+                raise StreamError(str(e)) from e
+            logger.debug("Model %s stream failed before first token: %s", model, e)
+            continue
+
+        result = _notify(AttemptResult(model, text=''.join(parts).strip(), status=200,
+                                       elapsed=time.perf_counter() - started))
+        if result.ok:
+            logger.debug("Streamed reply from %s", model)
+            return
+
+
+# --------------------------------------------------
+# Async (ASGI) path
+# --------------------------------------------------
+
+def get_async_client():
+    """Return the process-wide httpx.AsyncClient, creating it on first use"""
+    global _async_client
+    if _async_client is None:
+        import httpx
+
+        _async_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS, max_keepalive_connections=POOL_SIZE),
+            timeout=ATTEMPT_TIMEOUT
+        )
+    return _async_client
+
+
+async def aattempt(api_key, model, payload, timeout):
+    """Async twin of ``attempt``; hooks run on a worker thread so the loop never blocks"""
+    started = time.perf_counter()
+    try:
+        response = await get_async_client().post(
+            COHERE_API_URL,
+            headers=_headers(api_key),
+            json=dict(payload, model=model),
+            timeout=timeout
+        )
+        elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            result = AttemptResult(model, status=response.status_code, elapsed=elapsed)
+        else:
+            text = response.json().get('text', '').strip()
+            result = AttemptResult(model, text=text, status=200, elapsed=elapsed)
+    except Exception as e:
+        result = AttemptResult(model, error=e, elapsed=time.perf_counter() - started)
+    asyncio.get_running_loop().run_in_executor(_get_executor(), _notify, result)
+    return result
+
+
+async def achat(api_key, payload, models, deadline=None, hedge_delay=None):
+    """
+    Hedged dispatch on the event loop.
+
+    Same policy as ``chat_hedged`` (head start, up to MAX_PARALLEL in flight,
+    whole-turn deadline), but losing attempts are truly cancelled.
+    COHERE_DISPATCH=sequential gives a single attempt in flight at a time.
+    """
+    deadline_at = time.monotonic() + (CHAT_DEADLINE if deadline is None else deadline)
+    hedge_delay = HEDGE_DELAY if hedge_delay is None else hedge_delay
+    max_parallel = 1 if DISPATCH_MODE == "sequential" else MAX_PARALLEL
+    queue = list(models)
+    in_flight = set()
+
+    def launch():
+        remaining = _remaining(deadline_at)
+        if not queue or remaining <= 0:
+            return False
+        model = queue.pop(0)
+        in_flight.add(asyncio.ensure_future(
+            aattempt(api_key, model, payload, min(ATTEMPT_TIMEOUT, remaining))))
+        return True
+
+    launch()
+    try:
+        while in_flight:
+            remaining = _remaining(deadline_at)
+            if remaining <= 0:
+                logger.debug("Chat deadline reached with %d attempts in flight", len(in_flight))
+                return None
+
+            can_hedge = queue and len(in_flight) < max_parallel
+            timeout = min(hedge_delay, remaining) if can_hedge else remaining
+            done, in_flight = await asyncio.wait(in_flight, timeout=timeout,
+                                                 return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                result = task.result()
+                if result.ok:
+                    return result
+                logger.debug("Model %s failed: %s", result.model, result.error or result.status)
+
+            if done:
+                for _ in done:
+                    launch()
+            elif can_hedge:
+                launch()
+        return None
+    finally:
+        for task in in_flight:
+            task.cancel()
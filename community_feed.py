@@ -0,0 +1,257 @@
+# community_feed.py - keyset-paginated community feed with a short-lived page cache
+import os
+import json
+import time
+import base64
+import binascii
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import event, select, tuple_
+from sqlalchemy.orm import Session
+
+from models import CommunityPost, PostComment, db
+
+# --------------------------------------------------
+# Configuration
+# --------------------------------------------------
+
+FEED_PAGE_SIZE = 20
+FEED_MAX_PAGE_SIZE = 100
+FEED_TOP_COMMENTS = int(os.getenv("FEED_TOP_COMMENTS", "3"))
+FEED_CACHE_TTL = float(os.getenv("FEED_CACHE_TTL", "10"))
+FEED_CACHE_MAX_PAGES = int(os.getenv("FEED_CACHE_MAX_PAGES", "256"))
+FEED_COUNTS_MAX_POSTS = int(os.getenv("FEED_COUNTS_MAX_POSTS", "10000"))
+
+GENERATION_NAMESPACE = "community_feed"
+
+_pages = OrderedDict()   # (generation, category, cursor, limit) -> (expires_at, page, next_cursor)
+_pages_lock = threading.Lock()
+# Counters change far more often than content, so they are cached apart from
+# the pages: post_id -> (counts generation, views, likes, comments_count)
+_counts = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "invalidations": 0, "count_refreshes": 0}
+
+
+# --------------------------------------------------
+# Cursors
+# --------------------------------------------------
+
+def encode_cursor(post):
+    raw = json.dumps([bool(post.is_featured), post.created_at.isoformat(), post.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(is_featured, created_at, id) of the last post on the previous page; ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        featured, created_at, post_id = json.loads(raw)
+        return bool(featured), datetime.fromisoformat(created_at), int(post_id)
+    except (UnicodeDecodeError, binascii.Error, ValueError, TypeError) as e:
+        raise ValueError(f"invalid cursor: {cursor}") from e
+
+
+# --------------------------------------------------
+# Queries
+# --------------------------------------------------
+
+def fetch_page(category=None, cursor=None, limit=FEED_PAGE_SIZE):
+    """Approved posts, featured first then newest; returns (posts, has_more)"""
+    query = CommunityPost.query.filter(CommunityPost.is_approved.is_(True))
+    if category:
+        query = query.filter(CommunityPost.category == category)
+    if cursor is not None:
+        # Row-value comparison, so the feed index is walked from the cursor
+        # instead of skipping OFFSET rows
+        featured, created_at, post_id = cursor
+        query = query.filter(tuple_(CommunityPost.is_featured, CommunityPost.created_at, CommunityPost.id)
+                             < tuple_(featured, created_at, post_id))
+    posts = query.order_by(CommunityPost.is_featured.desc(),
+                           CommunityPost.created_at.desc(),
+                           CommunityPost.id.desc())\
+        .limit(limit + 1)\
+        .all()
+    return posts[:limit], len(posts) > limit
+
+
+def top_comments(post_ids, per_post=FEED_TOP_COMMENTS):
+    """Newest ``per_post`` comments for each post, in one query"""
+    if not post_ids or per_post <= 0:
+        return {}
+    # For each post a correlated LIMIT picks its newest comment ids from the
+    # (post_id, created_at, id) index, so a post with thousands of comments
+    # costs the same as one with three.
+    newest = select(PostComment.id)\
+        .where(PostComment.post_id == CommunityPost.id)\
+        .order_by(PostComment.created_at.desc(), PostComment.id.desc())\
+        .limit(per_post)\
+        .correlate(CommunityPost)
+    rows = db.session.execute(
+        select(PostComment.id, PostComment.post_id, PostComment.author_name,
+               PostComment.content, PostComment.created_at)
+        .select_from(CommunityPost)
+        .join(PostComment, PostComment.id.in_(newest))
+        .where(CommunityPost.id.in_(post_ids))
+        .order_by(PostComment.post_id, PostComment.created_at.desc(), PostComment.id.desc())
+    )
+    comments = {}
+    for row in rows:
+        comments.setdefault(row.post_id, []).append(serialize_comment(row))
+    return comments
+
+
+def serialize_comment(comment):
+    return {
+        'id': comment.id,
+        'author': comment.author_name or 'Anonymous',
+        'content': comment.content,
+        'createdAt': comment.created_at.isoformat() if comment.created_at else None,
+    }
+
+
+def serialize_post(post, comments=()):
+    """Field names the community page reads"""
+    return {
+        'id': post.id,
+        'author': post.author_name or 'Anonymous',
+        'content': post.content,
+        'category': post.category,
+        'likes': post.likes or 0,
+        'comments': post.comments_count or 0,
+        'views': post.views or 0,
+        'featured': bool(post.is_featured),
+        'createdAt': post.created_at.isoformat() if post.created_at else None,
+        'topComments': list(comments),
+    }
+
+
+def build_page(category=None, cursor=None, limit=FEED_PAGE_SIZE):
+    """Serialized posts of one page and the cursor of the next page, if any"""
+    posts, has_more = fetch_page(category, decode_cursor(cursor) if cursor else None, limit)
+    comments = top_comments([post.id for post in posts])
+    page = tuple(serialize_post(post, comments.get(post.id, ())) for post in posts)
+    return page, (encode_cursor(posts[-1]) if has_more else None)
+
+
+# --------------------------------------------------
+# Page cache
+# --------------------------------------------------
+
+def generation():
+    """Feed version shared by every worker; bumped whenever posts or comments change"""
+    from local_store import get_store
+
+    return get_store().get(GENERATION_NAMESPACE, "generation", 0)
+
+
+def bump_generation():
+    from local_store import get_store
+
+    get_store().update(GENERATION_NAMESPACE, "generation", lambda value: (value or 0) + 1)
+    _stats["invalidations"] += 1
+
+
+def counts_generation():
+    from local_store import get_store
+
+    return get_store().get(GENERATION_NAMESPACE, "counts_generation", 0)
+
+
+def bump_counts_generation():
+    """Called after counter flushes: refreshes counts without dropping cached pages"""
+    from local_store import get_store
+
+    get_store().update(GENERATION_NAMESPACE, "counts_generation", lambda value: (value or 0) + 1)
+
+
+def current_counts(post_ids):
+    """{post_id: (views, likes, comments_count)} as of the last counter flush; one PK query on a miss"""
+    current = counts_generation()
+    with _pages_lock:
+        found = {post_id: _counts[post_id][1:] for post_id in post_ids
+                 if post_id in _counts and _counts[post_id][0] == current}
+    missing = [post_id for post_id in post_ids if post_id not in found]
+    if missing:
+        rows = db.session.execute(
+            select(CommunityPost.id, CommunityPost.views, CommunityPost.likes, CommunityPost.comments_count)
+            .where(CommunityPost.id.in_(missing)))
+        with _pages_lock:
+            _stats["count_refreshes"] += 1
+            for post_id, views, likes, comments in rows:
+                found[post_id] = (views or 0, likes or 0, comments or 0)
+                _counts[post_id] = (current,) + found[post_id]
+                _counts.move_to_end(post_id)
+            while len(_counts) > FEED_COUNTS_MAX_POSTS:
+                _counts.popitem(last=False)
+    return found
+
+
+def with_counts(page):
+    """Serialized posts of a (possibly cached) page with their current flushed counts"""
+    counts = current_counts([post['id'] for post in page])
+    result = []
+    for post in page:
+        if post['id'] in counts:
+            views, likes, comments = counts[post['id']]
+            post = dict(post, views=views, likes=likes, comments=comments)
+        result.append(post)
+    return result
+
+
+def get_page(category=None, cursor=None, limit=FEED_PAGE_SIZE):
+    """build_page behind a per-worker TTL cache keyed on the shared generation"""
+    if FEED_CACHE_TTL <= 0:
+        return build_page(category, cursor, limit)
+
+    key = (generation(), category, cursor, limit)
+    now = time.time()
+    with _pages_lock:
+        item = _pages.get(key)
+        if item is not None and item[0] > now:
+            _pages.move_to_end(key)
+            _stats["hits"] += 1
+            return item[1], item[2]
+        _stats["misses"] += 1
+
+    page, next_cursor = build_page(category, cursor, limit)
+    with _pages_lock:
+        _pages[key] = (now + FEED_CACHE_TTL, page, next_cursor)
+        _pages.move_to_end(key)
+        # Entries from older generations can never be hit again; they age out here
+        while len(_pages) > FEED_CACHE_MAX_PAGES:
+            _pages.popitem(last=False)
+    return page, next_cursor
+
+
+def stats():
+    with _pages_lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return dict(_stats, pages=len(_pages), generation=generation(), counted_posts=len(_counts),
+                    hit_ratio=round(_stats["hits"] / lookups, 4) if lookups else 0.0)
+
+
+# --------------------------------------------------
+# Invalidation
+# --------------------------------------------------
+
+@event.listens_for(Session, "after_flush")
+def _mark_feed_changes(session, flush_context):
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, (CommunityPost, PostComment)):
+            session.info["community_feed_changed"] = True
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_feed(session):
+    # Bumped only once the rows are visible, so a concurrent miss cannot
+    # cache the old page under the new generation
+    if session.info.pop("community_feed_changed", False):
+        bump_generation()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_feed_changes(session):
+    session.info.pop("community_feed_changed", None)
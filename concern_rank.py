@@ -0,0 +1,276 @@
+# concern_rank.py - precomputed hot/new/unanswered ordering for the concerns board
+import os
+import json
+import math
+import time
+import base64
+import logging
+import binascii
+import threading
+from datetime import datetime
+
+import click
+from sqlalchemy import event, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+
+from models import Concern, ConcernRank, db
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# Configuration
+# --------------------------------------------------
+
+CONCERN_PAGE_SIZE = 20
+CONCERN_MAX_PAGE_SIZE = 100
+# Each this many hours of age costs as much hot score as a 10x difference in
+# upvotes. Age enters as a constant offset from creation, so a row's score
+# only moves when its upvotes do; nothing has to be re-scored on a timer.
+CONCERN_HOT_DECAY_HOURS = float(os.getenv("CONCERN_HOT_DECAY_HOURS", "24"))
+REBUILD_BATCH = 5000
+SYNC_CHUNK = 500
+
+SORTS = ("hot", "new", "unanswered")
+HOT_EPOCH = datetime(2024, 1, 1)
+
+# Board states, highest first: open concerns lead the hot list
+OPEN, RESPONDED, CLOSED = 2, 1, 0
+
+# Concern columns that feed a ConcernRank row
+RANKED_FIELDS = ("upvotes", "status", "response", "category", "created_at")
+
+_populated = False
+_populate_lock = threading.Lock()
+
+
+# --------------------------------------------------
+# Scoring
+# --------------------------------------------------
+
+def state_of(status, response):
+    if status == "closed":
+        return CLOSED
+    if status == "responded" or response:
+        return RESPONDED
+    return OPEN
+
+
+def hot_score(upvotes, created_at):
+    age = (created_at - HOT_EPOCH).total_seconds() / (CONCERN_HOT_DECAY_HOURS * 3600)
+    return math.log10(max(upvotes or 0, 0) + 1) + age
+
+
+def rank_row(concern):
+    created_at = concern.created_at or datetime.utcnow()
+    return {
+        "concern_id": concern.id,
+        "category": concern.category or "",
+        "state": state_of(concern.status, concern.response),
+        "hot_score": hot_score(concern.upvotes, created_at),
+        "created_at": created_at,
+    }
+
+
+# --------------------------------------------------
+# Maintenance
+# --------------------------------------------------
+
+def _source_rows():
+    table = Concern.__table__
+    return select(table.c.id, table.c.category, table.c.status, table.c.response,
+                  table.c.upvotes, table.c.created_at)
+
+
+def sync(conn, concern_ids):
+    """Recompute the rank rows of ``concern_ids`` on ``conn``; deleted concerns lose theirs"""
+    ids = sorted(set(concern_ids))
+    rank = ConcernRank.__table__
+    for start in range(0, len(ids), SYNC_CHUNK):
+        chunk = ids[start:start + SYNC_CHUNK]
+        rows = [rank_row(row) for row in conn.execute(_source_rows().where(Concern.__table__.c.id.in_(chunk)))]
+        conn.execute(rank.delete().where(rank.c.concern_id.in_(chunk)))
+        if rows:
+            conn.execute(rank.insert(), rows)
+
+
+def rebuild(batch=REBUILD_BATCH):
+    """Re-rank every concern from scratch; returns (rows, seconds)"""
+    started = time.perf_counter()
+    rank = ConcernRank.__table__
+    total = 0
+    last_id = 0
+    with db.engine.begin() as conn:
+        conn.execute(rank.delete())
+        while True:
+            rows = [rank_row(row) for row in conn.execute(
+                _source_rows().where(Concern.__table__.c.id > last_id).order_by(Concern.__table__.c.id).limit(batch))]
+            if not rows:
+                break
+            conn.execute(rank.insert(), rows)
+            total += len(rows)
+            last_id = rows[-1]["concern_id"]
+    return total, time.perf_counter() - started
+
+
+def ensure_populated():
+    """
+    Backfill the rank table the first time it is found empty next to
+    existing concerns. bootstrap-db runs this on deploy; the first board
+    read in each worker runs it too, so concerns that predate the table
+    never drop off the board when the schema was created some other way.
+    """
+    global _populated
+    if _populated:
+        return
+    with _populate_lock:
+        if _populated:
+            return
+        if db.session.query(ConcernRank.concern_id).first() is None \
+                and db.session.query(Concern.id).first() is not None:
+            db.session.rollback()
+            try:
+                rows, seconds = rebuild()
+                logger.info(f"✅ Ranked {rows} concerns in {seconds:.1f}s")
+            except IntegrityError:
+                # Another worker backfilled the same rows first
+                logger.info("Concern ranking was backfilled by another worker")
+        _populated = True
+
+
+def upvote(concern_id):
+    """Atomic +1 and re-rank in one transaction; returns the new count, or None if there is no such concern"""
+    table = Concern.__table__
+    result = db.session.execute(table.update().where(table.c.id == concern_id)
+                                .values(upvotes=db.func.coalesce(table.c.upvotes, 0) + 1))
+    if not result.rowcount:
+        db.session.rollback()
+        return None
+    sync(db.session.connection(), [concern_id])
+    upvotes = db.session.execute(select(table.c.upvotes).where(table.c.id == concern_id)).scalar()
+    db.session.commit()
+    return upvotes
+
+
+# --------------------------------------------------
+# Cursors
+# --------------------------------------------------
+
+def cursor_keys(sort, concern, rank):
+    if sort == "hot":
+        return [rank.state, rank.hot_score, concern.id]
+    if sort == "unanswered":
+        return [rank.hot_score, concern.id]
+    return [rank.created_at.isoformat(), concern.id]
+
+
+def encode_cursor(sort, keys):
+    raw = json.dumps([sort, *keys])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(sort, cursor):
+    """Sort keys of the last concern on the previous page; ValueError if malformed or from another sort"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        cursor_sort, *keys = json.loads(raw)
+        if cursor_sort != sort:
+            raise ValueError(f"cursor is for sort={cursor_sort}")
+        if sort == "hot":
+            state, score, concern_id = keys
+            return int(state), float(score), int(concern_id)
+        if sort == "unanswered":
+            score, concern_id = keys
+            return float(score), int(concern_id)
+        created_at, concern_id = keys
+        return datetime.fromisoformat(created_at), int(concern_id)
+    except (UnicodeDecodeError, binascii.Error, ValueError, TypeError) as e:
+        raise ValueError(f"invalid cursor: {cursor}") from e
+
+
+# --------------------------------------------------
+# Queries
+# --------------------------------------------------
+
+def fetch_page(sort="hot", category=None, cursor=None, limit=CONCERN_PAGE_SIZE):
+    """
+    One page of (concern, rank) pairs in ``sort`` order; returns (pairs, has_more).
+    The rank index drives the walk and authors come from the same query.
+    """
+    query = db.session.query(Concern, ConcernRank)\
+        .join(ConcernRank, ConcernRank.concern_id == Concern.id)\
+        .options(joinedload(Concern.author))
+    if category:
+        query = query.filter(ConcernRank.category == category)
+
+    if sort == "hot":
+        keys = (ConcernRank.state, ConcernRank.hot_score, ConcernRank.concern_id)
+    elif sort == "unanswered":
+        query = query.filter(ConcernRank.state == OPEN)
+        keys = (ConcernRank.hot_score, ConcernRank.concern_id)
+    elif sort == "new":
+        keys = (ConcernRank.created_at, ConcernRank.concern_id)
+    else:
+        raise ValueError(f"unknown sort: {sort} (expected one of {', '.join(SORTS)})")
+
+    if cursor is not None:
+        query = query.filter(tuple_(*keys) < tuple_(*cursor))
+    pairs = query.order_by(*(key.desc() for key in keys)).limit(limit + 1).all()
+    return pairs[:limit], len(pairs) > limit
+
+
+def serialize_concern(concern):
+    """Field names the concerns page reads; anonymous concerns never expose their author"""
+    author = None if concern.is_anonymous else concern.author
+    return {
+        'id': concern.id,
+        'title': concern.title,
+        'content': concern.content,
+        'category': concern.category,
+        'status': concern.status or 'open',
+        'upvotes': concern.upvotes or 0,
+        'author': author.username if author else 'Anonymous',
+        'response': concern.response,
+        'createdAt': concern.created_at.isoformat() if concern.created_at else None,
+        'respondedAt': concern.responded_at.isoformat() if concern.responded_at else None,
+    }
+
+
+def build_page(sort="hot", category=None, cursor=None, limit=CONCERN_PAGE_SIZE):
+    """Serialized concerns of one page and the cursor of the next page, if any"""
+    ensure_populated()
+    pairs, has_more = fetch_page(sort, category, decode_cursor(sort, cursor) if cursor else None, limit)
+    page = [serialize_concern(concern) for concern, _ in pairs]
+    next_cursor = encode_cursor(sort, cursor_keys(sort, *pairs[-1])) if has_more else None
+    return page, next_cursor
+
+
+# --------------------------------------------------
+# Incremental updates
+# --------------------------------------------------
+
+def _changed(instance):
+    state = db.inspect(instance)
+    return any(state.attrs[name].history.has_changes() for name in RANKED_FIELDS)
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_changed_concerns(session, flush_context):
+    # Same transaction as the concern rows themselves, so the board can never
+    # show a status or vote count the table does not have
+    ids = [instance.id for instance in (*session.new, *session.deleted) if isinstance(instance, Concern)]
+    ids += [instance.id for instance in session.dirty if isinstance(instance, Concern) and _changed(instance)]
+    if ids:
+        sync(session.connection(), ids)
+
+
+# --------------------------------------------------
+# Flask wiring
+# --------------------------------------------------
+
+def init_app(app):
+    @app.cli.command("rebuild-concern-rank")
+    def rebuild_concern_rank_command():
+        """Recompute the concerns board ranking for every concern."""
+        rows, seconds = rebuild()
+        click.echo(f"✅ Ranked {rows} concerns in {seconds:.1f}s")
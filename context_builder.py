@@ -0,0 +1,303 @@
+# context_builder.py - token-budgeted chat_history with a rolling per-session summary
+import os
+import re
+import math
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+from functools import lru_cache
+
+import intents
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# Configuration
+# --------------------------------------------------
+
+# Whole prompt: preamble + summary + packed history + the new message
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1000"))
+# History entries sent at most; keep it below SESSION_CONTEXT_TURNS so turns
+# leaving the packed history are still in the window when they are summarized
+CONTEXT_MAX_TURNS = int(os.getenv("CONTEXT_MAX_TURNS", "12"))
+CONTEXT_SUMMARY_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TOKENS", "250"))
+CONTEXT_SUMMARY = os.getenv("CONTEXT_SUMMARY", "1") not in ("0", "false", "False")
+# tokenizer.json path; empty (the default) estimates from length. A Hugging Face
+# hub id (e.g. Cohere/command-nightly) is only fetched with
+# CONTEXT_TOKENIZER_DOWNLOAD=1, since that download would run on a live worker
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "")
+CONTEXT_TOKENIZER_DOWNLOAD = os.getenv("CONTEXT_TOKENIZER_DOWNLOAD", "0") in ("1", "true", "True")
+
+# Used until (or unless) a tokenizer is loaded. English averages about four
+# characters per token but Swahili and other non-English text runs closer to
+# three, so the estimate errs towards more tokens and never overshoots the budget
+CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "3"))
+TURN_OVERHEAD = 4         # role marker and separators per chat_history entry
+SUMMARY_LINE_CHARS = 180
+BASELINE_TURNS = 6        # what every turn sent before packing: the last 6 raw messages
+
+SUMMARY_HEADER = "Summary of earlier parts of this conversation:"
+
+Context = namedtuple("Context", "chat_history preamble tokens")
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_FIRST_PERSON = re.compile(r"\b(i|i'm|i've|my|me|myself)\b", re.IGNORECASE)
+_BOILERPLATE = ("+254759226354", "999")
+
+_tokenizer = None
+_tokenizer_state = "unloaded"   # loading, ready or failed
+_tokenizer_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"turns": 0, "tokens_sent": 0, "tokens_baseline": 0, "max_tokens_sent": 0,
+          "turns_dropped": 0, "summaries_refreshed": 0, "summary_errors": 0}
+
+
+# --------------------------------------------------
+# Token counting
+# --------------------------------------------------
+
+def _load_tokenizer():
+    global _tokenizer, _tokenizer_state
+    try:
+        from tokenizers import Tokenizer
+
+        if os.path.isfile(CONTEXT_TOKENIZER):
+            loaded = Tokenizer.from_file(CONTEXT_TOKENIZER)
+        elif CONTEXT_TOKENIZER_DOWNLOAD:
+            loaded = Tokenizer.from_pretrained(CONTEXT_TOKENIZER)
+        else:
+            raise FileNotFoundError("no such file (set CONTEXT_TOKENIZER_DOWNLOAD=1 to fetch it from the hub)")
+        _tokenizer, _tokenizer_state = loaded, "ready"
+        logger.info(f"✅ Loaded tokenizer {CONTEXT_TOKENIZER}")
+    except Exception as e:
+        _tokenizer_state = "failed"
+        logger.warning(f"⚠️ Tokenizer {CONTEXT_TOKENIZER} unavailable ({e}); estimating tokens from length")
+
+
+def tokenizer():
+    """
+    The loaded tokenizer, or None while it is loading (or unavailable).
+
+    Loading (and the opt-in hub download) runs on a background thread
+    started by the first call; counts are estimated until it is ready.
+    """
+    global _tokenizer_state
+    if _tokenizer_state == "unloaded" and CONTEXT_TOKENIZER:
+        with _tokenizer_lock:
+            if _tokenizer_state == "unloaded":
+                _tokenizer_state = "loading"
+                threading.Thread(target=_load_tokenizer, name="tokenizer-load", daemon=True).start()
+    return _tokenizer
+
+
+@lru_cache(maxsize=4096)
+def _count(text, exact):
+    # Each history entry is re-counted every turn it stays in the window
+    if exact:
+        return len(_tokenizer.encode(text, add_special_tokens=False).ids)
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    return _count(text, tokenizer() is not None)
+
+
+# --------------------------------------------------
+# Summary
+# --------------------------------------------------
+
+def fingerprint(entry):
+    return hashlib.sha1(f"{entry['role']}|{entry['message']}".encode("utf-8")).hexdigest()
+
+
+def _clip(sentence):
+    if len(sentence) <= SUMMARY_LINE_CHARS:
+        return sentence
+    return sentence[:SUMMARY_LINE_CHARS].rsplit(" ", 1)[0] + "…"
+
+
+def _score(sentence):
+    # Sentences naming a concern and told in the first person carry the context
+    return 3 * len(intents.classify(sentence)) + bool(_FIRST_PERSON.search(sentence)) + min(len(sentence), 200) / 200
+
+
+def extract(entry):
+    """One summary line for a chat_history entry, or None if nothing in it is worth keeping"""
+    sentences = [s for s in _SENTENCE_END.split(" ".join(entry["message"].split())) if s]
+    if not sentences:
+        return None
+    if entry["role"] == "USER":
+        return f"User: {_clip(max(sentences, key=_score))}"
+    # Replies open with empathy and end with the helpline; keep the first piece of advice
+    for sentence in sentences[1:] or sentences:
+        if not any(marker in sentence for marker in _BOILERPLATE):
+            return f"Assistant suggested: {_clip(sentence)}"
+    return None
+
+
+def compact(lines, max_tokens):
+    """Drop the oldest lines until the summary fits, keeping crisis lines the longest"""
+    lines = list(lines)
+    while lines and count_tokens("\n".join(lines)) > max_tokens:
+        ordinary = next((i for i, line in enumerate(lines) if not intents.is_serious(line)), 0)
+        lines.pop(ordinary)
+    return lines
+
+
+def unsummarized(dropped, kept, last_turn):
+    """Entries of ``dropped`` newer than the last summarized turn"""
+    if not last_turn:
+        return dropped
+    fingerprints = [fingerprint(entry) for entry in dropped]
+    if last_turn in fingerprints:
+        return dropped[len(fingerprints) - fingerprints[::-1].index(last_turn):]
+    if any(fingerprint(entry) == last_turn for entry in kept):
+        # The budget grew back: turns summarized earlier are being sent again
+        return []
+    return dropped
+
+
+def load_summary(session_id):
+    from models import ChatSummary
+
+    return ChatSummary.query.filter_by(session_id=session_id).first()
+
+
+def refresh_summary(session_id, row, dropped, kept):
+    """Fold newly dropped turns into the stored summary; returns its new text, or None if unchanged"""
+    from models import ChatSummary, db
+
+    new_turns = unsummarized(dropped, kept, row.last_turn if row is not None else None)
+    if not new_turns:
+        return None
+    lines = row.summary.splitlines() if row is not None and row.summary else []
+    lines += [line for line in (extract(entry) for entry in new_turns) if line]
+    lines = compact(lines, CONTEXT_SUMMARY_TOKENS)
+    if row is None:
+        row = ChatSummary(session_id=session_id, summarized_turns=0)
+        db.session.add(row)
+    summary = "\n".join(lines)
+    row.summary = summary
+    row.last_turn = fingerprint(new_turns[-1])
+    row.summarized_turns = (row.summarized_turns or 0) + len(new_turns)
+    row.tokens = count_tokens(summary)
+    db.session.commit()
+    with _stats_lock:
+        _stats["summaries_refreshed"] += 1
+    return summary
+
+
+# --------------------------------------------------
+# Packing
+# --------------------------------------------------
+
+def pack(history, budget):
+    """(kept, dropped): the newest entries whose tokens fit ``budget``, in order"""
+    kept = []
+    for entry in reversed(history):
+        cost = count_tokens(entry["message"]) + TURN_OVERHEAD
+        if len(kept) >= CONTEXT_MAX_TURNS or cost > budget:
+            break
+        kept.append(entry)
+        budget -= cost
+    kept.reverse()
+    return kept, history[:len(history) - len(kept)]
+
+
+def with_summary(system_prompt, summary):
+    if not summary:
+        return system_prompt
+    return f"{system_prompt}\n\n{SUMMARY_HEADER}\n{summary}"
+
+
+def build(session_id, message, history, system_prompt):
+    """
+    Context for one chat turn: the newest history that fits
+    CONTEXT_TOKEN_BUDGET next to the preamble, summary and message, with
+    everything older folded into the session's stored summary.
+    """
+    history = list(history or [])
+    baseline = count_tokens(system_prompt) + count_tokens(message) + \
+        sum(count_tokens(entry["message"]) + TURN_OVERHEAD for entry in history[-BASELINE_TURNS:])
+    # The user message is saved before history is read; it goes out as ``message``
+    if history and history[-1]["role"] == "USER" and history[-1]["message"] == message:
+        history.pop()
+
+    row, summary = None, ""
+    if CONTEXT_SUMMARY and history and session_id:
+        try:
+            row = load_summary(session_id)
+            summary = row.summary if row is not None else ""
+        except Exception as e:
+            from models import db
+
+            db.session.rollback()
+            logger.error(f"Could not load chat summary: {e}")
+
+    fixed = count_tokens(system_prompt) + count_tokens(message)
+    # The summary never takes more than half of what is left for context
+    summary_cap = min(CONTEXT_SUMMARY_TOKENS, max(0, CONTEXT_TOKEN_BUDGET - fixed) // 2)
+    summary = "\n".join(compact(summary.splitlines(), summary_cap))
+    summary_tokens = count_tokens(with_summary("", summary))
+    kept, dropped = pack(history, CONTEXT_TOKEN_BUDGET - fixed - summary_tokens)
+
+    if dropped and CONTEXT_SUMMARY and session_id:
+        try:
+            refreshed = refresh_summary(session_id, row, dropped, kept)
+            if refreshed is not None:
+                summary = "\n".join(compact(refreshed.splitlines(), summary_cap))
+        except Exception as e:
+            from models import db
+
+            db.session.rollback()
+            logger.error(f"Could not refresh chat summary: {e}")
+            with _stats_lock:
+                _stats["summary_errors"] += 1
+        refreshed_tokens = count_tokens(with_summary("", summary))
+        if refreshed_tokens > summary_tokens:
+            # Anything this drops is summarized on the next turn
+            kept, dropped = pack(history, CONTEXT_TOKEN_BUDGET - fixed - refreshed_tokens)
+        summary_tokens = refreshed_tokens
+
+    history_tokens = sum(count_tokens(entry["message"]) + TURN_OVERHEAD for entry in kept)
+    tokens = {
+        "preamble": count_tokens(system_prompt),
+        "summary": summary_tokens,
+        "history": history_tokens,
+        "message": count_tokens(message),
+        "total": fixed + summary_tokens + history_tokens,
+        "turns_sent": len(kept),
+        "turns_dropped": len(dropped),
+    }
+    logger.info(f"🧮 Context tokens: total={tokens['total']} (preamble={tokens['preamble']} "
+                f"summary={summary_tokens} history={history_tokens} message={tokens['message']}), "
+                f"{len(kept)} turns sent, {len(dropped)} left to the summary, baseline={baseline}")
+    with _stats_lock:
+        _stats["turns"] += 1
+        _stats["tokens_sent"] += tokens["total"]
+        _stats["tokens_baseline"] += baseline
+        _stats["max_tokens_sent"] = max(_stats["max_tokens_sent"], tokens["total"])
+        _stats["turns_dropped"] += len(dropped)
+
+    return Context(kept, with_summary(system_prompt, summary), tokens)
+
+
+def stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    turns = stats["turns"] or 1
+    stats.update({
+        "avg_tokens_sent": round(stats["tokens_sent"] / turns, 1),
+        "avg_tokens_baseline": round(stats["tokens_baseline"] / turns, 1),
+        "budget": CONTEXT_TOKEN_BUDGET,
+        "max_turns": CONTEXT_MAX_TURNS,
+        "summary_tokens": CONTEXT_SUMMARY_TOKENS,
+        "tokenizer": CONTEXT_TOKENIZER or None,
+        "tokenizer_state": _tokenizer_state,
+        # Whether the token figures above are counted or estimated from length
+        "token_counts": "exact" if _tokenizer_state == "ready" else f"estimate (chars / {CHARS_PER_TOKEN:g})",
+    })
+    return stats
@@ -0,0 +1,258 @@
+# counters.py - buffered view/like/comment counters for community posts
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# Configuration
+# --------------------------------------------------
+
+# 'memory' (per worker; a crash loses up to one flush interval of increments)
+# or 'shared' (local_store file, survives worker crashes and is visible to
+# every worker's reads); 'off' writes each increment straight to the table
+COUNTER_BACKEND = os.getenv("COUNTER_BACKEND", "memory")
+COUNTER_FLUSH_INTERVAL = float(os.getenv("COUNTER_FLUSH_INTERVAL", "5"))   # also the loss window
+COUNTER_MAX_PENDING = int(os.getenv("COUNTER_MAX_PENDING", "5000"))      # flush early past this many keys
+
+COLUMNS = ("views", "likes", "comments_count")
+
+
+class MemoryBackend:
+    """(post_id, column) -> pending delta in a dict"""
+
+    name = "memory"
+
+    def __init__(self):
+        self.deltas = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def add(self, increments):
+        with self.lock:
+            for post_id, column, amount in increments:
+                self.deltas[(post_id, column)] += amount
+            return len(self.deltas)
+
+    def pending(self, post_ids):
+        wanted = set(post_ids)
+        with self.lock:
+            return [(post_id, column, amount) for (post_id, column), amount in self.deltas.items()
+                    if post_id in wanted]
+
+    def take(self):
+        with self.lock:
+            taken, self.deltas = self.deltas, defaultdict(int)
+        return [(post_id, column, amount) for (post_id, column), amount in taken.items()]
+
+    def size(self):
+        with self.lock:
+            return len(self.deltas)
+
+
+class SharedBackend:
+    """Pending deltas in the local_store SQLite file, merged by UPSERT"""
+
+    name = "shared"
+
+    def __init__(self):
+        from local_store import get_store
+
+        self.store = get_store()
+        with self.store.transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS counter_deltas ("
+                " post_id INTEGER NOT NULL,"
+                " column_name TEXT NOT NULL,"
+                " delta INTEGER NOT NULL,"
+                " PRIMARY KEY (post_id, column_name))"
+            )
+
+    def add(self, increments):
+        with self.store.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO counter_deltas (post_id, column_name, delta) VALUES (?, ?, ?)"
+                " ON CONFLICT (post_id, column_name) DO UPDATE SET delta = delta + excluded.delta",
+                increments
+            )
+            return conn.execute("SELECT COUNT(*) FROM counter_deltas").fetchone()[0]
+
+    def pending(self, post_ids):
+        post_ids = list(post_ids)
+        if not post_ids:
+            return []
+        marks = ",".join("?" * len(post_ids))
+        return self.store.connection().execute(
+            f"SELECT post_id, column_name, delta FROM counter_deltas WHERE post_id IN ({marks})", post_ids
+        ).fetchall()
+
+    def take(self):
+        # Whichever worker flushes first claims every worker's deltas
+        with self.store.transaction() as conn:
+            rows = conn.execute("SELECT post_id, column_name, delta FROM counter_deltas").fetchall()
+            conn.execute("DELETE FROM counter_deltas")
+        return rows
+
+    def size(self):
+        return self.store.connection().execute("SELECT COUNT(*) FROM counter_deltas").fetchone()[0]
+
+
+class CounterBuffer:
+    """
+    Accumulate increments and apply them as one batched
+    ``UPDATE community_posts SET views = views + :views, ...`` per flush.
+    """
+
+    def __init__(self, backend_name=COUNTER_BACKEND, interval=COUNTER_FLUSH_INTERVAL,
+                 max_pending=COUNTER_MAX_PENDING):
+        self.backend_name = backend_name
+        self.interval = interval
+        self.max_pending = max_pending
+        self._reset()
+        atexit.register(self.flush)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._app = None
+        self._backend = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stats = {"increments": 0, "flushes": 0, "rows_updated": 0, "failures": 0,
+                       "last_flush_ms": 0.0, "max_flush_ms": 0.0}
+
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = SharedBackend() if self.backend_name == "shared" else MemoryBackend()
+        return self._backend
+
+    def _ensure_started(self, app):
+        if self._pid != os.getpid():
+            self._reset()
+        if self._app is None:
+            self._app = app
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="counter-flush", daemon=True)
+                    self._thread.start()
+
+    def incr(self, app, increments):
+        """Buffer ``(post_id, column, amount)`` increments"""
+        increments = [(post_id, column, amount) for post_id, column, amount in increments
+                      if column in COLUMNS and amount]
+        if not increments:
+            return
+        if self.backend_name == "off":
+            self._app = app
+            self._apply(increments)
+            return
+        self._ensure_started(app)
+        pending = self.backend().add(increments)
+        with self._lock:
+            self._stats["increments"] += len(increments)
+        if pending >= self.max_pending:
+            self._wake.set()
+
+    def pending(self, post_ids):
+        """{post_id: {column: delta}} not yet written to the table"""
+        if self.backend_name == "off":
+            return {}
+        merged = {}
+        for post_id, column, amount in self.backend().pending(post_ids):
+            merged.setdefault(post_id, {})[column] = amount
+        return merged
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Counter flush failed: {e}")
+
+    def flush(self):
+        """Write every buffered delta; returns the number of post rows updated"""
+        if self.backend_name == "off" or self._app is None:
+            return 0
+        with self._flush_lock:
+            taken = self.backend().take()
+            if not taken:
+                return 0
+            try:
+                updated = self._apply(taken)
+            except Exception:
+                # Hand the deltas back so the next flush retries them
+                self.backend().add(taken)
+                with self._lock:
+                    self._stats["failures"] += 1
+                raise
+        return updated
+
+    def _apply(self, increments):
+        from sqlalchemy import bindparam
+        from models import CommunityPost, db
+        import community_feed
+
+        per_post = {}
+        for post_id, column, amount in increments:
+            row = per_post.setdefault(post_id, {"post_id": post_id, "views": 0, "likes": 0, "comments_count": 0})
+            row[column] += amount
+
+        table = CommunityPost.__table__
+        statement = table.update()\
+            .where(table.c.id == bindparam("post_id"))\
+            .values({column: db.func.coalesce(table.c[column], 0) + bindparam(column) for column in COLUMNS})
+
+        started = time.perf_counter()
+        with self._app.app_context():
+            with db.engine.begin() as conn:
+                conn.execute(statement, list(per_post.values()))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        # Cached feed pages stay valid: the route re-reads counts per flush
+        # generation (community_feed.with_counts) and overlays what is still buffered
+        community_feed.bump_counts_generation()
+        with self._lock:
+            stats = self._stats
+            stats["flushes"] += 1
+            stats["rows_updated"] += len(per_post)
+            stats["last_flush_ms"] = round(elapsed_ms, 3)
+            stats["max_flush_ms"] = round(max(stats["max_flush_ms"], elapsed_ms), 3)
+        return len(per_post)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            "backend": self.backend_name,
+            "flush_interval": self.interval,
+            "pending_keys": self.backend().size() if self.backend_name != "off" else 0,
+        })
+        return stats
+
+
+post_counters = CounterBuffer()
+
+
+def overlay(posts, pending):
+    """Add pending deltas to serialized posts (``views``/``likes``/``comments`` fields)"""
+    if not pending:
+        return posts
+    result = []
+    for post in posts:
+        deltas = pending.get(post['id'])
+        if deltas:
+            post = dict(post,
+                        views=post['views'] + deltas.get('views', 0),
+                        likes=post['likes'] + deltas.get('likes', 0),
+                        comments=post['comments'] + deltas.get('comments_count', 0))
+        result.append(post)
+    return result
@@ -0,0 +1,112 @@
+# engine_profiles.py - SQLAlchemy engine options and connect-time settings chosen from the database URL
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# --------------------------------------------------
+# Configuration
+# --------------------------------------------------
+
+# 'auto' picks a profile from the URL; 'off' keeps SQLAlchemy's defaults
+DB_ENGINE_PROFILE = os.getenv("DB_ENGINE_PROFILE", "auto")
+
+# SQLite
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000"))
+
+# Postgres: each worker process gets its own pool, so the per-worker size is
+# derived from the worker count and the server's connection budget
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+WORKER_THREADS = max(int(os.getenv("GUNICORN_THREADS", "1")), int(os.getenv("ASGI_DB_THREADS", "10")))
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "90"))   # keep below the server's max_connections
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+
+# Request threads plus the write-behind and counter flush threads
+BACKGROUND_CONNECTIONS = 2
+
+
+def profile_name(url):
+    if DB_ENGINE_PROFILE == "off":
+        return "default"
+    backend = make_url(url).get_backend_name()
+    if backend in ("sqlite", "postgresql"):
+        return backend
+    return "default"
+
+
+def pool_limits(workers=None, threads=None, max_connections=None):
+    """(pool_size, max_overflow) for one worker process"""
+    workers = max(1, workers or WEB_CONCURRENCY)
+    threads = threads or WORKER_THREADS
+    budget = max(1, (max_connections or DB_MAX_CONNECTIONS) // workers)
+    pool_size = min(threads + BACKGROUND_CONNECTIONS, budget)
+    return pool_size, max(0, min(DB_MAX_OVERFLOW, budget - pool_size))
+
+
+def engine_options(url):
+    """Keyword arguments for create_engine (SQLALCHEMY_ENGINE_OPTIONS) for ``url``"""
+    profile = profile_name(url)
+    if profile == "postgresql":
+        pool_size, max_overflow = pool_limits()
+        return {
+            "pool_size": pool_size,
+            "max_overflow": max_overflow,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            # Render drops idle connections; test each one before handing it out
+            "pool_pre_ping": True,
+            "connect_args": {
+                "connect_timeout": DB_CONNECT_TIMEOUT,
+                "options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}",
+            },
+        }
+    if profile == "sqlite":
+        # Waiting on a lock is handled by busy_timeout below
+        return {"connect_args": {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000.0}}
+    return {}
+
+
+def sqlite_pragmas(dbapi_connection, connection_record=None):
+    """
+    WAL lets readers proceed while a writer commits; synchronous=NORMAL is
+    durable across application crashes in WAL mode (only an OS crash can lose
+    the last commits).
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        # Only takes effect on a new database (or after one full VACUUM); lets
+        # retention.compact() hand freed pages back in small steps
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        # Negative cache_size is in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    finally:
+        cursor.close()
+
+
+def install(engine):
+    """Attach the connect-time settings for ``engine``'s profile (before its first connection)"""
+    if profile_name(engine.url) == "sqlite":
+        event.listen(engine, "connect", sqlite_pragmas)
+
+
+def describe(engine):
+    """Profile summary for the admin endpoints"""
+    info = {"profile": profile_name(engine.url), "backend": engine.url.get_backend_name()}
+    pool = engine.pool
+    if hasattr(pool, "size"):
+        info.update({"pool_size": pool.size(), "checked_out": pool.checkedout(), "overflow": pool.overflow()})
+    if info["profile"] == "sqlite":
+        with engine.connect() as conn:
+            for pragma in ("journal_mode", "synchronous", "busy_timeout", "mmap_size", "cache_size", "auto_vacuum"):
+                info[pragma] = conn.exec_driver_sql(f"PRAGMA {pragma}").scalar()
+    return info
@@ -0,0 +1,217 @@
+# export.py - streaming NDJSON/CSV dumps of chat, concern and community tables
+import io
+import os
+import csv
+import json
+import zlib
+import logging
+from datetime import date, datetime
+
+import click
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# Configuration
+# --------------------------------------------------
+
+# Rows per database fetch and per output chunk; memory use is bounded by this, not the table size
+EXPORT_BATCH = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def tables():
+    from models import ChatMessage, CommunityPost, Concern
+
+    return {
+        "chat_messages": ChatMessage.__table__,
+        "concerns": Concern.__table__,
+        "community_posts": CommunityPost.__table__,
+    }
+
+
+class ExportOptions:
+    """Validated export parameters; raises ValueError on anything unusable"""
+
+    def __init__(self, table, fmt="ndjson", since=None, until=None, session_ids=None, category=None,
+                 archived=False):
+        if table not in tables():
+            raise ValueError(f"unknown table: {table} (one of {', '.join(tables())})")
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown format: {fmt} (ndjson or csv)")
+        columns = tables()[table].c
+        if session_ids and "session_id" not in columns:
+            raise ValueError(f"{table} has no session_id")
+        if category and "category" not in columns:
+            raise ValueError(f"{table} has no category")
+        if archived and table != "chat_messages":
+            raise ValueError("only chat_messages has an archive")
+        self.table = table
+        self.fmt = fmt
+        self.since = parse_datetime(since)
+        self.until = parse_datetime(until)
+        self.session_ids = list(session_ids or [])
+        self.category = category
+        self.archived = archived
+
+    @property
+    def filename(self):
+        return f"{self.table}-{datetime.utcnow():%Y%m%dT%H%M%S}.{self.fmt}"
+
+
+def parse_datetime(value):
+    """ISO date or datetime (naive UTC, like created_at); None passes through"""
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError as e:
+        raise ValueError(f"invalid date: {value}") from e
+
+
+# --------------------------------------------------
+# Row sources
+# --------------------------------------------------
+
+def hot_batches(options):
+    """
+    Batches of row tuples in id order. yield_per streams from a server-side
+    cursor on Postgres (and SQLite's cursor is incremental anyway); Core
+    rows skip the ORM identity map, so nothing accumulates between batches.
+    """
+    from sqlalchemy import select
+    from models import db
+
+    table = tables()[options.table]
+    query = select(table).order_by(table.c.id)
+    if options.since:
+        query = query.where(table.c.created_at >= options.since)
+    if options.until:
+        query = query.where(table.c.created_at < options.until)
+    if options.session_ids:
+        query = query.where(table.c.session_id.in_(options.session_ids))
+    if options.category:
+        query = query.where(table.c.category == options.category)
+
+    with db.engine.connect() as conn:
+        result = conn.execution_options(yield_per=EXPORT_BATCH).execute(query)
+        for partition in result.partitions():
+            yield partition
+
+
+def archived_batches(options):
+    """Batches from the Parquet archive, pruned by date partition before any file is read"""
+    import retention
+
+    if not retention.AVAILABLE or not os.path.isdir(retention.ARCHIVE_DIR):
+        return
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    columns = [column.name for column in tables()["chat_messages"].columns]
+    partitioning = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+    dataset = ds.dataset(retention.ARCHIVE_DIR, format="parquet", partitioning=partitioning,
+                         exclude_invalid_files=True)
+    condition = None
+
+    def both(expression):
+        return expression if condition is None else condition & expression
+
+    if options.since:
+        # A partition is the day of a session's last message, so earlier days hold nothing newer
+        condition = both(ds.field("date") >= options.since.date().isoformat())
+        condition = both(ds.field("created_at") >= pa.scalar(options.since, pa.timestamp("us")))
+    if options.until:
+        condition = both(ds.field("created_at") < pa.scalar(options.until, pa.timestamp("us")))
+    if options.session_ids:
+        condition = both(ds.field("session_id").isin(options.session_ids))
+    for batch in dataset.to_batches(columns=columns, filter=condition, batch_size=EXPORT_BATCH):
+        if batch.num_rows:
+            yield list(zip(*(batch.column(name).to_pylist() for name in columns)))
+
+
+# --------------------------------------------------
+# Encoding
+# --------------------------------------------------
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+
+def encode(batches, columns, fmt):
+    """Text chunks, one per batch"""
+    if fmt == "ndjson":
+        for batch in batches:
+            yield "".join(json.dumps({name: _plain(value) for name, value in zip(columns, row)},
+                                     ensure_ascii=False) + "\n" for row in batch)
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows(["" if value is None else _plain(value) for value in row] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks):
+    """Compress on the fly; one gzip member across all chunks"""
+    compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(options, compress=False):
+    """The whole export as a generator of bytes (call inside an app context)"""
+    columns = [column.name for column in tables()[options.table].columns]
+    rows = 0
+
+    def batches():
+        nonlocal rows
+        # Archived turns are older than anything still hot, so they come first
+        sources = [archived_batches(options)] if options.archived else []
+        sources.append(hot_batches(options))
+        for source in sources:
+            for batch in source:
+                rows += len(batch)
+                yield batch
+
+    chunks = (text.encode() for text in encode(batches(), columns, options.fmt))
+    yield from gzip_chunks(chunks) if compress else chunks
+    logger.info(f"📤 Exported {rows} {options.table} rows as {options.fmt}")
+
+
+# --------------------------------------------------
+# Flask wiring
+# --------------------------------------------------
+
+def init_app(app):
+    @app.cli.command("export-data")
+    @click.argument("table")
+    @click.option("--format", "fmt", type=click.Choice(list(FORMATS)), default="ndjson", show_default=True)
+    @click.option("--since", help="Rows created at or after this ISO date/time.")
+    @click.option("--until", help="Rows created before this ISO date/time.")
+    @click.option("--session-id", "session_ids", multiple=True, help="Only these chat sessions (repeatable).")
+    @click.option("--category", help="Only this concern/post category.")
+    @click.option("--archived", is_flag=True, help="Include chat sessions moved to the Parquet archive.")
+    @click.option("--gzip", "compress", is_flag=True, help="Gzip the output.")
+    @click.option("--output", "-o", type=click.Path(dir_okay=False, allow_dash=True), default="-",
+                  show_default=True)
+    def export_data_command(table, fmt, since, until, session_ids, category, archived, compress, output):
+        """Stream TABLE (chat_messages, concerns, community_posts) as NDJSON or CSV."""
+        try:
+            options = ExportOptions(table, fmt, since, until, session_ids, category, archived)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+        with click.open_file(output, "wb") as f:
+            for chunk in stream(options, compress):
+                f.write(chunk)
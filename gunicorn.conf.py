@@ -0,0 +1,8 @@
+# gunicorn.conf.py - server hooks; gunicorn reads this file from the working directory
+import metrics
+
+
+def child_exit(server, worker):
+    # prometheus_client multiprocess mode keeps per-pid files; without this a
+    # restarted worker's gauges linger in /metrics
+    metrics.mark_process_dead(worker.pid)
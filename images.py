@@ -0,0 +1,301 @@
+# images.py - resized / re-encoded image derivatives with a bounded on-disk cache
+import os
+import io
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import request, send_file
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX dev machines: only in-process deduplication
+    fcntl = None
+
+# --------------------------------------------------
+# Configuration
+# --------------------------------------------------
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Looked up in this order for /static/images/<name>
+SOURCE_DIRS = [os.path.join(ROOT, "static", "images"), os.path.join(ROOT, "images"), os.path.join(ROOT, "templates")]
+SOURCE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+FALLBACK_IMAGE = "wellmed.jpg"
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(ROOT, "instance", "image_cache"))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+IMAGE_CACHE_MAX_AGE = 86400
+
+# Requested widths snap up to one of these, so ?w= cannot mint unbounded variants
+STANDARD_WIDTHS = (320, 480, 768, 1024, 1600)
+QUALITY = {"webp": 80, "avif": 55, "jpeg": 82}
+FORMATS = {"webp": ("WEBP", "image/webp"), "avif": ("AVIF", "image/avif"),
+           "jpeg": ("JPEG", "image/jpeg"), "png": ("PNG", "image/png")}
+
+_key_locks = {}
+_key_locks_guard = threading.Lock()
+
+
+def supported_formats():
+    """Output formats this Pillow build can encode"""
+    from PIL import features
+
+    available = {"jpeg", "png"}
+    for name in ("webp", "avif"):
+        if features.check(name):
+            available.add(name)
+    return available
+
+
+# --------------------------------------------------
+# Sources and keys
+# --------------------------------------------------
+
+def find_source(name):
+    """Absolute path of the original image ``name``, or None"""
+    if os.path.splitext(name)[1].lower() not in SOURCE_EXTENSIONS:
+        return None
+    for directory in SOURCE_DIRS:
+        path = safe_join(directory, name)
+        if path is not None and os.path.isfile(path):
+            return path
+    return None
+
+
+def snap_width(width):
+    for standard in STANDARD_WIDTHS:
+        if width <= standard:
+            return standard
+    return STANDARD_WIDTHS[-1]
+
+
+def default_format(source):
+    ext = os.path.splitext(source)[1].lower()
+    return {".jpg": "jpeg", ".jpeg": "jpeg", ".webp": "webp"}.get(ext, "png")
+
+
+def negotiate_format(accept):
+    """Best format for fmt=auto from the Accept header"""
+    available = supported_formats()
+    for name in ("avif", "webp"):
+        if name in available and f"image/{name}" in accept:
+            return name
+    return "jpeg"
+
+
+def derivative_key(source, width, fmt):
+    # The source's size and mtime are part of the key: editing an image
+    # produces new derivatives and the stale ones age out under eviction
+    stat = os.stat(source)
+    raw = f"{source}|{stat.st_size}|{stat.st_mtime_ns}|{width}|{fmt}|{QUALITY.get(fmt)}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:24]
+
+
+# --------------------------------------------------
+# Generation
+# --------------------------------------------------
+
+def render(source, width, fmt):
+    """Encoded bytes of ``source`` scaled down to ``width`` pixels wide"""
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        image.seek(0)   # animated GIFs: first frame
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+        if fmt == "jpeg":
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA")
+
+        options = {"optimize": True} if fmt in ("jpeg", "png") else {}
+        if fmt in QUALITY:
+            options["quality"] = QUALITY[fmt]
+        if fmt == "jpeg":
+            options["progressive"] = True
+        if fmt == "webp":
+            options["method"] = 6
+        buffer = io.BytesIO()
+        image.save(buffer, FORMATS[fmt][0], **options)
+        return buffer.getvalue()
+
+
+def _key_lock(key):
+    with _key_locks_guard:
+        lock = _key_locks.get(key)
+        if lock is None:
+            lock = _key_locks[key] = threading.Lock()
+        return lock
+
+
+def get_derivative(source, width, fmt):
+    """
+    Path of the cached derivative, generating it on first use.
+
+    Concurrent requests for the same key wait on one generation: threads on
+    a per-key lock, other worker processes on a flock'd lock file.
+    """
+    key = derivative_key(source, width, fmt)
+    path = os.path.join(IMAGE_CACHE_DIR, f"{key}.{fmt}")
+    if os.path.exists(path):
+        _touch(path)
+        return path, False
+
+    os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+    lock = _key_lock(key)
+    with lock:
+        with open(path + ".lock", "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if os.path.exists(path):
+                    return path, False
+                content = render(source, width, fmt)
+                temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temp, "wb") as f:
+                    f.write(content)
+                os.replace(temp, path)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        _remove_quietly(path + ".lock")
+    with _key_locks_guard:
+        _key_locks.pop(key, None)
+    evict()
+    return path, True
+
+
+def _touch(path):
+    # mtime doubles as the last-access time for LRU eviction
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def cache_usage():
+    """(total bytes, [(mtime, size, path)]) of every cached derivative"""
+    entries, total = [], 0
+    if not os.path.isdir(IMAGE_CACHE_DIR):
+        return total, entries
+    for entry in os.scandir(IMAGE_CACHE_DIR):
+        if entry.is_file() and not entry.name.endswith((".lock", ".tmp")):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+    return total, entries
+
+
+def evict(max_bytes=None):
+    """Delete least recently used derivatives until the cache is under 90% of its cap"""
+    max_bytes = IMAGE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    total, entries = cache_usage()
+    if total <= max_bytes:
+        return 0
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes * 0.9:
+            break
+        _remove_quietly(path)
+        total -= size
+        removed += 1
+    return removed
+
+
+# --------------------------------------------------
+# Serving
+# --------------------------------------------------
+
+def wants_derivative():
+    return "w" in request.args or "fmt" in request.args
+
+
+def send_derivative(image_name):
+    """/static/images/<name>?w=480&fmt=webp (fmt: webp, avif, jpeg, png or auto)"""
+    source = find_source(image_name)
+    is_fallback = source is None
+    if is_fallback:
+        source = find_source(FALLBACK_IMAGE)
+        if source is None:
+            raise NotFound()
+
+    from PIL import Image
+
+    fmt = request.args.get("fmt") or default_format(source)
+    if fmt == "auto":
+        fmt = negotiate_format(request.headers.get("Accept", ""))
+    if fmt not in supported_formats():
+        fmt = default_format(source)
+
+    with Image.open(source) as image:
+        original_width = image.width
+    width = request.args.get("w", type=int) or original_width
+    # Never upscale: past the original width the original size is used
+    width = min(snap_width(max(width, 1)), original_width)
+
+    path, _ = get_derivative(source, width, fmt)
+    response = send_file(path, mimetype=FORMATS[fmt][1], conditional=True, max_age=IMAGE_CACHE_MAX_AGE)
+    if request.args.get("fmt") == "auto":
+        response.vary.add("Accept")
+    if is_fallback:
+        # The requested image may be uploaded later; do not pin the placeholder for long
+        response.headers["Cache-Control"] = "public, max-age=3600"
+    return response
+
+
+# --------------------------------------------------
+# Flask wiring
+# --------------------------------------------------
+
+def prewarm(widths=STANDARD_WIDTHS, formats=None, workers=None):
+    """Generate every standard derivative of every source image; returns (generated, existing)"""
+    formats = [fmt for fmt in (formats or ("webp", "avif")) if fmt in supported_formats()]
+    sources = {}
+    for directory in SOURCE_DIRS:
+        if not os.path.isdir(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            path = os.path.join(directory, filename)
+            if os.path.isfile(path) and filename not in sources and find_source(filename) == path:
+                sources[filename] = path
+
+    jobs = []
+    for path in sources.values():
+        from PIL import Image
+
+        with Image.open(path) as image:
+            original_width = image.width
+        for width in sorted({min(snap_width(width), original_width) for width in widths}):
+            jobs.extend((path, width, fmt) for fmt in formats)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 2) as pool:
+        results = list(pool.map(lambda job: get_derivative(*job)[1], jobs))
+    return sum(results), len(results) - sum(results)
+
+
+def init_app(app):
+    @app.cli.command("prewarm-images")
+    @click.option("--widths", default=",".join(str(width) for width in STANDARD_WIDTHS), show_default=True,
+                  help="Comma-separated widths to generate.")
+    @click.option("--formats", default="webp,avif", show_default=True, help="Comma-separated output formats.")
+    def prewarm_images_command(widths, formats):
+        """Generate image derivatives ahead of deploy."""
+        started = time.perf_counter()
+        generated, existing = prewarm([int(width) for width in widths.split(",") if width],
+                                      [fmt.strip() for fmt in formats.split(",") if fmt.strip()])
+        total, entries = cache_usage()
+        click.echo(f"✅ {generated} derivatives generated, {existing} already cached "
+                   f"({len(entries)} files, {total / 1024 / 1024:.1f}MB) in {time.perf_counter() - started:.1f}s")
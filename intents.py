@@ -0,0 +1,142 @@
+# intents.py - single-pass intent classifier for chat messages
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+Intent = namedtuple("Intent", "name priority serious terms")
+IntentMatch = namedtuple("IntentMatch", "name priority serious")
+
+# Highest priority first; ``serious`` intents always get the emergency contact
+# and are never answered from cache. A trailing '*' lets a term take any word
+# ending (hopeless* -> hopelessness, partner* -> partners); everything else
+# matches whole words. Every keyword of the old substring scan is kept as a
+# stem (or spelled out where a stem would also match unrelated words), so
+# "exam" still fires on "exams" but no longer on "example", nor "tired" on
+# "retired". Missing a real concern costs more than a false alarm.
+INTENTS = (
+    Intent("crisis", 100, True, ("suicid*", "kill myself", "killing myself", "end my life", "ending my life",
+                                 "want to die", "wanting to die", "harm myself", "harming myself")),
+    Intent("urgent", 90, True, ("emergenc*", "urgent*")),
+    Intent("anxiety", 70, False, ("anxious*", "anxiet*", "panic*", "worr*", "nervous*", "overthink*")),
+    Intent("depression", 60, False, ("depress*", "sad", "sadder", "saddest", "sadly", "sadness", "sadden*", "hopeless*",
+                                      "unmotivat*", "empty", "emptiness", "worthless*")),
+    Intent("stress", 50, False, ("stress*", "overwhelm*", "pressur*", "burnout*", "burned out", "burnt out")),
+    Intent("sleep", 40, False, ("sleep*", "insomnia*", "tired*", "exhaust*", "can't sleep", "cant sleep")),
+    Intent("relationships", 30, False, ("relationship*", "partner*", "breakup*", "break up", "divorc*", "family",
+                                        "families", "friend*", "boyfriend*", "girlfriend*", "husband*", "wife",
+                                        "wives")),
+    Intent("work", 20, False, ("work*", "homework*", "overwork*", "cowork*", "job*", "school*", "exam", "exams",
+                               "examination*", "study", "studies", "studied", "studying", "student*",
+                               "deadline*")),
+)
+
+_BY_NAME = {intent.name: intent for intent in INTENTS}
+# Apostrophes split words, so "family's" yields "family" (and "can't" -> "can", "t")
+_WORDS = re.compile(r"[a-z0-9]+")
+
+
+def _build():
+    """
+    Compile every term into lookup tables once at import.
+
+    Whole words go into ``exact`` (word -> intent), '*' stems are bucketed by
+    their first three letters, and multi-word phrases are keyed by their first
+    word. A message is tokenized once and its word set is intersected with
+    these keys in C, so only the rare candidate words reach Python code.
+    """
+    exact, stems, phrases = {}, {}, {}
+    for intent in INTENTS:
+        for term in intent.terms:
+            # Terms go through the message tokenizer, so "can't sleep" is a phrase of three words
+            words = _WORDS.findall(term)
+            if len(words) > 1:
+                phrases.setdefault(words[0], []).append((tuple(words[1:]), intent.name))
+            elif term.endswith("*"):
+                stems.setdefault(term[:3], []).append((term[:-1], intent.name))
+            else:
+                exact.setdefault(term, intent.name)
+    return exact, stems, phrases
+
+
+_EXACT, _STEMS, _PHRASES = _build()
+_EXACT_WORDS = frozenset(_EXACT)
+_STEM_HEADS = frozenset(_STEMS)
+_PHRASE_HEADS = frozenset(_PHRASES)
+
+
+def _scan(text):
+    """Set of intent names found in ``text``"""
+    words = _WORDS.findall(text.lower())
+    word_set = set(words)
+    found = {_EXACT[word] for word in _EXACT_WORDS.intersection(word_set)}
+
+    for head in _STEM_HEADS.intersection([word[:3] for word in word_set]):
+        for stem, name in _STEMS[head]:
+            if name not in found and any(word.startswith(stem) for word in word_set):
+                found.add(name)
+
+    for head in _PHRASE_HEADS.intersection(word_set):
+        for rest, name in _PHRASES[head]:
+            if name in found:
+                continue
+            size = len(rest)
+            for index, word in enumerate(words):
+                if word == head and tuple(words[index + 1:index + 1 + size]) == rest:
+                    found.add(name)
+                    break
+    return found
+
+
+def _to_matches(found):
+    return sorted((IntentMatch(name, _BY_NAME[name].priority, _BY_NAME[name].serious) for name in found),
+                  key=lambda match: -match.priority)
+
+
+@lru_cache(maxsize=4096)
+def _classify_cached(text):
+    return tuple(_to_matches(_scan(text)))
+
+
+def classify(text):
+    """Return every intent found in ``text``, highest priority first"""
+    if not text:
+        return []
+    # One chat turn classifies the same message several times (cache bypass,
+    # emergency suffix, fallback); repeat calls are served from the memo.
+    return list(_classify_cached(text))
+
+
+def top_intent(text):
+    """Highest-priority intent name, or None"""
+    matches = classify(text)
+    return matches[0].name if matches else None
+
+
+def is_serious(text):
+    return any(match.serious for match in classify(text))
+
+
+def classify_batch(texts):
+    """Classify many texts at once; returns one list of IntentMatch per text"""
+    # Bypasses the per-message memo so bulk jobs do not flush it
+    return [_to_matches(_scan(text)) if text else [] for text in texts]
+
+
+def classify_rows(rows, batch_size=1000):
+    """
+    Yield ``(row.id, [intent names])`` for rows with ``id``/``content``
+    attributes, e.g. a ``ChatMessage.query.yield_per(batch_size)`` iterator.
+    """
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield from _classify_row_batch(batch)
+            batch = []
+    if batch:
+        yield from _classify_row_batch(batch)
+
+
+def _classify_row_batch(rows):
+    for row, matches in zip(rows, classify_batch(row.content for row in rows)):
+        yield row.id, [match.name for match in matches]
@@ -0,0 +1,120 @@
+# local_store.py - small SQLite-backed key/value store shared by gunicorn workers on one host
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+LOCAL_STORE_PATH = os.getenv("LOCAL_STORE_PATH", os.path.join("instance", "local_store.db"))
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class LocalStore:
+    """
+    JSON values grouped by namespace, kept in a WAL-mode SQLite file.
+
+    Every worker process opens its own connection per thread; ``update`` runs
+    under ``BEGIN IMMEDIATE`` so read-modify-write is atomic across processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Yield a connection inside a write-locked transaction"""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def get(self, namespace, key, default=None):
+        row = self.connection().execute(
+            "SELECT value, expires_at FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return default
+        return json.loads(row[0])
+
+    def set(self, namespace, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        self.connection().execute(
+            "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value), expires_at)
+        )
+
+    def delete(self, namespace, key):
+        self.connection().execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def update(self, namespace, key, fn, default=None, ttl=None):
+        """Atomically replace the value with ``fn(current)`` and return the new value"""
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            current = default
+            if row is not None and (row[1] is None or row[1] >= time.time()):
+                current = json.loads(row[0])
+            value = fn(current)
+            expires_at = time.time() + ttl if ttl else None
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), expires_at)
+            )
+        return value
+
+    def items(self, namespace):
+        """Return ``{key: value}`` for every live entry in a namespace"""
+        now = time.time()
+        rows = self.connection().execute(
+            "SELECT key, value, expires_at FROM kv WHERE namespace = ?", (namespace,)
+        ).fetchall()
+        return {key: json.loads(value) for key, value, expires_at in rows
+                if expires_at is None or expires_at >= now}
+
+    def purge_expired(self):
+        self.connection().execute(
+            "DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),)
+        )
+
+
+def get_store(path=None):
+    """Return the process-wide store for ``path`` (LOCAL_STORE_PATH by default)"""
+    path = path or LOCAL_STORE_PATH
+    store = _stores.get(path)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(path)
+            if store is None:
+                store = _stores[path] = LocalStore(path)
+    return store
@@ -0,0 +1,379 @@
+# mail_queue.py - durable outbound email: persist on submit, send in the background over a reused SMTP connection
+import os
+import time
+import uuid
+import random
+import hashlib
+import logging
+import smtplib
+import threading
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+
+import click
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# Configuration
+# --------------------------------------------------
+
+SMTP_HOST = os.getenv("SMTP_HOST")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USER = os.getenv("SMTP_USER")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") in ("1", "true", "True")
+SMTP_SSL = os.getenv("SMTP_SSL", "0") in ("1", "true", "True")
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "15"))
+# An idle pooled connection is closed after this long (servers drop them anyway)
+SMTP_IDLE_SECONDS = float(os.getenv("SMTP_IDLE_SECONDS", "30"))
+
+MAIL_FROM = os.getenv("MAIL_FROM", "website@elmedwellmind.com")
+MAIL_TO = os.getenv("MAIL_TO", "elijahokware@gmail.com")
+# Without SMTP_HOST nothing is sent: submissions stay queued until a process
+# with SMTP_HOST set starts its sender (or runs `flask send-queued-mail`)
+MAIL_SENDER = os.getenv("MAIL_SENDER", "1") not in ("0", "false", "False")
+MAIL_BATCH = int(os.getenv("MAIL_BATCH", "20"))                    # messages per claim / connection use
+MAIL_POLL = float(os.getenv("MAIL_POLL_SECONDS", "2"))             # shortest wait between idle checks
+# Longest an idle sender sleeps. A submission wakes its own worker's sender
+# at once; this only bounds how late another worker's leftovers are picked up.
+MAIL_IDLE_POLL = float(os.getenv("MAIL_IDLE_POLL_SECONDS", "60"))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "6"))
+MAIL_BACKOFF = float(os.getenv("MAIL_BACKOFF_SECONDS", "30"))      # doubles per attempt, with jitter
+MAIL_BACKOFF_MAX = float(os.getenv("MAIL_BACKOFF_MAX_SECONDS", "3600"))
+MAIL_CLAIM_TTL = float(os.getenv("MAIL_CLAIM_TTL", "300"))         # a crashed sender's claim expires
+# Identical submissions inside this window are stored (and sent) once
+MAIL_DEDUPE_WINDOW = float(os.getenv("MAIL_DEDUPE_WINDOW_SECONDS", "86400"))
+
+
+def dedupe_key(*parts, now=None):
+    """Stable key for one submission within the current dedupe window"""
+    window = int((now or time.time()) // MAIL_DEDUPE_WINDOW) if MAIL_DEDUPE_WINDOW > 0 else uuid.uuid4().hex
+    normalized = "\x1f".join(" ".join(str(part or "").split()).lower() for part in parts)
+    return hashlib.sha256(f"{window}\x1f{normalized}".encode()).hexdigest()
+
+
+def backoff(attempts):
+    """Seconds before retry number ``attempts``"""
+    delay = min(MAIL_BACKOFF_MAX, MAIL_BACKOFF * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+class SmtpPool:
+    """
+    One SMTP connection reused across messages and batches: the handshake
+    (TCP, EHLO, STARTTLS, AUTH) is paid once instead of per message.
+    """
+
+    def __init__(self):
+        self.conn = None
+        self.last_used = 0.0
+        self.opened = 0
+
+    def get(self):
+        if self.conn is not None and time.monotonic() - self.last_used > SMTP_IDLE_SECONDS:
+            self.close()
+        if self.conn is None:
+            if SMTP_SSL:
+                conn = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+            else:
+                conn = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+                if SMTP_STARTTLS:
+                    conn.starttls()
+            if SMTP_USER:
+                conn.login(SMTP_USER, SMTP_PASSWORD or "")
+            self.conn = conn
+            self.opened += 1
+        return self.conn
+
+    def send(self, message):
+        try:
+            self.get().send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            # The server closed an idle connection: reconnect once
+            self.close()
+            self.get().send_message(message)
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.conn = None
+
+
+def build_message(row):
+    message = EmailMessage()
+    message["From"] = MAIL_FROM
+    message["To"] = row.to_address
+    if row.reply_to:
+        message["Reply-To"] = row.reply_to
+    message["Subject"] = row.subject
+    message["Date"] = formatdate(localtime=False)
+    # Stable across retries, so a resend after an ambiguous failure can be spotted
+    message["Message-ID"] = make_msgid(idstring=f"outbound-{row.id}", domain=MAIL_FROM.rsplit("@", 1)[-1])
+    message.set_content(row.body)
+    return message
+
+
+def is_permanent(error):
+    """5xx answers will not change on retry; connection trouble and 4xx might"""
+    code = getattr(error, "smtp_code", None)
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return bool(codes) and all(500 <= c < 600 for c in codes)
+    return code is not None and 500 <= code < 600
+
+
+class MailQueue:
+    """
+    Rows in ``outbound_emails`` are the queue. Each worker runs a sender
+    thread that claims due rows in batches (a claim token makes that safe
+    across workers), sends them over its pooled connection and records the
+    outcome with exponential backoff for retries.
+
+    An idle sender only reads: it sleeps until the next retry is due (at
+    most MAIL_IDLE_POLL) unless a submission in its own worker wakes it, and
+    it writes a claim only when there are due rows to take.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._app = None
+        self._thread = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self.pool = SmtpPool()
+        self._stats = {
+            "enqueued": 0, "duplicates": 0, "sent": 0, "retried": 0, "failed": 0, "batches": 0,
+            "last_batch_size": 0, "total_send_ms": 0.0, "max_send_ms": 0.0, "last_error": None,
+        }
+
+    def enqueue(self, app, to_address, subject, body, reply_to=None, key=None):
+        """Persist one message; returns (row id, duplicate). Needs an app context."""
+        from sqlalchemy.exc import IntegrityError
+        from models import OutboundEmail, db
+
+        key = key or dedupe_key(to_address, reply_to, subject, body)
+        row = OutboundEmail(dedupe_key=key, to_address=to_address, reply_to=reply_to, subject=subject,
+                            body=body, next_attempt_at=datetime.utcnow())
+        db.session.add(row)
+        try:
+            db.session.commit()
+            duplicate = False
+        except IntegrityError:
+            db.session.rollback()
+            row = OutboundEmail.query.filter_by(dedupe_key=key).one()
+            duplicate = True
+
+        with self._lock:
+            self._stats["duplicates" if duplicate else "enqueued"] += 1
+        if not duplicate:
+            self.start(app)
+            self._wake.set()
+        return row.id, duplicate
+
+    def start(self, app):
+        if self._pid != os.getpid():
+            # Forked from a process whose sender thread did not come along
+            self._reset()
+        if not MAIL_SENDER or not SMTP_HOST:
+            return
+        with self._lock:
+            if self._app is None:
+                self._app = app
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="mail-sender", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        wait = 0
+        while True:
+            self._wake.wait(wait)
+            self._wake.clear()
+            try:
+                with self._app.app_context():
+                    while self.drain_once():
+                        pass
+                    wait = self.idle_wait()
+            except Exception as e:
+                logger.error(f"Mail sender failed: {e}")
+                wait = MAIL_POLL
+            if self.pool.conn is not None and time.monotonic() - self.pool.last_used > SMTP_IDLE_SECONDS:
+                self.pool.close()
+
+    def idle_wait(self):
+        """Seconds until the earliest pending row falls due, within [MAIL_POLL, MAIL_IDLE_POLL]"""
+        from sqlalchemy import func, select
+        from models import OutboundEmail, db
+
+        next_due = db.session.execute(select(func.min(OutboundEmail.next_attempt_at))
+                                      .where(OutboundEmail.status == "queued")).scalar()
+        reclaim = db.session.execute(select(func.min(OutboundEmail.claimed_until))
+                                     .where(OutboundEmail.status == "sending")).scalar()
+        db.session.rollback()
+        due = [when for when in (next_due, reclaim) if when is not None]
+        if not due:
+            return MAIL_IDLE_POLL
+        seconds = (min(due) - datetime.utcnow()).total_seconds()
+        return min(MAIL_IDLE_POLL, max(MAIL_POLL, seconds))
+
+    def claim(self):
+        """Atomically take up to MAIL_BATCH due rows; returns them"""
+        from sqlalchemy import and_, or_, select, update
+        from models import OutboundEmail, db
+
+        now = datetime.utcnow()
+        is_due = or_(
+            and_(OutboundEmail.status == "queued", OutboundEmail.next_attempt_at <= now),
+            # Rows left mid-send by a worker that died
+            and_(OutboundEmail.status == "sending", OutboundEmail.claimed_until < now),
+        )
+        # Read first: an UPDATE that matches nothing still takes the write lock
+        ids = db.session.execute(select(OutboundEmail.id).where(is_due)
+                                 .order_by(OutboundEmail.next_attempt_at, OutboundEmail.id)
+                                 .limit(MAIL_BATCH)).scalars().all()
+        if not ids:
+            db.session.rollback()
+            return []
+        token = uuid.uuid4().hex
+        # is_due again, so a row another sender claimed in between is left alone
+        db.session.execute(
+            update(OutboundEmail)
+            .where(OutboundEmail.id.in_(ids))
+            .where(is_due)
+            .values(status="sending", claim_token=token, claimed_until=now + timedelta(seconds=MAIL_CLAIM_TTL))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return OutboundEmail.query.filter_by(claim_token=token, status="sending").order_by(OutboundEmail.id).all()
+
+    def drain_once(self):
+        """Claim and send one batch; returns how many rows it handled (0 without SMTP_HOST)"""
+        from models import db
+
+        if not SMTP_HOST:
+            return 0
+        rows = self.claim()
+        if not rows:
+            return 0
+        # Every row of a claim shares one token; read it before any commit
+        # reloads a row whose claim another sender may have taken since
+        token = rows[0].claim_token
+        for row in rows:
+            # A batch of slow sends can outlast MAIL_CLAIM_TTL, so each row's
+            # claim is renewed right before its send, and skipped if it lapsed
+            if not self._renew(row.id, token):
+                continue
+            started = time.perf_counter()
+            try:
+                self.pool.send(build_message(row))
+            except (smtplib.SMTPException, OSError) as e:
+                # A refused message leaves the session usable (smtplib sends RSET);
+                # anything else may have broken the connection
+                if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                    self.pool.close()
+                self._record_failure(row, e)
+                db.session.commit()
+                continue
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            row.status, row.sent_at, row.claim_token, row.last_error = "sent", datetime.utcnow(), None, None
+            # Committed per message: a crash later in the batch must not send it again
+            db.session.commit()
+            with self._lock:
+                self._stats["sent"] += 1
+                self._stats["total_send_ms"] += elapsed_ms
+                self._stats["max_send_ms"] = max(self._stats["max_send_ms"], elapsed_ms)
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["last_batch_size"] = len(rows)
+        return len(rows)
+
+    def _renew(self, row_id, token):
+        """Extend this sender's claim on one row; False if the claim was lost"""
+        from sqlalchemy import update
+        from models import OutboundEmail, db
+
+        renewed = db.session.execute(
+            update(OutboundEmail)
+            .where(OutboundEmail.id == row_id, OutboundEmail.claim_token == token,
+                   OutboundEmail.status == "sending")
+            .values(claimed_until=datetime.utcnow() + timedelta(seconds=MAIL_CLAIM_TTL))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        return renewed == 1
+
+    def _record_failure(self, row, error):
+        row.attempts += 1
+        row.last_error = str(error)[:1000]
+        row.claim_token = None
+        if is_permanent(error) or row.attempts >= MAIL_MAX_ATTEMPTS:
+            row.status = "failed"
+            key = "failed"
+            logger.error(f"❌ Email {row.id} failed permanently after {row.attempts} attempts: {error}")
+        else:
+            row.status = "queued"
+            row.next_attempt_at = datetime.utcnow() + timedelta(seconds=backoff(row.attempts))
+            key = "retried"
+            logger.warning(f"⚠️ Email {row.id} attempt {row.attempts} failed, retrying: {error}")
+        with self._lock:
+            self._stats[key] += 1
+            self._stats["last_error"] = row.last_error
+
+    def flush(self, timeout=30.0):
+        """Send everything due now from the calling thread (tests, CLI); returns rows handled"""
+        handled = 0
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            count = self.drain_once()
+            if not count:
+                break
+            handled += count
+        return handled
+
+    def stats(self):
+        from sqlalchemy import func
+        from models import OutboundEmail, db
+
+        depth = dict(db.session.query(OutboundEmail.status, func.count()).group_by(OutboundEmail.status).all())
+        oldest = db.session.query(func.min(OutboundEmail.created_at))\
+            .filter(OutboundEmail.status.in_(("queued", "sending"))).scalar()
+        with self._lock:
+            stats = dict(self._stats)
+        sent = stats["sent"] or 1
+        stats.update({
+            "queue_depth": depth.get("queued", 0) + depth.get("sending", 0),
+            "by_status": depth,
+            "oldest_pending_s": round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest else 0.0,
+            "avg_send_ms": round(stats.pop("total_send_ms") / sent, 2),
+            "max_send_ms": round(stats["max_send_ms"], 2),
+            "smtp_connections_opened": self.pool.opened,
+            "smtp_host": SMTP_HOST,
+        })
+        return stats
+
+
+mail_queue = MailQueue()
+
+
+def init_app(app):
+    @app.before_request
+    def start_mail_sender():
+        # Serving workers drain anything a previous process left queued
+        # without waiting for a new submission; CLI commands never start it
+        if mail_queue._thread is None or mail_queue._pid != os.getpid():
+            mail_queue.start(app)
+
+    @app.cli.command("send-queued-mail")
+    def send_queued_mail_command():
+        """Send every due message in the outbound mail queue now."""
+        if not SMTP_HOST:
+            raise click.ClickException("SMTP_HOST is not set; queued messages are left for a sender that has it")
+        click.echo(f"📧 Sent or retried {mail_queue.flush()} queued messages")
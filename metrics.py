@@ -0,0 +1,247 @@
+# metrics.py - per-stage request timing, Prometheus /metrics and an optional Server-Timing header
+import os
+import hmac
+import time
+
+from flask import Response, abort, g, has_request_context, request
+
+try:
+    import prometheus_client
+except ImportError:  # optional: spans still feed Server-Timing, /metrics answers 501
+    prometheus_client = None
+
+# --------------------------------------------------
+# Configuration
+# --------------------------------------------------
+
+METRICS_ENABLED = os.getenv("METRICS", "1") not in ("0", "false", "False")
+# Adds Server-Timing to every response (stage durations show up in browser dev tools)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") in ("1", "true", "True")
+# When set, /metrics requires "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# With several gunicorn workers, point this at an empty directory so /metrics
+# aggregates every worker (prometheus_client multiprocess mode)
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Seconds; chat turns wait on upstream, so the range reaches past the 20s
+# COHERE_CHAT_DEADLINE default
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+_metrics = None
+
+
+class _Metrics:
+    """The collectors, created once and only when prometheus_client is installed"""
+
+    def __init__(self):
+        from prometheus_client import Counter, Histogram
+
+        self.requests = Counter("elmed_http_requests_total", "HTTP requests",
+                                ["endpoint", "method", "status"])
+        self.request_seconds = Histogram("elmed_http_request_duration_seconds", "HTTP request latency",
+                                         ["endpoint"], buckets=REQUEST_BUCKETS)
+        self.stage_seconds = Histogram("elmed_chat_stage_duration_seconds", "Time per chat turn stage",
+                                       ["stage"], buckets=REQUEST_BUCKETS)
+        self.attempts = Counter("elmed_cohere_attempts_total", "Cohere model attempts", ["model", "outcome"])
+        self.attempt_seconds = Histogram("elmed_cohere_attempt_duration_seconds", "Cohere model attempt latency",
+                                         ["model"], buckets=REQUEST_BUCKETS)
+        self.model_wins = Counter("elmed_chat_model_wins_total", "Chat replies served per model", ["model"])
+        self.replies = Counter("elmed_chat_replies_total", "Chat replies by source", ["source"])
+        self.shed = Counter("elmed_admission_shed_total", "Chat turns shed to the fallback", ["reason"])
+        self.cache = Counter("elmed_response_cache_lookups_total", "Response cache lookups", ["result"])
+        self.db_seconds = Histogram("elmed_db_query_duration_seconds", "SQL statement latency",
+                                    ["operation"], buckets=DB_BUCKETS)
+
+
+def collectors():
+    """The shared collectors, or None when metrics are off or unavailable"""
+    global _metrics
+    if _metrics is None and METRICS_ENABLED and prometheus_client is not None:
+        _metrics = _Metrics()
+    return _metrics
+
+
+# --------------------------------------------------
+# Spans
+# --------------------------------------------------
+
+class span:
+    """
+    Time one stage: ``with metrics.span("history"): ...``
+
+    Observed into the stage histogram and, inside a request, kept for the
+    Server-Timing header. A plain class rather than @contextmanager: this
+    sits on the hot path of every chat turn.
+    """
+
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record_stage(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+def record_stage(stage, seconds):
+    m = collectors()
+    if m is not None:
+        m.stage_seconds.labels(stage).observe(seconds)
+    if SERVER_TIMING and has_request_context():
+        timings = g.setdefault("_stage_timings", [])
+        timings.append((stage, seconds))
+
+
+def record_attempt(result):
+    """cohere_client attempt hook: latency and outcome of every model attempt"""
+    m = collectors()
+    if m is None:
+        return
+    if result.text:
+        outcome = "ok"
+    elif result.status:
+        outcome = f"http_{result.status}"
+    else:
+        outcome = "error"
+    m.attempts.labels(result.model, outcome).inc()
+    m.attempt_seconds.labels(result.model).observe(result.elapsed)
+
+
+def record_reply(source):
+    """One chat reply by source: cohere, cache, shed, fallback or error_fallback"""
+    m = collectors()
+    if m is not None:
+        m.replies.labels(source).inc()
+
+
+def record_model_win(model):
+    """The model whose answer was used for a reply"""
+    m = collectors()
+    if m is not None:
+        m.model_wins.labels(model).inc()
+
+
+def record_shed(reason):
+    """A turn refused an upstream slot: rate, queue_full, wait_budget or timeout"""
+    m = collectors()
+    if m is not None:
+        m.shed.labels(reason).inc()
+
+
+def record_cache(result):
+    """Response cache lookup: hit, miss or bypass"""
+    m = collectors()
+    if m is not None:
+        m.cache.labels(result).inc()
+
+
+# --------------------------------------------------
+# SQLAlchemy statement timing
+# --------------------------------------------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    m = collectors()
+    if m is not None:
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        if operation not in ("SELECT", "INSERT", "UPDATE", "DELETE"):
+            operation = "OTHER"
+        m.db_seconds.labels(operation).observe(elapsed)
+    if SERVER_TIMING and has_request_context():
+        g._db_seconds = g.get("_db_seconds", 0.0) + elapsed
+        g._db_queries = g.get("_db_queries", 0) + 1
+
+
+def instrument_engine(engine):
+    from sqlalchemy import event
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# --------------------------------------------------
+# Flask wiring
+# --------------------------------------------------
+
+def server_timing_header(total):
+    parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in g.get("_stage_timings", [])]
+    if g.get("_db_queries"):
+        parts.append(f'db;dur={g._db_seconds * 1000:.1f};desc="{g._db_queries} queries"')
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def render():
+    """(body, content type) of the exposition for this process, or every worker in multiprocess mode"""
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """
+    Drop a dead worker's live-gauge files in multiprocess mode; called from
+    gunicorn's child_exit hook (gunicorn.conf.py)
+    """
+    if MULTIPROC_DIR and prometheus_client is not None:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid, MULTIPROC_DIR)
+
+
+def init_app(app, engine=None):
+    if not METRICS_ENABLED and not SERVER_TIMING:
+        return
+    if engine is not None:
+        instrument_engine(engine)
+
+    @app.before_request
+    def start_request_timer():
+        g._request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.get("_request_started")
+        if started is None:
+            return response
+        total = time.perf_counter() - started
+        m = collectors()
+        if m is not None:
+            # The URL rule, not the path, keeps label cardinality bounded
+            endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            m.requests.labels(endpoint, request.method, str(response.status_code)).inc()
+            m.request_seconds.labels(endpoint).observe(total)
+        if SERVER_TIMING:
+            # Streamed responses only cover the time to the first byte
+            response.headers["Server-Timing"] = server_timing_header(total)
+        return response
+
+    @app.route("/metrics")
+    def prometheus_metrics():
+        supplied = request.headers.get("Authorization", "")
+        if METRICS_TOKEN and not hmac.compare_digest(supplied.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+            abort(403)
+        if collectors() is None:
+            return Response("metrics are disabled or prometheus_client is not installed\n",
+                            status=501, mimetype="text/plain")
+        body, content_type = render()
+        return Response(body, content_type=content_type)
@@ -0,0 +1,231 @@
+# model_registry.py - per-model health tracking and circuit breakers for COHERE_MODELS
+import os
+import time
+import logging
+import threading
+
+from local_store import get_store
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# Configuration
+# --------------------------------------------------
+
+FAILURE_THRESHOLD = int(os.getenv("MODEL_FAILURE_THRESHOLD", "3"))   # consecutive failures to trip
+OPEN_COOLDOWN = float(os.getenv("MODEL_OPEN_COOLDOWN", "30"))         # first open period (s)
+MAX_COOLDOWN = float(os.getenv("MODEL_MAX_COOLDOWN", "1800"))         # cap for repeated trips (s)
+PROBE_INTERVAL = float(os.getenv("MODEL_PROBE_INTERVAL", "15"))       # background prober tick (s)
+EWMA_ALPHA = 0.2
+REFRESH_INTERVAL = 1.0   # how long a worker trusts its cached snapshot (s)
+
+# Errors that mean "this model will never work for us" trip the breaker at once.
+# A 400 is not one of them: it usually describes the payload (one user's
+# message), not the model, so it only counts toward FAILURE_THRESHOLD.
+PERMANENT_ERRORS = {"not_found"}
+
+NAMESPACE = "model_health"
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+_snapshot = {}
+_snapshot_at = 0.0
+_prober = None
+_prober_lock = threading.Lock()
+
+
+def classify_error(result):
+    """Map an AttemptResult to a coarse error class (None on success)"""
+    if result.ok:
+        return None
+    if result.status == 200:
+        return "empty"
+    if result.status is not None:
+        if result.status == 404:
+            return "not_found"
+        if result.status == 400:
+            return "bad_request"
+        if result.status in (401, 403):
+            return "auth"
+        if result.status == 429:
+            return "rate_limited"
+        if result.status >= 500:
+            return "server_error"
+        return f"http_{result.status}"
+    # Matched by name so requests and httpx exceptions classify alike
+    error_name = type(result.error).__name__
+    if "Timeout" in error_name:
+        return "timeout"
+    if "Connect" in error_name:
+        return "connection"
+    return "error"
+
+
+def _new_entry():
+    return {
+        "state": STATE_CLOSED,
+        "successes": 0,
+        "failures": 0,
+        "consecutive_failures": 0,
+        "trips": 0,
+        "latency_ewma": None,
+        "last_error": None,
+        "last_error_at": None,
+        "opened_until": None,
+        "updated_at": None,
+    }
+
+
+def _apply(entry, error_class, elapsed, now):
+    entry = dict(_new_entry(), **(entry or {}))
+    entry["updated_at"] = now
+    if error_class is None:
+        entry["successes"] += 1
+        entry["consecutive_failures"] = 0
+        ewma = entry["latency_ewma"]
+        entry["latency_ewma"] = elapsed if ewma is None else (EWMA_ALPHA * elapsed + (1 - EWMA_ALPHA) * ewma)
+        if entry["state"] != STATE_CLOSED:
+            entry["state"] = STATE_CLOSED
+            entry["trips"] = 0
+            entry["opened_until"] = None
+        return entry
+
+    entry["failures"] += 1
+    entry["consecutive_failures"] += 1
+    entry["last_error"] = error_class
+    entry["last_error_at"] = now
+    should_trip = (
+        entry["state"] == STATE_HALF_OPEN
+        or error_class in PERMANENT_ERRORS
+        or entry["consecutive_failures"] >= FAILURE_THRESHOLD
+    )
+    if should_trip:
+        entry["trips"] += 1
+        cooldown = MAX_COOLDOWN if error_class in PERMANENT_ERRORS else \
+            min(MAX_COOLDOWN, OPEN_COOLDOWN * (2 ** (entry["trips"] - 1)))
+        entry["state"] = STATE_OPEN
+        entry["opened_until"] = now + cooldown
+    return entry
+
+
+def record(result):
+    """Fold one attempt outcome into the shared registry"""
+    error_class = classify_error(result)
+    now = time.time()
+    previous = {}
+
+    def fold(current):
+        previous["state"] = (current or {}).get("state", STATE_CLOSED)
+        return _apply(current, error_class, result.elapsed, now)
+
+    try:
+        entry = get_store().update(NAMESPACE, result.model, fold)
+    except Exception as e:
+        logger.warning("Model registry update failed for %s: %s", result.model, e)
+        return
+    _snapshot[result.model] = entry
+    if entry["state"] != previous["state"]:
+        if entry["state"] == STATE_OPEN:
+            logger.warning("🔌 Circuit opened for model %s (%s)", result.model, error_class)
+        elif entry["state"] == STATE_CLOSED:
+            logger.info("✅ Circuit closed for model %s", result.model)
+
+
+def snapshot(force=False):
+    """Return ``{model: entry}``, re-read from the shared store at most once per second"""
+    global _snapshot, _snapshot_at
+    now = time.monotonic()
+    if force or now - _snapshot_at > REFRESH_INTERVAL:
+        try:
+            _snapshot = get_store().items(NAMESPACE)
+        except Exception as e:
+            logger.warning("Model registry read failed: %s", e)
+        _snapshot_at = now
+    return _snapshot
+
+
+def ordered_models(models):
+    """
+    Return the live dispatch order: healthy models first, fastest EWMA first.
+
+    Models with an open breaker are left out. Unmeasured models keep their
+    static position behind the measured ones. If every model is open, the
+    static list is returned so a chat turn still has something to try.
+    """
+    entries = snapshot()
+    ranked = []
+    for index, model in enumerate(models):
+        entry = entries.get(model)
+        if entry and entry["state"] != STATE_CLOSED:
+            continue
+        if entry and entry["latency_ewma"] is not None:
+            total = entry["successes"] + entry["failures"]
+            success_rate = entry["successes"] / total if total else 1.0
+            ranked.append((0, entry["latency_ewma"] / max(success_rate, 0.1), index, model))
+        else:
+            ranked.append((1, 0.0, index, model))
+    if not ranked:
+        return list(models)
+    return [model for _, _, _, model in sorted(ranked)]
+
+
+# --------------------------------------------------
+# Half-open probing
+# --------------------------------------------------
+
+def _claim_probe(model, now):
+    """Move an expired open breaker to half-open; only one worker wins the claim"""
+    claimed = []
+
+    def claim(entry):
+        entry = dict(_new_entry(), **(entry or {}))
+        if entry["state"] == STATE_OPEN and (entry["opened_until"] or 0) <= now:
+            entry["state"] = STATE_HALF_OPEN
+            # If the probe dies with its worker, the breaker re-arms after this
+            entry["opened_until"] = now + OPEN_COOLDOWN
+            claimed.append(model)
+        elif entry["state"] == STATE_HALF_OPEN and (entry["opened_until"] or 0) <= now:
+            entry["opened_until"] = now + OPEN_COOLDOWN
+            claimed.append(model)
+        return entry
+
+    get_store().update(NAMESPACE, model, claim)
+    return bool(claimed)
+
+
+def probe_due_models(api_key, models):
+    """Send a tiny request to every model whose open period has elapsed"""
+    import cohere_client
+
+    now = time.time()
+    for model, entry in snapshot(force=True).items():
+        if model not in models or entry["state"] == STATE_CLOSED:
+            continue
+        if (entry["opened_until"] or 0) > now or not _claim_probe(model, now):
+            continue
+        logger.info("🩺 Probing model %s", model)
+        cohere_client.attempt(api_key, model, {'message': 'ping', 'max_tokens': 5},
+                              cohere_client.ATTEMPT_TIMEOUT)
+
+
+def ensure_prober(api_key, models):
+    """Start this worker's background prober thread once"""
+    global _prober
+    if _prober is not None and _prober.is_alive():
+        return
+    with _prober_lock:
+        if _prober is not None and _prober.is_alive():
+            return
+
+        def run():
+            while True:
+                time.sleep(PROBE_INTERVAL)
+                try:
+                    probe_due_models(api_key, models)
+                except Exception as e:
+                    logger.warning("Model probe failed: %s", e)
+
+        _prober = threading.Thread(target=run, name="model-prober", daemon=True)
+        _prober.start()
@@ -33,11 +33,28 @@ class Concern(db.Model):
     # Relationships
     author = relationship('User', back_populates='concerns')
 
+class ConcernRank(db.Model):
+    """Precomputed sort keys for the concerns board, kept in step by concern_rank.sync()"""
+    __tablename__ = 'concern_rank'
+    concern_id = db.Column(db.Integer, db.ForeignKey('concerns.id', ondelete='CASCADE'), primary_key=True)
+    category = db.Column(db.String(50), nullable=False)
+    state = db.Column(db.SmallInteger, nullable=False)  # 2 open and unanswered, 1 responded, 0 closed
+    hot_score = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    # hot and unanswered read (state, hot_score, concern_id) descending; new reads (created_at, concern_id)
+    __table_args__ = (
+        db.Index('ix_concern_rank_hot', 'state', 'hot_score', 'concern_id'),
+        db.Index('ix_concern_rank_category_hot', 'category', 'state', 'hot_score', 'concern_id'),
+        db.Index('ix_concern_rank_new', 'created_at', 'concern_id'),
+        db.Index('ix_concern_rank_category_new', 'category', 'created_at', 'concern_id'),
+    )
+
 class ChatMessage(db.Model):
     __tablename__ = 'chat_messages'
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
-    session_id = db.Column(db.String(100), nullable=False, index=True)
+    session_id = db.Column(db.String(100), nullable=False)
     role = db.Column(db.String(20), nullable=False)  # 'user' or 'assistant'
     content = db.Column(db.Text, nullable=False)
     is_mental_health_related = db.Column(db.Boolean, default=True)
@@ -46,6 +63,33 @@ class ChatMessage(db.Model):
     # Relationships
     user = relationship('User', back_populates='chat_messages')
 
+    # Serves history lookups and keyset pages by session in (created_at, id) order
+    __table_args__ = (
+        db.Index('ix_chat_messages_session_created_id', 'session_id', 'created_at', 'id'),
+    )
+
+class ChatArchive(db.Model):
+    """One archived slice of a session: which Parquet file holds it and the id range it covers"""
+    __tablename__ = 'chat_archive_index'
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(100), nullable=False, index=True)
+    path = db.Column(db.String(500), nullable=False)  # relative to CHAT_ARCHIVE_DIR
+    message_count = db.Column(db.Integer, nullable=False)
+    max_message_id = db.Column(db.Integer, nullable=False)
+    first_message_at = db.Column(db.DateTime, nullable=True)
+    last_message_at = db.Column(db.DateTime, nullable=True)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ChatSummary(db.Model):
+    __tablename__ = 'chat_summaries'
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(100), unique=True, nullable=False)
+    summary = db.Column(db.Text, nullable=False, default='')
+    last_turn = db.Column(db.String(40), nullable=True)  # fingerprint of the newest summarized turn
+    summarized_turns = db.Column(db.Integer, default=0)
+    tokens = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class CommunityPost(db.Model):
     __tablename__ = 'community_posts'
     id = db.Column(db.Integer, primary_key=True)
@@ -64,6 +108,12 @@ class CommunityPost(db.Model):
     # Relationships
     comments = relationship('PostComment', back_populates='post', cascade='all, delete-orphan')
 
+    # Feed order is featured first, then newest; the category index serves filtered feeds
+    __table_args__ = (
+        db.Index('ix_community_posts_feed', 'is_approved', 'is_featured', 'created_at', 'id'),
+        db.Index('ix_community_posts_category_feed', 'category', 'is_approved', 'is_featured', 'created_at', 'id'),
+    )
+
 class PostComment(db.Model):
     __tablename__ = 'post_comments'
     id = db.Column(db.Integer, primary_key=True)
@@ -73,4 +123,37 @@ class PostComment(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
-    post = relationship('CommunityPost', back_populates='comments')
\ No newline at end of file
+    post = relationship('CommunityPost', back_populates='comments')
+
+    __table_args__ = (
+        db.Index('ix_post_comments_post_created', 'post_id', 'created_at', 'id'),
+    )
+
+class OutboundEmail(db.Model):
+    """Contact-form mail waiting for (or done with) the mail_queue sender"""
+    __tablename__ = 'outbound_emails'
+    id = db.Column(db.Integer, primary_key=True)
+    dedupe_key = db.Column(db.String(64), unique=True, nullable=False)  # repeated submissions collapse here
+    to_address = db.Column(db.String(200), nullable=False)
+    reply_to = db.Column(db.String(200), nullable=True)
+    subject = db.Column(db.String(300), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, sending, sent, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    claim_token = db.Column(db.String(32), nullable=True)
+    claimed_until = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    # The sender's claim query: due rows by status in retry order
+    __table_args__ = (
+        db.Index('ix_outbound_emails_status_next', 'status', 'next_attempt_at'),
+    )
+
+def ensure_indexes():
+    """Create indexes added after their table already existed (create_all skips those)"""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
@@ -0,0 +1,106 @@
+# page_cache.py - rendered, precompressed pages for templates that do not vary per request
+import os
+import gzip
+import time
+import hashlib
+import threading
+
+from flask import current_app, render_template, request
+
+import assets
+
+# --------------------------------------------------
+# Configuration
+# --------------------------------------------------
+
+# How often (seconds) template and asset-manifest mtimes are re-checked;
+# 0 renders once per process, i.e. once per deploy
+PAGE_CACHE_RELOAD = float(os.getenv("PAGE_CACHE_RELOAD", "2"))
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE", "1") not in ("0", "false", "False")
+# Pages are compressed in the request that renders them (first hit per worker
+# and after every invalidation), so this stays low; build-assets uses 11 offline
+PAGE_BROTLI_QUALITY = int(os.getenv("PAGE_BROTLI_QUALITY", "5"))
+
+_pages = {}   # template name -> CachedPage
+_lock = threading.Lock()
+_fingerprint = None
+_fingerprint_checked = 0.0
+_stats = {"hits": 0, "renders": 0, "not_modified": 0}
+
+
+class CachedPage:
+    """One rendered template with its gzip/brotli bodies and a content ETag"""
+
+    def __init__(self, fingerprint, html):
+        self.fingerprint = fingerprint
+        self.bodies = {"identity": html}
+        self.bodies["gzip"] = gzip.compress(html, compresslevel=9, mtime=0)
+        if assets.brotli is not None:
+            self.bodies["br"] = assets.brotli.compress(html, quality=PAGE_BROTLI_QUALITY)
+        self.etag = hashlib.sha256(html).hexdigest()[:20]
+
+
+def template_fingerprint():
+    """
+    Newest mtime among the templates and the asset manifest.
+
+    Pages pull in includes and asset_url() output, so any template edit or
+    asset rebuild invalidates every cached page.
+    """
+    global _fingerprint, _fingerprint_checked
+    now = time.monotonic()
+    if _fingerprint is not None and (PAGE_CACHE_RELOAD <= 0 or now - _fingerprint_checked < PAGE_CACHE_RELOAD):
+        return _fingerprint
+    newest = 0
+    for entry in os.scandir(assets.TEMPLATE_DIR):
+        if entry.is_file() and entry.name.endswith(".html"):
+            newest = max(newest, entry.stat().st_mtime_ns)
+    if os.path.exists(assets.MANIFEST_PATH):
+        newest = max(newest, os.stat(assets.MANIFEST_PATH).st_mtime_ns)
+    _fingerprint, _fingerprint_checked = newest, now
+    return newest
+
+
+def get_page(template_name):
+    fingerprint = template_fingerprint()
+    page = _pages.get(template_name)
+    if page is not None and page.fingerprint == fingerprint:
+        _stats["hits"] += 1
+        return page
+    with _lock:
+        page = _pages.get(template_name)
+        if page is None or page.fingerprint != fingerprint:
+            html = render_template(template_name).encode("utf-8")
+            page = _pages[template_name] = CachedPage(fingerprint, html)
+            _stats["renders"] += 1
+    return page
+
+
+def render_cached(template_name, status=200):
+    """Response for a request-independent template, rendered once and served from memory"""
+    if not PAGE_CACHE_ENABLED:
+        return render_template(template_name), status
+
+    page = get_page(template_name)
+    accepted = assets.accepted_encodings()
+    encoding = next((name for name in ("br", "gzip") if name in accepted and name in page.bodies), "identity")
+    etag = page.etag if encoding == "identity" else f"{page.etag}-{encoding}"
+
+    response = current_app.response_class(mimetype="text/html")
+    response.status_code = status
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "public, no-cache"
+    response.vary.add("Accept-Encoding")
+    if status == 200 and request.if_none_match.contains(etag):
+        _stats["not_modified"] += 1
+        response.status_code = 304
+        return response
+
+    response.set_data(page.bodies[encoding])
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def stats():
+    return dict(_stats, pages=sorted(_pages))
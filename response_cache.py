@@ -0,0 +1,219 @@
+# response_cache.py - TTL + LRU cache for Cohere replies to repeated chat prompts
+import os
+import re
+import time
+import atexit
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+# --------------------------------------------------
+# Configuration
+# --------------------------------------------------
+
+# 'memory' (per worker), 'shared' (local_store file, all workers) or 'off'
+CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+HISTORY_TURNS = 2   # earlier turns folded into the key
+# Shared backend: a hit only rewrites last_access once it is this stale, and
+# hit/miss counters reach the store this often, so lookups stay read-only
+TOUCH_INTERVAL = float(os.getenv("RESPONSE_CACHE_TOUCH_SECONDS", "60"))
+
+_NON_WORD = re.compile(r"[^\w\s']+")
+_SPACES = re.compile(r"\s+")
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def normalize(message):
+    """Lower-case, drop punctuation and collapse whitespace"""
+    return _SPACES.sub(" ", _NON_WORD.sub(" ", message.lower())).strip()
+
+
+def cache_key(message, chat_history):
+    """
+    Key on the normalized message plus a fingerprint of the turns before it.
+
+    ``chat_history`` may already end with the current user message (it is
+    saved before history is read); that entry is not part of the fingerprint.
+    """
+    history = list(chat_history or [])
+    if history and history[-1].get("role") == "USER" and history[-1].get("message") == message:
+        history.pop()
+    fingerprint = [(entry.get("role"), normalize(entry.get("message", ""))) for entry in history[-HISTORY_TURNS:]]
+    raw = json.dumps([normalize(message), fingerprint], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    """Per-process OrderedDict LRU with expiry"""
+
+    name = "memory"
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.counters = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "evictions": 0}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None or item[1] < time.time():
+                if item is not None:
+                    del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return item[0]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.time() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def incr(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, entries=len(self.entries))
+
+
+class SharedBackend:
+    """LRU table in the local_store SQLite file, shared by every worker on the host"""
+
+    name = "shared"
+    NAMESPACE = "response_cache_stats"
+
+    def __init__(self, ttl, max_entries):
+        from local_store import get_store
+
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.store = get_store()
+        self.lock = threading.Lock()
+        self.pending = {}           # counter increments not yet written to the store
+        self.flushed_at = time.monotonic()
+        atexit.register(self.flush_counters)
+        with self.store.transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_lru ON response_cache (last_access)")
+
+    def get(self, key):
+        now = time.time()
+        conn = self.store.connection()
+        row = conn.execute("SELECT value, expires_at, last_access FROM response_cache WHERE key = ?",
+                           (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] < now:
+            conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+            return None
+        # LRU order only needs to be coarse: skip the write lock on most hits
+        if now - row[2] >= TOUCH_INTERVAL:
+            conn.execute("UPDATE response_cache SET last_access = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def put(self, key, value):
+        now = time.time()
+        with self.store.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now + self.ttl, now)
+            )
+            overflow = conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM response_cache WHERE key IN "
+                    "(SELECT key FROM response_cache ORDER BY last_access LIMIT ?)", (overflow,)
+                )
+        if overflow > 0:
+            self.incr("evictions", overflow)
+
+    def incr(self, counter, amount=1):
+        with self.lock:
+            self.pending[counter] = self.pending.get(counter, 0) + amount
+            due = time.monotonic() - self.flushed_at >= TOUCH_INTERVAL
+        if due:
+            self.flush_counters()
+
+    def flush_counters(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushed_at = time.monotonic()
+        for counter, amount in pending.items():
+            self.store.update(self.NAMESPACE, counter, lambda value, amount=amount: (value or 0) + amount)
+
+    def stats(self):
+        # Other workers' counts can lag by up to TOUCH_INTERVAL
+        self.flush_counters()
+        counters = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "evictions": 0}
+        counters.update(self.store.items(self.NAMESPACE))
+        counters["entries"] = self.store.connection().execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+        return counters
+
+
+def get_backend():
+    """Return the configured backend, or None when caching is off"""
+    global _backend
+    if CACHE_BACKEND == "off":
+        return None
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend_class = SharedBackend if CACHE_BACKEND == "shared" else MemoryBackend
+                _backend = backend_class(CACHE_TTL, CACHE_MAX_ENTRIES)
+    return _backend
+
+
+def get(key):
+    """Return the cached reply for ``key`` (counting the hit or miss)"""
+    backend = get_backend()
+    if backend is None:
+        return None
+    value = backend.get(key)
+    backend.incr("hits" if value is not None else "misses")
+    return value
+
+
+def put(key, value):
+    backend = get_backend()
+    if backend is not None and value:
+        backend.put(key, value)
+        backend.incr("stores")
+
+
+def record_bypass():
+    """Count a message that was deliberately not looked up (crisis content)"""
+    backend = get_backend()
+    if backend is not None:
+        backend.incr("bypassed")
+
+
+def stats():
+    backend = get_backend()
+    if backend is None:
+        return {"backend": "off"}
+    counters = backend.stats()
+    lookups = counters["hits"] + counters["misses"]
+    counters.update({
+        "backend": backend.name,
+        "hit_ratio": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+        # Every hit is one Cohere round trip that did not happen
+        "upstream_calls_saved": counters["hits"],
+    })
+    return counters
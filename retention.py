@@ -0,0 +1,412 @@
+# retention.py - archive old chat sessions to date-partitioned Parquet and keep chat_messages small
+import os
+import time
+import importlib.util
+import uuid
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+
+import click
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# Configuration
+# --------------------------------------------------
+
+# Sessions whose newest message is older than this move to the archive
+RETENTION_DAYS = int(os.getenv("CHAT_RETENTION_DAYS", "90"))
+# Unset: <app instance folder>/chat_archive (see init_app), never relative to the cwd
+ARCHIVE_DIR = os.getenv("CHAT_ARCHIVE_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "instance", "chat_archive")
+ARCHIVE_COMPRESSION = os.getenv("CHAT_ARCHIVE_COMPRESSION", "zstd")
+SESSIONS_PER_CHUNK = int(os.getenv("RETENTION_SESSIONS_PER_CHUNK", "500"))  # sessions per Parquet write
+DELETE_BATCH = int(os.getenv("RETENTION_DELETE_BATCH", "500"))             # rows per delete transaction
+# Pause between delete batches so chat writes get the lock in between
+BATCH_PAUSE = float(os.getenv("RETENTION_BATCH_PAUSE_MS", "20")) / 1000.0
+VACUUM_PAGES = int(os.getenv("RETENTION_VACUUM_PAGES", "2000"))             # pages freed per incremental step
+# Background run every N hours in one worker per host; 0 leaves it to `flask archive-chats` (cron)
+INTERVAL = float(os.getenv("RETENTION_INTERVAL_HOURS", "0")) * 3600
+COLD_CACHE_SESSIONS = 256
+
+ArchivedMessage = namedtuple("ArchivedMessage", "id role content created_at is_mental_health_related")
+
+COLUMNS = ["id", "session_id", "user_id", "role", "content", "is_mental_health_related", "created_at"]
+
+# pyarrow is optional (without it archiving is unavailable and history reads
+# stay hot-only) and costs tens of ms to import, so it is imported only by
+# the functions that write or read Parquet, as export.archived_batches does
+AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+# How long a worker trusts "nothing has been archived yet" before asking the database again
+ARCHIVE_PROBE_TTL = 30.0
+
+_cold_cache = OrderedDict()
+_cold_lock = threading.Lock()
+_archive_known = False
+_archive_probed_at = None
+_stats = {"runs": 0, "sessions_archived": 0, "messages_archived": 0, "messages_deleted": 0,
+          "files_written": 0, "last_run_ms": 0.0, "cold_reads": 0, "cold_cache_hits": 0}
+
+
+# --------------------------------------------------
+# Archiving
+# --------------------------------------------------
+
+def expired_sessions(cutoff, max_sessions=None):
+    """Session ids whose newest message is older than ``cutoff``, oldest first"""
+    from sqlalchemy import func, select
+    from models import ChatMessage, db
+
+    last_at = func.max(ChatMessage.created_at)
+    query = select(ChatMessage.session_id).group_by(ChatMessage.session_id)\
+        .having(last_at < cutoff).order_by(last_at)
+    if max_sessions:
+        query = query.limit(max_sessions)
+    return [row[0] for row in db.session.execute(query)]
+
+
+def schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("id", pa.int64()),
+        ("session_id", pa.string()),
+        ("user_id", pa.int64()),
+        ("role", pa.string()),
+        ("content", pa.string()),
+        ("is_mental_health_related", pa.bool_()),
+        ("created_at", pa.timestamp("us")),
+    ])
+
+
+def write_partition(day, rows):
+    """Write ``rows`` (dicts, COLUMNS) to a new file under date=<day>/; returns its relative path"""
+    relative = os.path.join(f"date={day}", f"part-{int(time.time())}-{uuid.uuid4().hex[:8]}.parquet")
+    path = os.path.join(ARCHIVE_DIR, relative)
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pylist(rows, schema=schema())
+    # Rows are sorted by session, so row-group statistics let cold reads skip most of the file
+    tmp = f"{path}.tmp"
+    pq.write_table(table, tmp, compression=ARCHIVE_COMPRESSION, row_group_size=10000,
+                   use_dictionary=["session_id", "role"])
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return relative
+
+
+def delete_ids(ids):
+    """Delete hot rows by id in short transactions; returns the number removed"""
+    from models import ChatMessage, db
+
+    table = ChatMessage.__table__
+    deleted = 0
+    for start in range(0, len(ids), DELETE_BATCH):
+        batch = ids[start:start + DELETE_BATCH]
+        with db.engine.begin() as conn:
+            deleted += conn.execute(table.delete().where(table.c.id.in_(batch))).rowcount
+        if BATCH_PAUSE and start + DELETE_BATCH < len(ids):
+            time.sleep(BATCH_PAUSE)
+    return deleted
+
+
+def archive_chunk(session_ids):
+    """Archive and delete the hot rows of ``session_ids``; returns (files, sessions, archived, deleted)"""
+    from sqlalchemy import func, select
+    from models import ChatArchive, ChatMessage, db
+
+    table = ChatMessage.__table__
+    rows = db.session.execute(
+        select(*(table.c[name] for name in COLUMNS))
+        .where(table.c.session_id.in_(session_ids))
+        .order_by(table.c.session_id, table.c.created_at, table.c.id)
+    ).mappings().all()
+    # Rows an earlier, interrupted run already archived only need deleting
+    archived_upto = dict(db.session.execute(
+        select(ChatArchive.session_id, func.max(ChatArchive.max_message_id))
+        .where(ChatArchive.session_id.in_(session_ids)).group_by(ChatArchive.session_id)
+    ).all())
+
+    sessions = OrderedDict()
+    for row in rows:
+        if row["id"] > archived_upto.get(row["session_id"], 0):
+            sessions.setdefault(row["session_id"], []).append(dict(row))
+
+    # Partition by the day of each session's last message: a session lives in one file
+    partitions = OrderedDict()
+    for session_id, messages in sessions.items():
+        day = messages[-1]["created_at"].date().isoformat()
+        partitions.setdefault(day, []).append((session_id, messages))
+
+    files = 0
+    for day, members in partitions.items():
+        relative = write_partition(day, [row for _, messages in members for row in messages])
+        files += 1
+        for session_id, messages in members:
+            db.session.add(ChatArchive(
+                session_id=session_id, path=relative, message_count=len(messages),
+                max_message_id=max(row["id"] for row in messages),
+                first_message_at=messages[0]["created_at"], last_message_at=messages[-1]["created_at"],
+            ))
+    # The index commits before any delete, so a crash in between never loses a message
+    db.session.commit()
+    if files:
+        mark_archived()
+
+    archived = sum(len(messages) for messages in sessions.values())
+    deleted = delete_ids([row["id"] for row in rows])
+    return files, len(sessions), archived, deleted
+
+
+def archive(retention_days=RETENTION_DAYS, max_sessions=None, dry_run=False):
+    """Move expired sessions out of chat_messages (call inside an app context)"""
+    if not AVAILABLE:
+        raise RuntimeError("pyarrow is not installed; chat archiving is unavailable")
+    started = time.perf_counter()
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    session_ids = expired_sessions(cutoff, max_sessions)
+    result = {"cutoff": cutoff.isoformat(), "sessions": len(session_ids), "files": 0,
+              "messages_archived": 0, "messages_deleted": 0, "dry_run": dry_run}
+    if dry_run:
+        return result
+
+    for start in range(0, len(session_ids), SESSIONS_PER_CHUNK):
+        files, sessions, archived, deleted = archive_chunk(session_ids[start:start + SESSIONS_PER_CHUNK])
+        result["files"] += files
+        result["messages_archived"] += archived
+        result["messages_deleted"] += deleted
+        _stats["sessions_archived"] += sessions
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    result["elapsed_ms"] = round(elapsed_ms, 1)
+    _stats["runs"] += 1
+    _stats["files_written"] += result["files"]
+    _stats["messages_archived"] += result["messages_archived"]
+    _stats["messages_deleted"] += result["messages_deleted"]
+    _stats["last_run_ms"] = round(elapsed_ms, 1)
+    logger.info(f"🗄️ Archived {result['sessions']} sessions ({result['messages_archived']} messages) "
+                f"into {result['files']} files in {elapsed_ms:.0f}ms")
+    return result
+
+
+def compact(full=False, max_steps=None):
+    """
+    Return pages freed by deletes to the filesystem (SQLite only; Postgres
+    autovacuum handles this). Incremental steps each hold the write lock
+    briefly; ``full`` runs one VACUUM, which also switches an existing
+    database to auto_vacuum=INCREMENTAL.
+    """
+    from models import db
+
+    if db.engine.url.get_backend_name() != "sqlite":
+        return {"skipped": "only needed for SQLite"}
+    if full:
+        with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.exec_driver_sql("VACUUM")
+            conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {"full": True}
+
+    with db.engine.connect() as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+            return {"skipped": "auto_vacuum is not INCREMENTAL; run `flask compact-db --full` once"}
+        conn.commit()
+        initial = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        conn.commit()
+        cursor = conn.connection.dbapi_connection.cursor()
+        steps = 0
+        try:
+            while max_steps is None or steps < max_steps:
+                cursor.execute("PRAGMA freelist_count")
+                if not cursor.fetchone()[0]:
+                    break
+                # The pragma frees one page per step and execute() steps once;
+                # executescript() runs it to completion in one short write transaction
+                cursor.executescript(f"BEGIN IMMEDIATE; PRAGMA incremental_vacuum({VACUUM_PAGES}); COMMIT;")
+                steps += 1
+                if BATCH_PAUSE:
+                    time.sleep(BATCH_PAUSE)
+            cursor.execute("PRAGMA freelist_count")
+            remaining = cursor.fetchone()[0]
+            cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            cursor.fetchall()
+        finally:
+            cursor.close()
+        return {"pages_freed": initial - remaining, "steps": steps}
+
+
+# --------------------------------------------------
+# Cold reads
+# --------------------------------------------------
+
+def mark_archived():
+    """Tell every worker on the host that history reads must now consult the archive"""
+    global _archive_known
+    from local_store import get_store
+
+    _archive_known = True
+    get_store().set("retention", "has_archive", True)
+
+
+def has_archive():
+    """
+    False until anything has been archived, so deployments (or periods)
+    without retention never pay an archive lookup per history read. Once
+    true it stays true for the worker.
+    """
+    global _archive_known, _archive_probed_at
+    if _archive_known:
+        return True
+    from local_store import get_store
+
+    if get_store().get("retention", "has_archive"):
+        _archive_known = True
+        return True
+    # Archives written before the marker existed, or by another host
+    now = time.monotonic()
+    if _archive_probed_at is not None and now - _archive_probed_at < ARCHIVE_PROBE_TTL:
+        return False
+    _archive_probed_at = now
+    from models import ChatArchive, db
+
+    _archive_known = db.session.query(ChatArchive.id).first() is not None
+    return _archive_known
+
+
+def archived_messages(session_id):
+    """
+    Archived turns of a session, oldest first. Costs one indexed lookup when
+    the session has nothing archived; Parquet files are only opened (and the
+    result cached) when it does.
+    """
+    if not AVAILABLE:
+        return []
+    from sqlalchemy import select
+    from models import ChatArchive, db
+
+    entries = db.session.execute(
+        select(ChatArchive.id, ChatArchive.path).where(ChatArchive.session_id == session_id)
+        .order_by(ChatArchive.max_message_id)
+    ).all()
+    if not entries:
+        return []
+
+    key = (session_id, tuple(entry.id for entry in entries))
+    with _cold_lock:
+        cached = _cold_cache.get(key)
+        if cached is not None:
+            _cold_cache.move_to_end(key)
+            _stats["cold_cache_hits"] += 1
+            return cached
+
+    import pyarrow.parquet as pq
+
+    messages = []
+    for entry in entries:
+        table = pq.read_table(os.path.join(ARCHIVE_DIR, entry.path), filters=[("session_id", "=", session_id)],
+                              columns=list(ArchivedMessage._fields))
+        messages.extend(ArchivedMessage(**row) for row in table.to_pylist())
+    with _cold_lock:
+        _stats["cold_reads"] += 1
+        _cold_cache[key] = messages
+        while len(_cold_cache) > COLD_CACHE_SESSIONS:
+            _cold_cache.popitem(last=False)
+    return messages
+
+
+def page_messages(messages, position, after, backwards, limit):
+    """Keyset page over archived + hot rows in (created_at, id) order; returns (page, has_more)"""
+    def key(m):
+        return m.created_at or datetime.min, m.id
+
+    # A row archived by an interrupted run can still be hot; keep one copy
+    ordered = sorted({m.id: m for m in messages}.values(), key=key)
+    if position is not None:
+        if after:
+            ordered = [m for m in ordered if key(m) > position]
+        else:
+            ordered = [m for m in ordered if key(m) < position]
+    if backwards:
+        page = ordered[-limit:]
+        return page, len(ordered) > limit
+    return ordered[:limit], len(ordered) > limit
+
+
+def stats():
+    from sqlalchemy import func, select
+    from models import ChatArchive, db
+
+    sessions, files, messages = db.session.execute(select(
+        func.count(func.distinct(ChatArchive.session_id)), func.count(func.distinct(ChatArchive.path)),
+        func.coalesce(func.sum(ChatArchive.message_count), 0),
+    )).one()
+    return dict(_stats, retention_days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR,
+                archived_sessions=sessions, archive_files=files, archived_messages=messages,
+                interval_hours=INTERVAL / 3600, available=AVAILABLE)
+
+
+# --------------------------------------------------
+# Flask wiring
+# --------------------------------------------------
+
+def _claim_run():
+    """True in the one worker on this host that should run the job now"""
+    from local_store import get_store
+
+    now = time.time()
+    claimed = get_store().update(
+        "retention", "last_started",
+        lambda last: now if last is None or now - last >= INTERVAL * 0.9 else last,
+    )
+    return claimed == now
+
+
+def _run_periodically(app):
+    while True:
+        time.sleep(INTERVAL)
+        try:
+            if not _claim_run():
+                continue
+            with app.app_context():
+                archive()
+                compact()
+        except Exception as e:
+            logger.error(f"Chat retention run failed: {e}")
+
+
+def init_app(app):
+    global ARCHIVE_DIR
+    if not os.getenv("CHAT_ARCHIVE_DIR"):
+        ARCHIVE_DIR = os.path.join(app.instance_path, "chat_archive")
+
+    @app.cli.command("archive-chats")
+    @click.option("--days", type=int, default=RETENTION_DAYS, show_default=True,
+                  help="Archive sessions idle for longer than this.")
+    @click.option("--max-sessions", type=int, default=None, help="Stop after this many sessions.")
+    @click.option("--dry-run", is_flag=True, help="Only count the sessions that would move.")
+    @click.option("--no-compact", is_flag=True, help="Skip the incremental vacuum afterwards.")
+    def archive_chats_command(days, max_sessions, dry_run, no_compact):
+        """Move old chat sessions to Parquet and delete them from chat_messages."""
+        result = archive(days, max_sessions, dry_run)
+        if dry_run:
+            click.echo(f"🔎 Would archive {result['sessions']} sessions idle since {result['cutoff']}")
+            return
+        click.echo(f"✅ Archived {result['sessions']} sessions "
+                   f"({result['messages_archived']} messages, {result['files']} files)")
+        if not no_compact:
+            click.echo(f"🧹 Compacted: {compact()}")
+
+    @app.cli.command("compact-db")
+    @click.option("--full", is_flag=True, help="One full VACUUM (also enables incremental auto_vacuum).")
+    def compact_db_command(full):
+        """Return free pages left by deletes to the filesystem."""
+        click.echo(f"🧹 Compacted: {compact(full=full)}")
+
+    if INTERVAL > 0 and AVAILABLE:
+        threading.Thread(target=_run_periodically, args=(app,), name="chat-retention", daemon=True).start()
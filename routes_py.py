@@ -1,14 +1,50 @@
 # routes_py.py - UPDATED WITH WORKING MODELS
-from flask import Blueprint, request, jsonify, current_app
-from models import ChatMessage, CommunityPost, PostComment, db
+from flask import Blueprint, request, jsonify, current_app, abort, Response, stream_with_context
+from functools import wraps
+from models import ChatMessage, CommunityPost, Concern, PostComment, db
+import admission
+import assets
+import community_feed
+import concern_rank
+import context_builder
+import counters
+import engine_profiles
+import export
+import intents
+import mail_queue
+import metrics
+import model_registry
+import response_cache
+import retention
+import search
+import session_context
+import write_behind
 import os
-import requests
+import json
+import base64
+import binascii
+import hmac
 import uuid
+import time
 from datetime import datetime
 import random
 
 api = Blueprint('api', __name__, url_prefix='/api')
 
+_upstream = None
+
+def upstream():
+    """The cohere_client module, imported on the first chat turn rather than at worker boot"""
+    global _upstream
+    if _upstream is None:
+        import cohere_client
+
+        # Every model attempt (including abandoned hedges) feeds the health registry
+        cohere_client.add_attempt_hook(model_registry.record)
+        cohere_client.add_attempt_hook(metrics.record_attempt)
+        _upstream = cohere_client
+    return _upstream
+
 # Fallback responses for when AI is unavailable
 FALLBACK_RESPONSES = [
     "I understand you're reaching out. For personalized support, please contact our counselors at +254759226354.",
@@ -55,81 +91,139 @@ RESPONSE STYLE:
 
 Remember: You are not a substitute for professional mental healthcare. Your role is to provide supportive information and guide users toward appropriate resources."""
 
-def get_intelligent_fallback(message):
-    """Return context-aware fallback response based on message content"""
-    message_lower = message.lower()
-    
+# Fallback reply per intent (see intents.INTENTS for the keywords)
+INTENT_FALLBACKS = {
     # Emergency/suicidal thoughts
-    if any(word in message_lower for word in ['suicide', 'kill myself', 'end my life', 'want to die', 'harm myself']):
-        return "🚨 EMERGENCY: Please call our emergency line immediately at +254759226354 or dial 999. You are not alone, and help is available right now. We care about you."
-    
-    # Anxiety
-    elif any(word in message_lower for word in ['anxious', 'anxiety', 'panic', 'worried', 'nervous', 'overthinking']):
-        return "I understand you're feeling anxious. Try this breathing exercise: Inhale for 4 seconds, hold for 4, exhale for 6. Repeat 5 times. For ongoing anxiety support, contact our counselors at +254759226354."
-    
-    # Depression
-    elif any(word in message_lower for word in ['depressed', 'sad', 'hopeless', 'unmotivated', 'empty', 'worthless']):
-        return "I hear you're feeling down. Depression is treatable, and you don't have to go through this alone. Please reach out to our team at +254759226354 for professional support."
-    
-    # Stress
-    elif any(word in message_lower for word in ['stress', 'overwhelmed', 'pressure', 'burnout', 'stressed']):
-        return "Stress can feel overwhelming. Try breaking tasks into smaller, manageable steps. For personalized stress management techniques, call our team at +254759226354."
-    
-    # Sleep issues
-    elif any(word in message_lower for word in ['sleep', 'insomnia', 'tired', 'exhausted', 'can\'t sleep']):
-        return "Sleep issues can significantly affect mental health. Try establishing a consistent bedtime routine and avoiding screens before bed. For sleep counseling, contact +254759226354."
-    
-    # Relationships
-    elif any(word in message_lower for word in ['relationship', 'partner', 'breakup', 'divorce', 'family', 'friend']):
-        return "Relationship challenges can be difficult. Remember that healthy communication is key. For relationship counseling, our team at +254759226354 can help."
-    
+    'crisis': "🚨 EMERGENCY: Please call our emergency line immediately at +254759226354 or dial 999. You are not alone, and help is available right now. We care about you.",
+    'anxiety': "I understand you're feeling anxious. Try this breathing exercise: Inhale for 4 seconds, hold for 4, exhale for 6. Repeat 5 times. For ongoing anxiety support, contact our counselors at +254759226354.",
+    'depression': "I hear you're feeling down. Depression is treatable, and you don't have to go through this alone. Please reach out to our team at +254759226354 for professional support.",
+    'stress': "Stress can feel overwhelming. Try breaking tasks into smaller, manageable steps. For personalized stress management techniques, call our team at +254759226354.",
+    'sleep': "Sleep issues can significantly affect mental health. Try establishing a consistent bedtime routine and avoiding screens before bed. For sleep counseling, contact +254759226354.",
+    'relationships': "Relationship challenges can be difficult. Remember that healthy communication is key. For relationship counseling, our team at +254759226354 can help.",
     # Work/school stress
-    elif any(word in message_lower for word in ['work', 'job', 'school', 'exam', 'study', 'deadline']):
-        return "Work/school pressure can be challenging. Try prioritizing tasks and taking regular breaks. For career or academic counseling, call +254759226354."
+    'work': "Work/school pressure can be challenging. Try prioritizing tasks and taking regular breaks. For career or academic counseling, call +254759226354.",
+}
+
+def get_intelligent_fallback(message):
+    """Return context-aware fallback response based on message content"""
+    # Intents come back highest priority first; use the first one with a reply
+    for match in intents.classify(message):
+        if match.name in INTENT_FALLBACKS:
+            return INTENT_FALLBACKS[match.name]
     
     # General fallback
-    else:
-        return random.choice(FALLBACK_RESPONSES)
+    return random.choice(FALLBACK_RESPONSES)
 
-def call_cohere_api(api_key, message, chat_history):
-    """Try to call Cohere API with different models"""
-    for model in COHERE_MODELS:
-        try:
-            response = requests.post(
-                'https://api.cohere.com/v1/chat',
-                headers={
-                    'Authorization': f'Bearer {api_key}',
-                    'Content-Type': 'application/json',
-                    'Accept': 'application/json'
-                },
-                json={
-                    'model': model,
-                    'message': message,
-                    'chat_history': chat_history,
-                    'preamble': SYSTEM_PROMPT,
-                    'temperature': 0.7,
-                    'max_tokens': 800,
-                    'prompt_truncation': 'AUTO'
-                },
-                timeout=15
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                bot_response = result.get('text', '').strip()
-                if bot_response:
-                    current_app.logger.info(f"✅ Successfully used Cohere model: {model}")
-                    return bot_response
-            
-        except requests.exceptions.RequestException as e:
-            current_app.logger.debug(f"Model {model} failed: {e}")
-            continue
-        except Exception as e:
-            current_app.logger.debug(f"Error with model {model}: {e}")
-            continue
+def build_chat_payload(message, chat_history, preamble=SYSTEM_PROMPT):
+    """Cohere chat request body shared by the blocking and streaming paths"""
+    return {
+        'message': message,
+        'chat_history': chat_history,
+        'preamble': preamble,
+        'temperature': 0.7,
+        'max_tokens': 800,
+        'prompt_truncation': 'AUTO'
+    }
+
+def live_models(api_key):
+    """COHERE_MODELS in the order the health registry currently prefers"""
+    model_registry.ensure_prober(api_key, COHERE_MODELS)
+    return model_registry.ordered_models(COHERE_MODELS)
+
+def call_cohere_api(api_key, message, chat_history, preamble=SYSTEM_PROMPT):
+    """Call Cohere through the pooled client, racing models within the chat deadline"""
+    payload = build_chat_payload(message, chat_history, preamble)
+    result = upstream().chat(api_key, payload, live_models(api_key))
+    if result:
+        current_app.logger.info(f"✅ Successfully used Cohere model: {result.model} ({result.elapsed:.2f}s)")
+        metrics.record_model_win(result.model)
+        return result.text
     
     return None
 
+def save_chat_message(session_id, role, content):
+    """Persist one chat turn (queued for a batched commit when write-behind is on)"""
+    if write_behind.ENABLED:
+        write_behind.chat_queue.enqueue(current_app._get_current_object(), {
+            'session_id': session_id,
+            'role': role,
+            'content': content,
+            'is_mental_health_related': True,
+            'created_at': datetime.utcnow(),
+        })
+        session_context.append(session_id, role, content)
+        return None
+
+    chat_message = ChatMessage(
+        session_id=session_id,
+        role=role,
+        content=content,
+        is_mental_health_related=True
+    )
+    db.session.add(chat_message)
+    db.session.commit()
+    # After the commit, so a history read racing with this turn either sees it or is not buffered
+    session_context.append(session_id, role, content)
+    return chat_message
+
+def get_history_for_api(session_id):
+    """Recent turns of a session (the last SESSION_CONTEXT_TURNS) as Cohere chat_history entries"""
+    buffered = session_context.get(session_id)
+    if buffered is not None:
+        return buffered
+
+    missed_at = time.time()
+    recent_messages = ChatMessage.query.filter_by(session_id=session_id)\
+        .order_by(ChatMessage.created_at.desc())\
+        .limit(session_context.CONTEXT_TURNS)\
+        .all()
+    turns = [(msg.created_at, msg.role, msg.content) for msg in recent_messages]
+
+    # Read-your-writes: turns still waiting in the write-behind queue. A batch
+    # may commit between the two reads, so drop rows already returned above.
+    pending = write_behind.chat_queue.pending_for_session(session_id) if write_behind.ENABLED else []
+    if pending:
+        seen = set(turns)
+        turns += [turn for turn in ((row['created_at'], row['role'], row['content']) for row in pending)
+                  if turn not in seen]
+        turns = sorted(turns, key=lambda turn: turn[0] or datetime.min, reverse=True)[:session_context.CONTEXT_TURNS]
+
+    # Format history for Cohere (most recent first, then reverse for context)
+    history_for_api = []
+    for created_at, role, content in reversed(turns):
+        if role == 'user':
+            history_for_api.append({"role": "USER", "message": content})
+        elif role == 'assistant':
+            history_for_api.append({"role": "CHATBOT", "message": content})
+    session_context.fill(session_id, history_for_api, missed_at)
+    return history_for_api
+
+def get_chat_context(session_id, message):
+    """Token-budgeted chat_history and preamble (with the session summary) for one turn"""
+    return context_builder.build(session_id, message, get_history_for_api(session_id), SYSTEM_PROMPT)
+
+def is_serious_message(message):
+    """Crisis/urgent messages always get a fresh reply with the emergency contact"""
+    return intents.is_serious(message)
+
+def emergency_suffix(message, bot_response):
+    """Emergency contact text to append when a serious message got a reply without it"""
+    if is_serious_message(message):
+        if '+254759226354' not in bot_response and '999' not in bot_response:
+            return "\n\n🚨 EMERGENCY: If you're having thoughts of harming yourself, please call our emergency line immediately: +254759226354 or dial 999."
+    return ''
+
+def lookup_cached_reply(message, chat_history):
+    """Return (cache_key, cached_reply); crisis messages are never looked up or stored"""
+    if is_serious_message(message):
+        response_cache.record_bypass()
+        metrics.record_cache('bypass')
+        return None, None
+    key = response_cache.cache_key(message, chat_history)
+    cached = response_cache.get(key)
+    metrics.record_cache('hit' if cached else 'miss')
+    return key, cached
+
 # AI CHAT ROUTE
 @api.route('/chat', methods=['POST'])
 def chat():
@@ -142,78 +236,80 @@ def chat():
             return jsonify({'error': 'Message cannot be empty'}), 400
         
         # Save user message to database
-        user_message = ChatMessage(
-            session_id=session_id,
-            role='user',
-            content=message,
-            is_mental_health_related=True
-        )
-        db.session.add(user_message)
-        db.session.commit()
+        with metrics.span('save_user'):
+            save_chat_message(session_id, 'user', message)
         
         # Get Cohere API key
         cohere_key = os.environ.get('COHERE_API_KEY')
         
         # Prepare chat history
         chat_history = []
+        reply_source = 'fallback'
         if cohere_key:
             try:
-                # Get recent chat history for context
-                recent_messages = ChatMessage.query.filter_by(session_id=session_id)\
-                    .order_by(ChatMessage.created_at.desc())\
-                    .limit(6)\
-                    .all()
-                
-                # Format history for Cohere (most recent first, then reverse for context)
-                history_for_api = []
-                for msg in reversed(recent_messages):
-                    if msg.role == 'user':
-                        history_for_api.append({"role": "USER", "message": msg.content})
-                    elif msg.role == 'assistant':
-                        history_for_api.append({"role": "CHATBOT", "message": msg.content})
+                # Recent chat history packed into the token budget
+                with metrics.span('context'):
+                    context = get_chat_context(session_id, message)
                 
-                # Try to call Cohere API
-                bot_response = call_cohere_api(cohere_key, message, history_for_api)
+                # Repeated prompts are answered from the response cache
+                with metrics.span('cache'):
+                    cache_key, bot_response = lookup_cached_reply(message, context.chat_history)
+                if bot_response:
+                    reply_source = 'cache'
+                    current_app.logger.info("⚡ Served reply from response cache")
+                else:
+                    # Upstream slots are bounded; when they are saturated the turn is shed to the fallback
+                    with metrics.span('admission'):
+                        slot = admission.acquire(session_id)
+                    if not slot.admitted:
+                        reply_source = 'shed'
+                        metrics.record_shed(slot.reason)
+                        current_app.logger.info(f"🚦 Upstream saturated ({slot.reason}), shedding to fallback")
+                    else:
+                        # Try to call Cohere API
+                        with slot, metrics.span('upstream'):
+                            bot_response = call_cohere_api(cohere_key, message, context.chat_history, context.preamble)
+                    if bot_response:
+                        reply_source = 'cohere'
+                        if cache_key:
+                            response_cache.put(cache_key, bot_response)
                 
                 if bot_response:
                     # Ensure response includes emergency contact for serious concerns
-                    serious_keywords = ['suicide', 'kill myself', 'end my life', 'want to die', 'harm myself', 'emergency', 'urgent']
-                    if any(keyword in message.lower() for keyword in serious_keywords):
-                        if '+254759226354' not in bot_response and '999' not in bot_response:
-                            bot_response += "\n\n🚨 EMERGENCY: If you're having thoughts of harming yourself, please call our emergency line immediately: +254759226354 or dial 999."
+                    bot_response += emergency_suffix(message, bot_response)
                 else:
                     # Cohere API failed, use intelligent fallback
-                    bot_response = get_intelligent_fallback(message)
+                    with metrics.span('fallback'):
+                        bot_response = get_intelligent_fallback(message)
                     current_app.logger.info("⚠️ Using intelligent fallback response")
                     
             except Exception as e:
                 current_app.logger.error(f"Cohere API attempt failed: {e}")
-                bot_response = get_intelligent_fallback(message)
+                reply_source = 'fallback'
+                with metrics.span('fallback'):
+                    bot_response = get_intelligent_fallback(message)
                 current_app.logger.info("⚠️ Using fallback after API error")
         else:
             # No API key, use intelligent fallback
-            bot_response = get_intelligent_fallback(message)
+            with metrics.span('fallback'):
+                bot_response = get_intelligent_fallback(message)
             current_app.logger.info("⚠️ No API key, using intelligent fallback")
         
         # Save assistant response to database
-        assistant_message = ChatMessage(
-            session_id=session_id,
-            role='assistant',
-            content=bot_response,
-            is_mental_health_related=True
-        )
-        db.session.add(assistant_message)
-        db.session.commit()
+        with metrics.span('save_assistant'):
+            save_chat_message(session_id, 'assistant', bot_response)
+        metrics.record_reply(reply_source)
         
         return jsonify({
             'response': bot_response,
             'session_id': session_id,
             'timestamp': datetime.utcnow().isoformat(),
-            'source': 'cohere' if cohere_key and 'fallback' not in bot_response.lower() else 'fallback'
+            'source': reply_source
         })
         
     except Exception as e:
         current_app.logger.error(f"Unexpected error in chat endpoint: {e}")
+        metrics.record_reply('error_fallback')
         fallback = random.choice(FALLBACK_RESPONSES)
         return jsonify({
             'response': fallback,
@@ -222,24 +318,501 @@ def chat():
             'source': 'error_fallback'
         })
 
+def sse_event(event, data):
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# STREAMING AI CHAT ROUTE
+@api.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Same turn as /chat, but reply tokens are forwarded as SSE as they arrive.
+
+    Events: ``start`` (session id), ``token`` (text chunk), ``fallback``
+    (full replacement text when upstream is unavailable or breaks
+    mid-stream) and ``done`` (source - cohere, cache, fallback or shed - and
+    timestamp, sent after the assistant message is persisted).
+    """
+    data = request.json or {}
+    message = data.get('message', '').strip()
+    session_id = data.get('session_id', str(uuid.uuid4()))
+    
+    if not message:
+        return jsonify({'error': 'Message cannot be empty'}), 400
+    
+    with metrics.span('save_user'):
+        save_chat_message(session_id, 'user', message)
+    cohere_key = os.environ.get('COHERE_API_KEY')
+    
+    def generate():
+        yield sse_event('start', {'session_id': session_id})
+        
+        parts = []
+        reply_source = 'cohere'
+        if cohere_key:
+            try:
+                with metrics.span('context'):
+                    context = get_chat_context(session_id, message)
+                cache_key, cached = lookup_cached_reply(message, context.chat_history)
+                if cached:
+                    reply_source = 'cache'
+                    parts.append(cached)
+                    yield sse_event('token', {'text': cached})
+                else:
+                    with metrics.span('admission'):
+                        slot = admission.acquire(session_id)
+                    if slot.admitted:
+                        payload = build_chat_payload(message, context.chat_history, context.preamble)
+                        with slot:
+                            for chunk in upstream().stream_chat(cohere_key, payload, live_models(cohere_key)):
+                                parts.append(chunk)
+                                yield sse_event('token', {'text': chunk})
+                        if cache_key:
+                            response_cache.put(cache_key, ''.join(parts).strip())
+                    else:
+                        reply_source = 'shed'
+                        metrics.record_shed(slot.reason)
+                        current_app.logger.info(f"🚦 Upstream saturated ({slot.reason}), shedding stream to fallback")
+            except Exception as e:
+                current_app.logger.error(f"Cohere stream failed: {e}")
+                parts = []
+        
+        bot_response = ''.join(parts).strip()
+        if bot_response:
+            suffix = emergency_suffix(message, bot_response)
+            if suffix:
+                bot_response += suffix
+                yield sse_event('token', {'text': suffix})
+        else:
+            # Nothing usable streamed: replace any partial output with the fallback
+            reply_source = 'shed' if reply_source == 'shed' else 'fallback'
+            bot_response = get_intelligent_fallback(message)
+            current_app.logger.info("⚠️ Using intelligent fallback for stream")
+            yield sse_event('fallback', {'text': bot_response})
+        
+        try:
+            with metrics.span('save_assistant'):
+                save_chat_message(session_id, 'assistant', bot_response)
+        except Exception as e:
+            current_app.logger.error(f"Could not save streamed reply: {e}")
+            db.session.rollback()
+        metrics.record_reply(reply_source)
+        
+        yield sse_event('done', {
+            'session_id': session_id,
+            'timestamp': datetime.utcnow().isoformat(),
+            'source': reply_source
+        })
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 # Get chat history for a session
+HISTORY_PAGE_SIZE = 100
+HISTORY_MAX_PAGE_SIZE = 500
+
+def encode_cursor(created_at, message_id):
+    """Opaque keyset cursor for one (created_at, id) position"""
+    raw = f"{created_at.isoformat()}|{message_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on anything malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, message_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(message_id)
+    except (UnicodeDecodeError, binascii.Error, ValueError) as e:
+        raise ValueError(f"invalid cursor: {cursor}") from e
+
+def hot_history_page(session_id, position, after, backwards, limit):
+    """Keyset page from chat_messages; returns (messages, has_more)"""
+    query = ChatMessage.query.filter_by(session_id=session_id)
+    if position is not None:
+        created_at, message_id = position
+        if after:
+            query = query.filter(db.or_(ChatMessage.created_at > created_at,
+                                        db.and_(ChatMessage.created_at == created_at,
+                                                ChatMessage.id > message_id)))
+        else:
+            query = query.filter(db.or_(ChatMessage.created_at < created_at,
+                                        db.and_(ChatMessage.created_at == created_at,
+                                                ChatMessage.id < message_id)))
+
+    # Walk the (session_id, created_at, id) index backwards for 'before' pages
+    if backwards:
+        query = query.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+    else:
+        query = query.order_by(ChatMessage.created_at.asc(), ChatMessage.id.asc())
+    messages = query.limit(limit + 1).all()
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if backwards:
+        messages.reverse()
+    return messages, has_more
+
 @api.route('/chat/history/<session_id>', methods=['GET'])
 def get_chat_history(session_id):
+    """
+    One page of a session's messages, oldest first.
+
+    Without a cursor this is the start of the conversation. ``after=<cursor>``
+    pages forward, ``before=<cursor>`` pages back and ``before=latest`` gives
+    the most recent page. The body stays a plain list; cursors for the
+    neighbouring pages travel in X-Next-Cursor / X-Prev-Cursor and Link.
+    """
+    before = request.args.get('before')
+    after = request.args.get('after')
+    limit = min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), HISTORY_MAX_PAGE_SIZE)
+    if before and after:
+        return jsonify({'error': 'Use either before or after, not both'}), 400
     try:
-        messages = ChatMessage.query.filter_by(session_id=session_id)\
-                     .order_by(ChatMessage.created_at.asc())\
-                     .limit(100)\
-                     .all()
-        
-        return jsonify([{
-            'id': m.id,
-            'role': m.role,
-            'content': m.content,
-            'timestamp': m.created_at.isoformat() if m.created_at else None,
-            'is_mental_health_related': m.is_mental_health_related
-        } for m in messages])
+        position = decode_cursor(after or before) if (after or (before and before != 'latest')) else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        if write_behind.ENABLED and write_behind.chat_queue.has_pending(session_id):
+            write_behind.chat_queue.flush()
+
+        backwards = bool(before)
+        messages, has_more = hot_history_page(session_id, position, after, backwards, limit)
+        # Cold path: sessions moved to the Parquet archive are merged with any newer hot turns.
+        # Archived turns predate every hot turn of their session, so a backwards page
+        # only reaches them once the hot rows run out.
+        if retention.has_archive() and not (backwards and has_more):
+            archived = retention.archived_messages(session_id)
+            if archived:
+                hot = ChatMessage.query.filter_by(session_id=session_id).all()
+                messages, has_more = retention.page_messages(archived + hot, position, after, backwards, limit)
     except Exception as e:
         current_app.logger.error(f"Error getting chat history: {e}")
         return jsonify([])
 
+    response = jsonify([{
+        'id': m.id,
+        'role': m.role,
+        'content': m.content,
+        'timestamp': m.created_at.isoformat() if m.created_at else None,
+        'is_mental_health_related': m.is_mental_health_related
+    } for m in messages])
+
+    # The next cursor is always given so clients can poll for newer turns;
+    # older turns exist past a 'before' page only when the query said so, and
+    # may exist before an 'after' page. Both follow from the data in the body,
+    # which keeps the body-derived ETag valid for the headers too.
+    links = []
+    if messages:
+        first, last = messages[0], messages[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+        response.headers['X-Next-Cursor'] = next_cursor
+        links.append(f'<{request.base_url}?after={next_cursor}&limit={limit}>; rel="next"')
+        if (has_more if backwards else position is not None):
+            prev_cursor = encode_cursor(first.created_at, first.id)
+            response.headers['X-Prev-Cursor'] = prev_cursor
+            links.append(f'<{request.base_url}?before={prev_cursor}&limit={limit}>; rel="prev"')
+    if links:
+        response.headers['Link'] = ', '.join(links)
+
+    # Clients revalidate every time; an unchanged page comes back as an empty 304
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+# --------------------------------------------------
+# COMMUNITY FEED
+# --------------------------------------------------
+
+MAX_POST_LENGTH = 5000
+MAX_COMMENT_LENGTH = 2000
+MAX_CONCERN_LENGTH = 5000
+
+@api.route('/search', methods=['GET'])
+def search_content():
+    """
+    Full-text search over community posts, comments and concerns.
+
+    ``q`` is matched word by word (the last word also as a prefix);
+    ``type`` narrows to post, comment and/or concern (comma separated).
+    Results are best match first with <mark>-highlighted snippets, paged by
+    ``page``/``per_page``.
+    """
+    query = request.args.get('q', '').strip()
+    kinds = [kind for kind in request.args.get('type', '').split(',') if kind]
+    if not query:
+        return jsonify({'error': 'Query cannot be empty'}), 400
+    unknown = [kind for kind in kinds if kind not in search.KINDS]
+    if unknown:
+        return jsonify({'error': f"Unknown type: {', '.join(unknown)}"}), 400
+    page = min(max(request.args.get('page', 1, type=int), 1), search.SEARCH_MAX_PAGE)
+    per_page = min(max(request.args.get('per_page', search.SEARCH_PAGE_SIZE, type=int), 1),
+                   search.SEARCH_MAX_PAGE_SIZE)
+
+    try:
+        results, has_more = search.search(query, kinds, page, per_page)
+    except Exception as e:
+        current_app.logger.error(f"Search failed: {e}")
+        return jsonify({'error': 'Search is unavailable'}), 503
+
+    return jsonify({
+        'query': query,
+        'results': results,
+        'page': page,
+        'per_page': per_page,
+        'has_more': has_more and page < search.SEARCH_MAX_PAGE,
+    })
+
+@api.route('/community/posts', methods=['GET'])
+def community_posts():
+    """Approved posts, featured first; ``after=<X-Next-Cursor>`` for the next page"""
+    category = request.args.get('category') or None
+    cursor = request.args.get('after') or None
+    limit = min(max(request.args.get('limit', community_feed.FEED_PAGE_SIZE, type=int), 1),
+                community_feed.FEED_MAX_PAGE_SIZE)
+    try:
+        page, next_cursor = community_feed.get_page(category, cursor, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Cached pages keep the counts they were built with: swap in the flushed
+    # counts, add what is still buffered, then count this impression of every post
+    post_ids = [post['id'] for post in page]
+    posts = counters.overlay(community_feed.with_counts(page), counters.post_counters.pending(post_ids))
+    counters.post_counters.incr(current_app._get_current_object(),
+                                [(post_id, 'views', 1) for post_id in post_ids])
+
+    response = current_app.response_class(json.dumps(posts), mimetype='application/json')
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+        query = f"after={next_cursor}&limit={limit}" + (f"&category={category}" if category else "")
+        response.headers['Link'] = f'<{request.base_url}?{query}>; rel="next"'
+    return response
+
+@api.route('/community/posts', methods=['POST'])
+def create_community_post():
+    data = request.get_json(silent=True) or {}
+    content = (data.get('content') or '').strip()
+    if not content:
+        return jsonify({'error': 'Content is required'}), 400
+    if len(content) > MAX_POST_LENGTH:
+        return jsonify({'error': f'Posts are limited to {MAX_POST_LENGTH} characters'}), 400
+
+    post = CommunityPost(
+        author_name=(data.get('author') or '').strip()[:100] or 'Anonymous',
+        content=content,
+        category=(data.get('category') or None),
+        likes=0,
+        comments_count=0,
+        views=0,
+        is_approved=True,
+        is_featured=False
+    )
+    db.session.add(post)
+    db.session.commit()
+    return jsonify(community_feed.serialize_post(post)), 201
+
+@api.route('/community/posts/<int:post_id>/comments', methods=['POST'])
+def create_post_comment(post_id):
+    data = request.get_json(silent=True) or {}
+    content = (data.get('content') or '').strip()
+    if not content:
+        return jsonify({'error': 'Content is required'}), 400
+    if len(content) > MAX_COMMENT_LENGTH:
+        return jsonify({'error': f'Comments are limited to {MAX_COMMENT_LENGTH} characters'}), 400
+    if not db.session.get(CommunityPost, post_id):
+        return jsonify({'error': 'Post not found'}), 404
+
+    comment = PostComment(post_id=post_id, author_name=(data.get('author') or '').strip()[:100] or 'Anonymous',
+                          content=content)
+    db.session.add(comment)
+    db.session.commit()
+    counters.post_counters.incr(current_app._get_current_object(), [(post_id, 'comments_count', 1)])
+    return jsonify(community_feed.serialize_comment(comment)), 201
+
+@api.route('/community/posts/<int:post_id>/like', methods=['POST'])
+def like_post(post_id):
+    """Buffered like; the count reaches the table on the next counter flush"""
+    counters.post_counters.incr(current_app._get_current_object(), [(post_id, 'likes', 1)])
+    return jsonify({'success': True, 'id': post_id})
+
+@api.route('/concerns', methods=['GET'])
+def list_concerns():
+    """
+    Concerns board: ``sort=hot`` (open first, then time-decayed upvotes),
+    ``new`` or ``unanswered``, optionally one ``category``;
+    ``after=<X-Next-Cursor>`` for the next page.
+    """
+    sort = request.args.get('sort', 'hot')
+    category = request.args.get('category') or None
+    cursor = request.args.get('after') or None
+    limit = min(max(request.args.get('limit', concern_rank.CONCERN_PAGE_SIZE, type=int), 1),
+                concern_rank.CONCERN_MAX_PAGE_SIZE)
+    try:
+        page, next_cursor = concern_rank.build_page(sort, category, cursor, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    response = jsonify(page)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+        query = f"sort={sort}&after={next_cursor}&limit={limit}" + (f"&category={category}" if category else "")
+        response.headers['Link'] = f'<{request.base_url}?{query}>; rel="next"'
+    return response
+
+@api.route('/concerns', methods=['POST'])
+def create_concern():
+    data = request.get_json(silent=True) or {}
+    title = (data.get('title') or '').strip()
+    content = (data.get('content') or '').strip()
+    category = (data.get('category') or '').strip()
+    if not title or not content or not category:
+        return jsonify({'error': 'Title, content and category are required'}), 400
+    if len(content) > MAX_CONCERN_LENGTH:
+        return jsonify({'error': f'Concerns are limited to {MAX_CONCERN_LENGTH} characters'}), 400
+
+    concern = Concern(title=title[:200], content=content, category=category[:50], status='open', upvotes=0,
+                      is_anonymous=bool(data.get('anonymous')))
+    db.session.add(concern)
+    db.session.commit()
+    return jsonify(concern_rank.serialize_concern(concern)), 201
+
+@api.route('/concerns/<int:concern_id>/upvote', methods=['POST'])
+def upvote_concern(concern_id):
+    upvotes = concern_rank.upvote(concern_id)
+    if upvotes is None:
+        return jsonify({'error': 'Concern not found'}), 404
+    return jsonify({'success': True, 'id': concern_id, 'upvotes': upvotes})
+
+# --------------------------------------------------
+# ADMIN ENDPOINTS
+# --------------------------------------------------
+
+def admin_required(view):
+    """Allow the request only with a matching X-Admin-Token header (ADMIN_TOKEN env)"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        token = os.environ.get('ADMIN_TOKEN')
+        supplied = request.headers.get('X-Admin-Token', '')
+        # Constant-time comparison, so response timing says nothing about the token
+        if not token or not hmac.compare_digest(supplied.encode(), token.encode()):
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapped
+
+# Live model health registry
+@api.route('/admin/models', methods=['GET'])
+@admin_required
+def model_health():
+    entries = model_registry.snapshot(force=True)
+    return jsonify({
+        'order': model_registry.ordered_models(COHERE_MODELS),
+        'models': {model: entries.get(model) for model in COHERE_MODELS},
+        'abandoned_attempts': upstream().abandoned(),
+    })
+
+# Response cache hit ratio
+@api.route('/admin/cache', methods=['GET'])
+@admin_required
+def cache_stats():
+    return jsonify(response_cache.stats())
+
+@api.route('/admin/persistence', methods=['GET'])
+@admin_required
+def persistence_stats():
+    """Write-behind queue depth, batch sizes and flush latency, plus the engine profile in use"""
+    stats = write_behind.chat_queue.stats()
+    stats['engine'] = engine_profiles.describe(db.engine)
+    return jsonify(stats)
+
+@api.route('/admin/context', methods=['GET'])
+@admin_required
+def context_stats():
+    """Tokens sent per turn against the unpacked baseline, and summary activity"""
+    return jsonify(context_builder.stats())
+
+@api.route('/admin/admission', methods=['GET'])
+@admin_required
+def admission_stats():
+    """Upstream slots in use, queue depth, waits and shed counts by reason"""
+    return jsonify(admission.stats())
+
+@api.route('/admin/retention', methods=['GET'])
+@admin_required
+def retention_stats():
+    """Archived sessions and files, job runs and cold-path reads"""
+    return jsonify(retention.stats())
+
+@api.route('/admin/export/<table>', methods=['GET'])
+@admin_required
+def export_table(table):
+    """
+    Stream chat_messages, concerns or community_posts as NDJSON (default) or
+    CSV. Filters: since/until (ISO, on created_at), session_id (repeatable),
+    category, archived=1 (chat only). Gzipped on the fly when the client
+    accepts it, unless gzip=0.
+    """
+    try:
+        options = export.ExportOptions(
+            table,
+            fmt=request.args.get('format', 'ndjson'),
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            session_ids=request.args.getlist('session_id'),
+            category=request.args.get('category'),
+            archived=request.args.get('archived') in ('1', 'true'),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    compress = request.args.get('gzip') != '0' and 'gzip' in assets.accepted_encodings()
+    response = Response(stream_with_context(export.stream(options, compress)),
+                        mimetype=export.FORMATS[options.fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{options.filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    response.vary.add('Accept-Encoding')
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+@api.route('/admin/mail', methods=['GET'])
+@admin_required
+def mail_stats():
+    """Outbound mail queue depth by status, send latency, retries and SMTP connection reuse"""
+    return jsonify(mail_queue.mail_queue.stats())
+
+@api.route('/admin/concerns/<int:concern_id>/response', methods=['POST'])
+@admin_required
+def respond_to_concern(concern_id):
+    """Record a response and/or status (open, responded, closed); the board re-ranks on commit"""
+    data = request.get_json(silent=True) or {}
+    concern = db.session.get(Concern, concern_id)
+    if concern is None:
+        return jsonify({'error': 'Concern not found'}), 404
+    status = data.get('status') or ('responded' if data.get('response') else concern.status)
+    if status not in ('open', 'responded', 'closed'):
+        return jsonify({'error': f'unknown status: {status}'}), 400
+    if data.get('response'):
+        concern.response = data['response'].strip()
+        concern.responded_at = datetime.utcnow()
+    concern.status = status
+    db.session.commit()
+    return jsonify(concern_rank.serialize_concern(concern))
+
+@api.route('/admin/feed', methods=['GET'])
+@admin_required
+def feed_cache_stats():
+    return jsonify(community_feed.stats())
+
+@api.route('/admin/counters', methods=['GET'])
+@admin_required
+def counter_stats():
+    return jsonify(counters.post_counters.stats())
+
+@api.route('/admin/session-context', methods=['GET'])
+@admin_required
+def session_context_stats():
+    return jsonify(session_context.stats())
+
 # ... rest of your routes remain the same ...
\ No newline at end of file
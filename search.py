@@ -0,0 +1,341 @@
+# search.py - full-text search over community posts, comments and concerns (SQLite FTS5 or Postgres tsvector)
+import os
+import re
+import html
+import time
+import logging
+
+import click
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# Configuration
+# --------------------------------------------------
+
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+SEARCH_MAX_PAGE_SIZE = 50
+SEARCH_MAX_PAGE = 50                     # deep offsets cost as much as the pages before them
+SEARCH_SNIPPET_TOKENS = int(os.getenv("SEARCH_SNIPPET_TOKENS", "16"))
+# Only the newest N matches are scored: a word found in most documents would
+# otherwise rank the whole index on every keystroke. Selective queries have
+# fewer matches than this and are ranked exactly.
+SEARCH_RANK_WINDOW = int(os.getenv("SEARCH_RANK_WINDOW", "5000"))
+SEARCH_LANGUAGE = os.getenv("SEARCH_LANGUAGE", "english")   # Postgres text search configuration
+MAX_QUERY_TERMS = 8
+
+# Document kinds and their rowid tag: rowid = source id * 4 + tag, so a
+# trigger can replace or drop one document without scanning the index
+KINDS = {"post": 1, "comment": 2, "concern": 3}
+
+# Private-use markers around matches; the snippet is HTML-escaped before
+# they become <mark> tags, so user text can never inject markup
+_OPEN, _CLOSE = "\ue000", "\ue001"
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+SQLITE_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    kind UNINDEXED, ref_id UNINDEXED, parent_id UNINDEXED, created_at UNINDEXED,
+    title, body,
+    tokenize = 'porter unicode61 remove_diacritics 2'
+)
+"""
+
+# Only searchable columns fire the update triggers: like/view counter flushes never touch the index
+SQLITE_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS search_posts_ai AFTER INSERT ON community_posts WHEN NEW.is_approved BEGIN
+        INSERT INTO search_index (rowid, kind, ref_id, parent_id, created_at, title, body)
+        VALUES (NEW.id * 4 + 1, 'post', NEW.id, NULL, NEW.created_at, COALESCE(NEW.category, ''), NEW.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_posts_au AFTER UPDATE OF content, category, is_approved
+    ON community_posts BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 4 + 1;
+        INSERT INTO search_index (rowid, kind, ref_id, parent_id, created_at, title, body)
+        SELECT NEW.id * 4 + 1, 'post', NEW.id, NULL, NEW.created_at, COALESCE(NEW.category, ''), NEW.content
+        WHERE NEW.is_approved;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_posts_ad AFTER DELETE ON community_posts BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 4 + 1;
+    END""",
+    # Comments are searchable only while their post is approved
+    """CREATE TRIGGER IF NOT EXISTS search_comments_ai AFTER INSERT ON post_comments BEGIN
+        INSERT INTO search_index (rowid, kind, ref_id, parent_id, created_at, title, body)
+        SELECT NEW.id * 4 + 2, 'comment', NEW.id, NEW.post_id, NEW.created_at, '', NEW.content
+        WHERE EXISTS (SELECT 1 FROM community_posts WHERE id = NEW.post_id AND is_approved);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_comments_au AFTER UPDATE OF content ON post_comments BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 4 + 2;
+        INSERT INTO search_index (rowid, kind, ref_id, parent_id, created_at, title, body)
+        SELECT NEW.id * 4 + 2, 'comment', NEW.id, NEW.post_id, NEW.created_at, '', NEW.content
+        WHERE EXISTS (SELECT 1 FROM community_posts WHERE id = NEW.post_id AND is_approved);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_comments_post_au AFTER UPDATE OF is_approved ON community_posts
+    WHEN OLD.is_approved IS NOT NEW.is_approved BEGIN
+        DELETE FROM search_index WHERE rowid IN (SELECT id * 4 + 2 FROM post_comments WHERE post_id = NEW.id);
+        INSERT INTO search_index (rowid, kind, ref_id, parent_id, created_at, title, body)
+        SELECT id * 4 + 2, 'comment', id, post_id, created_at, '', content
+        FROM post_comments WHERE post_id = NEW.id AND NEW.is_approved;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_comments_ad AFTER DELETE ON post_comments BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 4 + 2;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_concerns_ai AFTER INSERT ON concerns BEGIN
+        INSERT INTO search_index (rowid, kind, ref_id, parent_id, created_at, title, body)
+        VALUES (NEW.id * 4 + 3, 'concern', NEW.id, NULL, NEW.created_at, NEW.title, NEW.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_concerns_au AFTER UPDATE OF title, content ON concerns BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 4 + 3;
+        INSERT INTO search_index (rowid, kind, ref_id, parent_id, created_at, title, body)
+        VALUES (NEW.id * 4 + 3, 'concern', NEW.id, NULL, NEW.created_at, NEW.title, NEW.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS search_concerns_ad AFTER DELETE ON concerns BEGIN
+        DELETE FROM search_index WHERE rowid = OLD.id * 4 + 3;
+    END""",
+]
+
+SQLITE_BACKFILL = {
+    "post": """INSERT INTO search_index (rowid, kind, ref_id, parent_id, created_at, title, body)
+       SELECT id * 4 + 1, 'post', id, NULL, created_at, COALESCE(category, ''), content
+       FROM community_posts WHERE is_approved""",
+    "comment": """INSERT INTO search_index (rowid, kind, ref_id, parent_id, created_at, title, body)
+       SELECT c.id * 4 + 2, 'comment', c.id, c.post_id, c.created_at, '', c.content
+       FROM post_comments c JOIN community_posts p ON p.id = c.post_id WHERE p.is_approved""",
+    "concern": """INSERT INTO search_index (rowid, kind, ref_id, parent_id, created_at, title, body)
+       SELECT id * 4 + 3, 'concern', id, NULL, created_at, title, content FROM concerns""",
+}
+
+# Postgres: expression GIN indexes are maintained by the table writes themselves
+PG_DOCUMENTS = {
+    "post": ("community_posts", "coalesce(category, '')", "content", "NULL::integer", "is_approved"),
+    "comment": ("post_comments", "''", "content", "post_id",
+                "EXISTS (SELECT 1 FROM community_posts p WHERE p.id = post_comments.post_id AND p.is_approved)"),
+    "concern": ("concerns", "title", "content", "NULL::integer", "TRUE"),
+}
+
+
+def backend():
+    from models import db
+
+    return db.engine.url.get_backend_name()
+
+
+def _trigger_name(trigger):
+    # "CREATE TRIGGER IF NOT EXISTS <name> ..."
+    return trigger.split()[5]
+
+
+def _stale_triggers(conn):
+    """Names of search triggers whose stored definition differs from SQLITE_TRIGGERS"""
+    stored = dict(conn.exec_driver_sql(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'search\\_%' ESCAPE '\\'").all())
+    stale = []
+    for trigger in SQLITE_TRIGGERS:
+        name = _trigger_name(trigger)
+        # SQLite keeps the statement text minus IF NOT EXISTS
+        current = " ".join(trigger.replace(" IF NOT EXISTS", "", 1).split())
+        if name in stored and " ".join(stored[name].split()) != current:
+            stale.append(name)
+    return stale
+
+
+def _pg_vector(title, body):
+    return (f"setweight(to_tsvector('{SEARCH_LANGUAGE}', {title}), 'A') || "
+            f"setweight(to_tsvector('{SEARCH_LANGUAGE}', {body}), 'B')")
+
+
+# --------------------------------------------------
+# Schema
+# --------------------------------------------------
+
+def ensure_schema():
+    """Create the index and its sync triggers if missing; backfill when newly created"""
+    from models import db
+
+    name = backend()
+    with db.engine.begin() as conn:
+        if name == "sqlite":
+            exists = conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'").first()
+            conn.exec_driver_sql(SQLITE_TABLE)
+            # A trigger changed since this index was built: replace it and
+            # re-index that document kind (search_<kind>s_...)
+            stale = _stale_triggers(conn) if exists else []
+            for name in stale:
+                conn.exec_driver_sql(f"DROP TRIGGER {name}")
+            for trigger in SQLITE_TRIGGERS:
+                conn.exec_driver_sql(trigger)
+            if not exists:
+                for statement in SQLITE_BACKFILL.values():
+                    conn.exec_driver_sql(statement)
+            for kind in sorted({name.split("_")[1][:-1] for name in stale}):
+                logger.info(f"🔎 Search triggers for {kind}s changed; re-indexing them")
+                conn.exec_driver_sql("DELETE FROM search_index WHERE kind = ?", (kind,))
+                conn.exec_driver_sql(SQLITE_BACKFILL[kind])
+        elif name == "postgresql":
+            for kind, (table, title, body, _, _) in PG_DOCUMENTS.items():
+                conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS ix_{table}_search ON {table} "
+                                     f"USING GIN (({_pg_vector(title, body)}))")
+        else:
+            logger.warning(f"⚠️ Full-text search is not available for {name}")
+
+
+def rebuild():
+    """Re-index every existing row from scratch; returns (documents, seconds)"""
+    from models import db
+
+    started = time.perf_counter()
+    name = backend()
+    with db.engine.begin() as conn:
+        if name == "sqlite":
+            conn.exec_driver_sql("DROP TABLE IF EXISTS search_index")
+            conn.exec_driver_sql(SQLITE_TABLE)
+            for trigger in SQLITE_TRIGGERS:
+                conn.exec_driver_sql(trigger)
+            for statement in SQLITE_BACKFILL.values():
+                conn.exec_driver_sql(statement)
+            # Merge the b-tree segments left by the bulk insert into one
+            conn.exec_driver_sql("INSERT INTO search_index (search_index) VALUES ('optimize')")
+            documents = conn.exec_driver_sql("SELECT COUNT(*) FROM search_index").scalar()
+        elif name == "postgresql":
+            documents = 0
+            for table, *_ in PG_DOCUMENTS.values():
+                conn.exec_driver_sql(f"DROP INDEX IF EXISTS ix_{table}_search")
+                documents += conn.exec_driver_sql(f"SELECT COUNT(*) FROM {table}").scalar()
+        else:
+            raise RuntimeError(f"full-text search is not available for {name}")
+    if name == "postgresql":
+        ensure_schema()
+    return documents, time.perf_counter() - started
+
+
+# --------------------------------------------------
+# Queries
+# --------------------------------------------------
+
+def terms(query):
+    """Words of a user query; syntax characters never reach the search engine"""
+    return _TERM.findall(query.lower())[:MAX_QUERY_TERMS]
+
+
+def fts5_query(words):
+    """All words must match; the last one also as a prefix (search-as-you-type)"""
+    quoted = [f'"{word}"' for word in words]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def highlight(snippet):
+    return html.escape(snippet or "").replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>")
+
+
+def _search_sqlite(conn, words, kinds, limit, offset):
+    kind_filter = ""
+    params = {"match": fts5_query(words), "window": SEARCH_RANK_WINDOW, "limit": limit, "offset": offset}
+    if kinds:
+        kind_filter = "AND kind IN (%s)" % ", ".join(f":kind{i}" for i in range(len(kinds)))
+        params.update({f"kind{i}": kind for i, kind in enumerate(kinds)})
+    # bm25() is lower-is-better; titles (post category, concern title) weigh double.
+    # Newer documents have higher rowids, so the window walks the match list backwards.
+    sql = f"""
+        SELECT kind, ref_id, parent_id, created_at, title, snippet, score FROM (
+            SELECT kind, ref_id, parent_id, created_at, title,
+                   snippet(search_index, 5, '{_OPEN}', '{_CLOSE}', '…', {SEARCH_SNIPPET_TOKENS}) AS snippet,
+                   bm25(search_index, 0, 0, 0, 0, 2.0, 1.0) AS score
+            FROM search_index
+            WHERE search_index MATCH :match {kind_filter}
+            ORDER BY rowid DESC
+            LIMIT :window
+        )
+        ORDER BY score
+        LIMIT :limit OFFSET :offset
+    """
+    from sqlalchemy import text
+
+    return [(row.kind, row.ref_id, row.parent_id, row.created_at, row.title, row.snippet, -row.score)
+            for row in conn.execute(text(sql), params)]
+
+
+def _search_postgres(conn, words, kinds, limit, offset):
+    from sqlalchemy import text
+
+    # Prefix match on the last word, like the FTS5 query
+    tsquery = " & ".join(words[:-1] + [f"{words[-1]}:*"])
+    selects = []
+    for kind, (table, title, body, parent, visible) in PG_DOCUMENTS.items():
+        if kinds and kind not in kinds:
+            continue
+        vector = _pg_vector(title, body)
+        selects.append(f"""
+            (SELECT '{kind}' AS kind, id AS ref_id, {parent} AS parent_id, created_at, {title} AS title,
+                    {body} AS body, ts_rank_cd({vector}, q) AS score
+             FROM {table}, q
+             WHERE {vector} @@ q AND {visible}
+             ORDER BY id DESC
+             LIMIT :window)""")
+    # ts_headline re-parses the document, so only the rows on the page pay for it
+    sql = f"""
+        WITH q AS (SELECT to_tsquery('{SEARCH_LANGUAGE}', :tsquery) AS q),
+        hits AS ({" UNION ALL ".join(selects)})
+        SELECT kind, ref_id, parent_id, created_at, title,
+               ts_headline('{SEARCH_LANGUAGE}', body, q.q,
+                           'StartSel={_OPEN}, StopSel={_CLOSE}, MaxWords={SEARCH_SNIPPET_TOKENS}, MinWords=5')
+                   AS snippet,
+               score
+        FROM (SELECT * FROM hits ORDER BY score DESC LIMIT :limit OFFSET :offset) AS page, q
+        ORDER BY score DESC
+    """
+    params = {"tsquery": tsquery, "window": SEARCH_RANK_WINDOW, "limit": limit, "offset": offset}
+    return [tuple(row) for row in conn.execute(text(sql), params)]
+
+
+def search(query, kinds=None, page=1, per_page=SEARCH_PAGE_SIZE):
+    """
+    One page of ranked matches for ``query``: (results, has_more). FTS5
+    ranks by BM25; Postgres by ts_rank_cd with titles weighted above bodies.
+    Only the newest SEARCH_RANK_WINDOW matches are ranked (per document
+    type on Postgres).
+    """
+    from models import db
+
+    words = terms(query)
+    if not words:
+        return [], False
+    offset = (page - 1) * per_page
+    name = backend()
+    with db.engine.connect() as conn:
+        if name == "sqlite":
+            rows = _search_sqlite(conn, words, kinds, per_page + 1, offset)
+        elif name == "postgresql":
+            rows = _search_postgres(conn, words, kinds, per_page + 1, offset)
+        else:
+            raise RuntimeError(f"full-text search is not available for {name}")
+
+    results = []
+    for kind, ref_id, parent_id, created_at, title, snippet, score in rows[:per_page]:
+        result = {
+            "type": kind,
+            "id": ref_id,
+            "title": title or None,
+            "snippet": highlight(snippet),
+            "score": round(float(score), 6),
+            # FTS5 keeps SQLite's stored text; Postgres returns a datetime
+            "created_at": created_at.isoformat() if hasattr(created_at, "isoformat")
+            else (created_at or "").replace(" ", "T") or None,
+        }
+        if kind == "comment":
+            result["post_id"] = parent_id
+        results.append(result)
+    return results, len(rows) > per_page
+
+
+# --------------------------------------------------
+# Flask wiring
+# --------------------------------------------------
+
+def init_app(app):
+    @app.cli.command("rebuild-search")
+    def rebuild_search_command():
+        """Re-index all community posts, comments and concerns for /api/search."""
+        documents, seconds = rebuild()
+        click.echo(f"✅ Indexed {documents} documents in {seconds:.1f}s")
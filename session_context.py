@@ -0,0 +1,295 @@
+# session_context.py - bounded per-session ring buffer of recent chat turns
+import os
+import time
+import json
+import threading
+from collections import OrderedDict, deque
+
+# --------------------------------------------------
+# Configuration
+# --------------------------------------------------
+
+# 'shared' (local_store file, every worker sees every turn), 'memory' (per
+# worker; only correct with a single worker or sticky sessions) or 'off'.
+# A shared hit is a read-only lookup, but each turn still commits two appends
+# to the local_store file; bench/bench_session_context.py compares both with
+# the chat_messages query, and 'off' is the better choice when that query is cheap
+CONTEXT_BACKEND = os.getenv("SESSION_CONTEXT_BACKEND", "shared")
+# Window context_builder packs from; leave headroom above CONTEXT_MAX_TURNS
+CONTEXT_TURNS = int(os.getenv("SESSION_CONTEXT_TURNS", "20"))
+CONTEXT_MAX_SESSIONS = int(os.getenv("SESSION_CONTEXT_MAX_SESSIONS", "10000"))
+CONTEXT_MAX_BYTES = int(os.getenv("SESSION_CONTEXT_MAX_BYTES", str(32 * 1024 * 1024)))
+CONTEXT_IDLE_TTL = float(os.getenv("SESSION_CONTEXT_IDLE_TTL", "1800"))
+
+ENTRY_OVERHEAD = 64   # rough per-entry bytes on top of the message text
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def entry_size(entry):
+    return len(entry["message"]) + ENTRY_OVERHEAD
+
+
+class MemoryBackend:
+    """OrderedDict of session_id -> deque, least recently used first"""
+
+    name = "memory"
+
+    def __init__(self, turns, max_sessions, max_bytes, idle_ttl):
+        self.turns = turns
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        # session_id -> [deque of entries, bytes, last_access]; a deque of None
+        # marks a session appended to while unbuffered (see fill)
+        self.sessions = OrderedDict()
+        self.bytes = 0
+        self.counters = {"hits": 0, "misses": 0, "appends": 0, "evictions": 0, "expired": 0, "stale_fills": 0}
+        self.lock = threading.Lock()
+
+    def _drop(self, session_id, counter):
+        self.bytes -= self.sessions.pop(session_id)[1]
+        self.counters[counter] += 1
+
+    def _enforce_limits(self, now):
+        # Oldest sessions sit at the front, so idle ones are found without a full scan
+        while self.sessions:
+            session_id, item = next(iter(self.sessions.items()))
+            if now - item[2] > self.idle_ttl:
+                self._drop(session_id, "expired")
+            elif len(self.sessions) > self.max_sessions or self.bytes > self.max_bytes:
+                self._drop(session_id, "evictions")
+            else:
+                break
+
+    def get(self, session_id):
+        now = time.time()
+        with self.lock:
+            item = self.sessions.get(session_id)
+            if item is not None and now - item[2] > self.idle_ttl:
+                self._drop(session_id, "expired")
+                item = None
+            if item is None or item[0] is None:
+                self.counters["misses"] += 1
+                return None
+            item[2] = now
+            self.sessions.move_to_end(session_id)
+            self.counters["hits"] += 1
+            return list(item[0])
+
+    def fill(self, session_id, entries, since=None):
+        now = time.time()
+        buffer = deque(entries[-self.turns:], maxlen=self.turns)
+        size = sum(entry_size(entry) for entry in buffer)
+        with self.lock:
+            item = self.sessions.get(session_id)
+            if item is not None and item[0] is None and since is not None and item[2] >= since:
+                # A turn was appended after the caller's read began: its
+                # snapshot may lack it, so leave the next read to re-load
+                self.counters["stale_fills"] += 1
+                return
+            if item is not None:
+                self.bytes -= item[1]
+            self.sessions[session_id] = [buffer, size, now]
+            self.sessions.move_to_end(session_id)
+            self.bytes += size
+            self._enforce_limits(now)
+
+    def append(self, session_id, entry):
+        now = time.time()
+        with self.lock:
+            item = self.sessions.get(session_id)
+            if item is None or item[0] is None:
+                self.sessions[session_id] = [None, 0, now]
+                self.sessions.move_to_end(session_id)
+                self._enforce_limits(now)
+                return
+            buffer = item[0]
+            if len(buffer) == buffer.maxlen:
+                item[1] -= entry_size(buffer[0])
+                self.bytes -= entry_size(buffer[0])
+            buffer.append(entry)
+            item[1] += entry_size(entry)
+            self.bytes += entry_size(entry)
+            item[2] = now
+            self.sessions.move_to_end(session_id)
+            self.counters["appends"] += 1
+            self._enforce_limits(now)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, sessions=len(self.sessions), bytes=self.bytes)
+
+
+class SharedBackend:
+    """One row per session in the local_store SQLite file, shared by every worker on the host"""
+
+    name = "shared"
+
+    def __init__(self, turns, max_sessions, max_bytes, idle_ttl):
+        from local_store import get_store
+
+        self.turns = turns
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.store = get_store()
+        # Counters are per worker; they are only reported, never shared
+        self.counters = {"hits": 0, "misses": 0, "appends": 0, "evictions": 0, "expired": 0, "stale_fills": 0}
+        self.lock = threading.Lock()
+        with self.store.transaction() as conn:
+            # partial = 1: a turn was appended while the session was not
+            # buffered; the row holds no entries and reads treat it as a miss
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_context ("
+                " session_id TEXT PRIMARY KEY,"
+                " entries TEXT NOT NULL,"
+                " bytes INTEGER NOT NULL,"
+                " last_access REAL NOT NULL,"
+                " partial INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(session_context)")]
+            if "partial" not in columns:
+                conn.execute("ALTER TABLE session_context ADD COLUMN partial INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_session_context_lru ON session_context (last_access)")
+
+    def incr(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] += amount
+
+    def get(self, session_id):
+        # Read-only: append() refreshes last_access on every turn, and expired
+        # rows are overwritten by the fill that follows the miss or swept by
+        # the next fill, so a read never takes the write lock
+        row = self.store.connection().execute(
+            "SELECT entries, last_access, partial FROM session_context WHERE session_id = ?",
+            (session_id,)).fetchone()
+        if row is not None and time.time() - row[1] > self.idle_ttl:
+            self.incr("expired")
+            row = None
+        if row is not None and row[2]:
+            row = None
+        if row is None:
+            self.incr("misses")
+            return None
+        self.incr("hits")
+        return json.loads(row[0])
+
+    def _write(self, conn, session_id, entries, now, partial=0):
+        entries = entries[-self.turns:]
+        conn.execute(
+            "INSERT OR REPLACE INTO session_context (session_id, entries, bytes, last_access, partial)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (session_id, json.dumps(entries, ensure_ascii=False), sum(entry_size(e) for e in entries), now, partial)
+        )
+
+    def fill(self, session_id, entries, since=None):
+        now = time.time()
+        with self.store.transaction() as conn:
+            marker = conn.execute("SELECT last_access FROM session_context WHERE session_id = ? AND partial = 1",
+                                  (session_id,)).fetchone()
+            if marker is not None and since is not None and marker[0] >= since:
+                # Another worker appended a turn after this snapshot was read
+                # from the database; storing it could lose that turn for good
+                self.incr("stale_fills")
+                return
+            self._write(conn, session_id, entries, now)
+            # Fills only happen on a miss, so the limits are enforced here
+            # rather than on every append
+            expired = conn.execute("DELETE FROM session_context WHERE last_access < ?",
+                                   (now - self.idle_ttl,)).rowcount
+            count, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM session_context").fetchone()
+            evicted = 0
+            for victim, victim_bytes in conn.execute(
+                    "SELECT session_id, bytes FROM session_context ORDER BY last_access").fetchall():
+                if count <= self.max_sessions and size <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM session_context WHERE session_id = ?", (victim,))
+                count, size, evicted = count - 1, size - victim_bytes, evicted + 1
+        if expired:
+            self.incr("expired", expired)
+        if evicted:
+            self.incr("evictions", evicted)
+
+    def append(self, session_id, entry):
+        now = time.time()
+        with self.store.transaction() as conn:
+            row = conn.execute("SELECT entries, partial FROM session_context WHERE session_id = ?",
+                               (session_id,)).fetchone()
+            if row is None or row[1]:
+                # Unbuffered: record only that the session changed, so a fill
+                # racing with this turn is not stored (see fill)
+                self._write(conn, session_id, [], now, partial=1)
+                return
+            self._write(conn, session_id, json.loads(row[0]) + [entry], now)
+        self.incr("appends")
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+        counters["sessions"], counters["bytes"] = self.store.connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM session_context").fetchone()
+        return counters
+
+
+def get_backend():
+    """Return the configured backend, or None when the buffer is off"""
+    global _backend
+    if CONTEXT_BACKEND == "off":
+        return None
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend_class = SharedBackend if CONTEXT_BACKEND == "shared" else MemoryBackend
+                _backend = backend_class(CONTEXT_TURNS, CONTEXT_MAX_SESSIONS, CONTEXT_MAX_BYTES, CONTEXT_IDLE_TTL)
+    return _backend
+
+
+def get(session_id):
+    """Buffered Cohere chat_history entries for ``session_id``, or None on a miss"""
+    backend = get_backend()
+    return backend.get(session_id) if backend is not None else None
+
+
+def fill(session_id, entries, since=None):
+    """
+    Seed the buffer from the database after a miss. ``since`` is the
+    time.time() taken before the database read: if a turn for the session
+    was appended after it, the snapshot may lack that turn and is dropped.
+    """
+    backend = get_backend()
+    if backend is not None:
+        backend.fill(session_id, list(entries), since)
+
+
+def append(session_id, role, content):
+    """
+    Record a new turn for a buffered session; call it after the turn is
+    persisted, so a read that starts later finds it in the database.
+
+    Unbuffered sessions only get a marker: their older turns are unknown
+    here, so the next read misses and loads the full window from the database.
+    """
+    backend = get_backend()
+    if backend is None:
+        return
+    if role == 'user':
+        backend.append(session_id, {"role": "USER", "message": content})
+    elif role == 'assistant':
+        backend.append(session_id, {"role": "CHATBOT", "message": content})
+
+
+def stats():
+    backend = get_backend()
+    if backend is None:
+        return {"backend": "off"}
+    counters = backend.stats()
+    lookups = counters["hits"] + counters["misses"]
+    counters.update({
+        "backend": backend.name,
+        "hit_ratio": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+        # Every hit is one history query that did not reach the database
+        "db_queries_saved": counters["hits"],
+    })
+    return counters
@@ -0,0 +1,234 @@
+# write_behind.py - batched, write-behind persistence for ChatMessage rows
+"""
+Durability trade-off: a chat turn is acknowledged once its rows are queued
+in this process, not once they are committed. A crash or hard kill loses
+whatever is queued (at most MAX_DELAY or MAX_BATCH worth of rows, more
+while the database is failing), and rows queued in one worker are invisible
+to every other worker until they commit, so a session's next turn or
+history read served by another worker can miss them. That is why it is on
+by default only for a single worker process (WEB_CONCURRENCY unset or 1);
+set CHAT_WRITE_BEHIND=1 to accept both trade-offs with more workers.
+"""
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------
+# Configuration
+# --------------------------------------------------
+
+_WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+ENABLED = os.getenv("CHAT_WRITE_BEHIND", "1" if _WORKERS <= 1 else "0") not in ("0", "false", "False")
+MAX_BATCH = int(os.getenv("CHAT_WRITE_BEHIND_BATCH", "64"))          # flush as soon as this many are queued
+MAX_DELAY = float(os.getenv("CHAT_WRITE_BEHIND_DELAY_MS", "50")) / 1000.0  # ...or after this long
+MAX_PENDING = int(os.getenv("CHAT_WRITE_BEHIND_MAX_PENDING", "10000"))   # rows past this go to the dead letter
+RETRIES = int(os.getenv("CHAT_WRITE_BEHIND_RETRIES", "3"))           # failed batch commits before row-by-row
+RETRY_BACKOFF = float(os.getenv("CHAT_WRITE_BEHIND_BACKOFF_MS", "500")) / 1000.0  # doubled per retry
+# Rows that cannot be inserted even one at a time, one JSON object per line
+DEAD_LETTER_PATH = os.getenv("CHAT_DEAD_LETTER_PATH", os.path.join("instance", "chat_dead_letter.jsonl"))
+
+
+def describe(error):
+    """The driver's message without SQLAlchemy's statement and parameters, which carry chat text"""
+    return str(getattr(error, "orig", None) or error)
+
+
+class WriteBehindQueue:
+    """
+    Queue ChatMessage inserts and commit them in one transaction per batch.
+
+    Rows stay visible through ``pending_for_session`` from the moment they are
+    queued until their batch has committed, so the next history read for the
+    same session in this process sees them (read-your-writes). The queue is
+    flushed on interpreter exit; a hard kill loses what is still queued.
+
+    A failed batch is retried RETRIES times with backoff, then inserted row
+    by row so one bad row (an over-long session_id, say) cannot hold up the
+    rest; rows that still fail are logged and written to DEAD_LETTER_PATH.
+    """
+
+    def __init__(self, max_batch=MAX_BATCH, max_delay=MAX_DELAY, max_pending=MAX_PENDING,
+                 retries=RETRIES, retry_backoff=RETRY_BACKOFF):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self._reset()
+        atexit.register(self.flush, wait_for_backoff=False)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._app = None
+        self._pending = []
+        self._in_flight = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._attempts = 0          # consecutive failed commits of the batch at the front
+        self._retry_at = 0.0
+        self._stats = {
+            "flushes": 0, "rows_flushed": 0, "failures": 0, "salvaged": 0, "dead_lettered": 0, "overflowed": 0,
+            "last_batch_size": 0, "max_batch_size": 0,
+            "last_flush_ms": 0.0, "max_flush_ms": 0.0, "total_flush_ms": 0.0,
+        }
+
+    def _ensure_started(self, app):
+        if self._pid != os.getpid():
+            # Forked after rows were queued in the parent: start clean in the child
+            self._reset()
+        if self._app is None:
+            self._app = app
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="chat-write-behind", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, app, row):
+        """Queue one ``chat_messages`` row dict for a batched insert"""
+        with self._cond:
+            self._ensure_started(app)
+            overflow = len(self._pending) >= self.max_pending
+            if overflow:
+                self._stats["overflowed"] += 1
+            else:
+                self._pending.append(row)
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify()
+        if overflow:
+            # The database has been failing for a while; keep memory bounded
+            self._dead_letter([row], f"queue full ({self.max_pending} rows pending)")
+
+    def pending_for_session(self, session_id):
+        """Rows for ``session_id`` that are queued or mid-commit"""
+        with self._cond:
+            return [row for row in self._in_flight + self._pending if row["session_id"] == session_id]
+
+    def has_pending(self, session_id=None):
+        with self._cond:
+            if session_id is None:
+                return bool(self._pending or self._in_flight)
+            return any(row["session_id"] == session_id for row in self._in_flight + self._pending)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                backoff = self._retry_at - time.monotonic()
+                if backoff > 0:
+                    self._cond.wait(backoff)
+                elif len(self._pending) < self.max_batch:
+                    self._cond.wait(self.max_delay)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Chat write-behind flush failed: {describe(e)}")
+
+    def _insert(self, rows):
+        from models import ChatMessage, db
+
+        with self._app.app_context():
+            with db.engine.begin() as conn:
+                conn.execute(ChatMessage.__table__.insert(), rows)
+
+    def _salvage(self, batch):
+        """Insert rows one per transaction; the ones that still fail go to the dead letter"""
+        written = 0
+        for row in batch:
+            try:
+                self._insert([row])
+                written += 1
+            except Exception as e:
+                self._dead_letter([row], describe(e))
+        with self._cond:
+            self._stats["salvaged"] += written
+        return written
+
+    def _dead_letter(self, rows, error):
+        with self._cond:
+            self._stats["dead_lettered"] += len(rows)
+        for row in rows:
+            # Metadata only: message text stays out of the logs
+            logger.error(f"❌ Chat row not persisted (session {str(row.get('session_id'))[:100]!r}, "
+                         f"role {row.get('role')}): {error}")
+        try:
+            os.makedirs(os.path.dirname(DEAD_LETTER_PATH) or ".", exist_ok=True)
+            with open(DEAD_LETTER_PATH, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(dict(row, error=error), default=str) + "\n")
+        except OSError as e:
+            logger.error(f"❌ Could not write the chat dead letter file {DEAD_LETTER_PATH}: {e}")
+
+    def flush(self, wait_for_backoff=True):
+        """
+        Commit everything queued so far; returns the number of rows written.
+        While a failed batch is backing off this returns 0 unless
+        ``wait_for_backoff`` is False (the exit flush goes straight to the
+        row-by-row fallback).
+        """
+        with self._flush_lock:
+            with self._cond:
+                if not self._pending or self._app is None:
+                    return 0
+                if wait_for_backoff and time.monotonic() < self._retry_at:
+                    return 0
+                batch, self._pending = self._pending, []
+                self._in_flight = batch
+
+            started = time.perf_counter()
+            try:
+                self._insert(batch)
+            except Exception as e:
+                with self._cond:
+                    self._stats["failures"] += 1
+                    self._attempts += 1
+                    give_up = self._attempts > self.retries or not wait_for_backoff
+                    if not give_up:
+                        # Put the batch back in front so ordering is preserved for the retry
+                        self._pending = batch + self._pending
+                        self._in_flight = []
+                        self._retry_at = time.monotonic() + self.retry_backoff * 2 ** (self._attempts - 1)
+                if not give_up:
+                    raise
+                logger.warning(f"⚠️ Chat batch of {len(batch)} failed {self._attempts} times ({describe(e)}); "
+                               f"inserting row by row")
+                written = self._salvage(batch)
+                with self._cond:
+                    self._in_flight = []
+                    self._attempts = 0
+                    self._retry_at = 0.0
+                return written
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._cond:
+                self._in_flight = []
+                self._attempts = 0
+                self._retry_at = 0.0
+                stats = self._stats
+                stats["flushes"] += 1
+                stats["rows_flushed"] += len(batch)
+                stats["last_batch_size"] = len(batch)
+                stats["max_batch_size"] = max(stats["max_batch_size"], len(batch))
+                stats["last_flush_ms"] = round(elapsed_ms, 3)
+                stats["max_flush_ms"] = round(max(stats["max_flush_ms"], elapsed_ms), 3)
+                stats["total_flush_ms"] += elapsed_ms
+            return len(batch)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            flushes = stats["flushes"]
+            total_flush_ms = stats.pop("total_flush_ms")
+            stats.update({
+                "enabled": ENABLED,
+                "pending": len(self._pending) + len(self._in_flight),
+                "avg_batch_size": round(stats["rows_flushed"] / flushes, 2) if flushes else 0.0,
+                "avg_flush_ms": round(total_flush_ms / flushes, 3) if flushes else 0.0,
+            })
+            return stats
+
+
+chat_queue = WriteBehindQueue()